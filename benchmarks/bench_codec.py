@@ -0,0 +1,45 @@
+"""
+Compare the orjson and stdlib backends of monitor.codec on Step Functions failure events.
+
+    python benchmarks/bench_codec.py
+"""
+import timeit
+
+from events import step_function_failure_event
+
+from monitor import codec
+from monitor.messages import from_event
+
+
+def run(number: int = 20) -> dict[str, dict[str, float]]:
+    event = step_function_failure_event()
+    cases = {
+        'from_event': lambda: from_event(event),
+        'as_str': lambda: from_event(event).as_str,
+        'dumps_indent': lambda: codec.dumps(event, indent=True),
+        'dumps_compact': lambda: codec.dumps(event),
+    }
+    orjson = codec.orjson
+    results: dict[str, dict[str, float]] = {}
+    for backend in ('json', 'orjson'):
+        if backend == 'orjson' and orjson is None:
+            continue
+        codec.orjson = orjson if backend == 'orjson' else None  # type: ignore
+        try:
+            results[backend] = {
+                name: min(timeit.repeat(case, number=number, repeat=3)) / number
+                for name, case in cases.items()
+            }
+        finally:
+            codec.orjson = orjson
+    return results
+
+
+if __name__ == '__main__':
+    results = run()
+    for name in results['json']:
+        line = f'{name:<16} json {results["json"][name] * 1000:8.3f} ms'
+        if 'orjson' in results:
+            line += f'   orjson {results["orjson"][name] * 1000:8.3f} ms'
+            line += f'   x{results["json"][name] / results["orjson"][name]:.1f}'
+        print(line)
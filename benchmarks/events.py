@@ -0,0 +1,52 @@
+"""
+Realistic Step Functions failure events for benchmarks.
+"""
+import json
+
+
+def lambda_exception_event(rows: int = 500) -> dict:
+    error_message = {
+        'name': 'DbtTestError',
+        'text': 'Event:\n' + json.dumps({'args': ['x-test'], 'rows': [{'id': i, 'name': f'tätigkeit {i}'} for i in range(rows)]}, indent=2),
+        'traceback': (
+            'Traceback (most recent call last):\n'
+            '  File "/var/task/monitor/wrapper.py", line 27, in wrapper\n'
+            '    return func(event, context)\n'
+            '  File "/var/task/dbt_lambda/app.py", line 33, in lambda_handler\n'
+            '    raise DbtTestError(\'Fail\')\n'
+            'dbt_lambda.app.DbtTestError: Fail\n'
+        ),
+        'request_id': 'dadaf7fd-c55a-441a-9345-e8b0945a1c32',
+        'cloudwatch': 'https://eu-central-1.console.aws.amazon.com/cloudwatch/home?region=eu-central-1',
+        'envs': {
+            'execution_env': 'AWS_Lambda_python3.12',
+            'default_region': 'eu-central-1',
+            'lambda_function_name': 'TransformFunction-dev',
+            'lambda_function_memory_size': '384',
+            'lambda_log_group_name': '/aws/lambda/TransformFunction-dev',
+            'lambda_log_stream_name': '2024/12/11/[$LATEST]07ff23830fd346cbb8a95ecac68cca1b',
+        },
+    }
+    return {
+        'errorMessage': json.dumps(error_message),
+        'errorType': 'LambdaException',
+        'requestId': 'dadaf7fd-c55a-441a-9345-e8b0945a1c32',
+    }
+
+
+def step_function_failure_event(levels: int = 3, rows: int = 500) -> dict:
+    """
+    A LambdaException wrapped in the causes of levels nested state machine executions.
+    """
+    event = lambda_exception_event(rows)
+    for level in range(levels):
+        event = {
+            'Error': 'States.TaskFailed',
+            'Cause': json.dumps(event),
+            'ExecutionArn': f'arn:aws:states:eu-central-1:123456789:execution:ExtractLoad-prod:{level}',
+            'Input': json.dumps({'job_id': '122afa1e5f2d414ba3df3f697fbb541a', 'tables': [f'table_{i}' for i in range(rows)]}),
+            'StateMachineArn': 'arn:aws:states:eu-central-1:123456789:stateMachine:ExtractLoad-prod',
+            'StartDate': 1733089875458,
+            'StopDate': 1733092939260,
+        }
+    return event
@@ -0,0 +1,217 @@
+"""
+Benchmark suite for the wrapper, the event parser, message rendering and the monitors.
+
+    python benchmarks/run.py                 # run and compare against benchmarks/baseline.json
+    python benchmarks/run.py --save          # run and store the results as the new baseline
+    python benchmarks/run.py --only parse    # run the cases whose name contains 'parse'
+
+Results are written as JSON (seconds per call). A case counts as a regression when it is
+slower than the baseline by more than the tolerance factor. The baseline is machine specific, so
+each checkout creates its own with --save (make bench-baseline); without one, the comparison fails.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable
+
+from events import lambda_exception_event
+from events import step_function_failure_event
+from stubs import ses_stub
+from stubs import webhook_stub
+
+from monitor import codec
+from monitor.messages import ErrorMessage
+from monitor.messages import from_event
+from monitor.monitors import BaseMonitor
+from monitor.monitors import EmailMonitor
+from monitor.monitors import SlackChannel
+from monitor.monitors import SlackChannelSet
+from monitor.monitors import SlackMonitor
+from monitor.resilience import get_resilience
+from monitor.resilience import Resilience
+from monitor.wrapper import lambda_monitor
+
+baseline_path = Path(__file__).parent / 'baseline.json'
+lambda_envs = {
+    'AWS_EXECUTION_ENV': 'AWS_Lambda_python3.12',
+    'AWS_DEFAULT_REGION': 'eu-central-1',
+    'AWS_LAMBDA_FUNCTION_NAME': 'BenchmarkFunction-dev',
+    'AWS_LAMBDA_FUNCTION_MEMORY_SIZE': '128',
+    'AWS_LAMBDA_LOG_GROUP_NAME': '/aws/lambda/BenchmarkFunction-dev',
+    'AWS_LAMBDA_LOG_STREAM_NAME': '2024/10/31/[$LATEST]1ef30f6c48d24e3287ee2b41908216b2',
+    'FAIL_ON_ERROR': 'false',
+}
+
+
+class Context:
+    aws_request_id = '24dfa092-ca3b-400c-954d-7ce9cfbf4bc3'
+
+
+class NullMonitor(BaseMonitor):
+
+    def notify(self, message):
+        pass
+
+
+def measure(func: Callable[[], object], min_time: float = 0.2, min_rounds: int = 5) -> float:
+    """
+    Return the best average seconds per call over several rounds.
+    """
+    func()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= min_time / min_rounds:
+            break
+        number *= 2
+    rounds = []
+    for _ in range(min_rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - start) / number)
+    return min(rounds)
+
+
+def bench_wrapper() -> dict[str, float]:
+    def handler(event, context):
+        return {'counter': 1}
+
+    def failing_handler(event, context):
+        raise RuntimeError('Benchmark Error')
+
+    monitored = lambda_monitor(NullMonitor())(handler)
+    monitored_failing = lambda_monitor(NullMonitor())(failing_handler)
+    event, context = {'args': ['x-test']}, Context()
+    bare = measure(lambda: handler(event, context))
+    return {
+        'wrapper.success_overhead': measure(lambda: monitored(event, context)) - bare,
+        'wrapper.failure': measure(lambda: monitored_failing(event, context)),
+    }
+
+
+def bench_parse() -> dict[str, float]:
+    nested = step_function_failure_event(levels=3)
+    lambda_exception = lambda_exception_event()
+    return {
+        'parse.from_event_nested': measure(lambda: from_event(nested)),
+        'parse.from_event_lambda_exception': measure(lambda: from_event(lambda_exception)),
+    }
+
+
+def bench_render() -> dict[str, float]:
+    step_function_failure = from_event(step_function_failure_event(levels=3), max_depth=1)
+    lambda_error = from_event(lambda_exception_event())
+    # replace() creates uncached copies, so each call pays the full rendering cost
+    return {
+        'render.as_str_step_function': measure(lambda: replace(step_function_failure).as_str),
+        'render.as_str_lambda_error': measure(lambda: replace(lambda_error).as_str),
+        'render.as_json_lambda_error': measure(lambda: replace(lambda_error).as_json),
+    }
+
+
+def bench_slack() -> dict[str, float]:
+    message = ErrorMessage('BenchmarkError', 'Benchmark Message')
+    with webhook_stub() as base_url:
+        channels = SlackChannelSet(
+            info=SlackChannel('bench-info', 'T000/B000/XXXX', base_url=base_url),
+            alert=SlackChannel('bench-alert', 'T000/B000/XXXX', base_url=base_url),
+        )
+        # no rate limit against the stub
+        for channel in (channels.info, channels.alert):
+            get_resilience(f'slack:{channel.name}', Resilience)
+        monitor = SlackMonitor(None, channels)
+        return {'monitor.slack_notify': measure(lambda: monitor.notify(message))}
+
+
+def bench_email() -> dict[str, float]:
+    try:
+        import moto  # noqa: F401
+    except ImportError:
+        print('moto is not installed, skipping monitor.email_notify', file=sys.stderr)
+        return {}
+    message = ErrorMessage('BenchmarkError', 'Benchmark Message')
+    sender = 'monitor@example.com'
+    with ses_stub(sender):
+        get_resilience('ses', Resilience)
+        monitor = EmailMonitor(sender, [], dev_addresses=(sender,))
+        return {'monitor.email_notify': measure(lambda: monitor.notify(message))}
+
+
+# the cases each suite measures, so that --only can skip suites without running them
+suites: dict[Callable[[], dict[str, float]], tuple[str, ...]] = {
+    bench_wrapper: ('wrapper.success_overhead', 'wrapper.failure'),
+    bench_parse: ('parse.from_event_nested', 'parse.from_event_lambda_exception'),
+    bench_render: ('render.as_str_step_function', 'render.as_str_lambda_error', 'render.as_json_lambda_error'),
+    bench_slack: ('monitor.slack_notify',),
+    bench_email: ('monitor.email_notify',),
+}
+
+
+def selected(only: str | None) -> list[Callable[[], dict[str, float]]]:
+    return [suite for suite, names in suites.items() if only is None or any(only in name for name in names)]
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        line = f'{name:<36} {seconds * 1e6:12.1f} us'
+        if name in baseline and baseline[name] > 0:
+            ratio = seconds / baseline[name]
+            line += f'   baseline {baseline[name] * 1e6:12.1f} us   x{ratio:.2f}'
+            if ratio > tolerance:
+                line += '   REGRESSION'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--save', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--only', help='run only cases whose name contains this string')
+    parser.add_argument('--output', type=Path, help='also write results to this file')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed slowdown factor')
+    args = parser.parse_args()
+
+    os.environ.update(lambda_envs)
+    # format log records like the Lambda runtime would, but discard them
+    logging.basicConfig(stream=open(os.devnull, 'w'), level=logging.INFO, force=True)
+    results: dict[str, float] = {}
+    for suite in selected(args.only):
+        results.update(suite())
+    if args.only:
+        results = {name: seconds for name, seconds in results.items() if args.only in name}
+    report = {
+        'python': platform.python_version(),
+        'codec': codec.backend(),
+        'results': results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + '\n')
+    if args.save:
+        compare(results, {}, args.tolerance)
+        baseline_path.write_text(json.dumps(report, indent=2) + '\n')
+        print(f'Baseline written to {baseline_path}')
+        return 0
+    if not baseline_path.exists():
+        compare(results, {}, args.tolerance)
+        print(f'No baseline at {baseline_path}, create one with --save (make bench-baseline)', file=sys.stderr)
+        return 2
+    baseline = json.loads(baseline_path.read_text())
+    for key in ('python', 'codec'):
+        if baseline.get(key) != report[key]:
+            print(f'Baseline was measured with {key} {baseline.get(key)}, not {report[key]}', file=sys.stderr)
+    return 1 if compare(results, baseline['results'], args.tolerance) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Local stand-ins for the transports, so benchmarks never leave the machine.
+"""
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Iterator
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def webhook_stub() -> Iterator[str]:
+    """
+    Serve a Slack-like webhook on localhost and yield its base url.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address[:2]
+        yield f'http://{host}:{port}/services'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def ses_stub(sender: str) -> Iterator[None]:
+    """
+    Mock SES with moto and verify the sender address.
+    """
+    from moto import mock_aws
+    from monitor.aws import clear_clients
+    from monitor.aws import get_client
+    with mock_aws():
+        clear_clients()
+        get_client('ses', region_name='eu-central-1').verify_email_identity(EmailAddress=sender)
+        try:
+            yield
+        finally:
+            clear_clients()
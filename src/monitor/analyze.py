@@ -0,0 +1,177 @@
+import datetime
+import gzip
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import BinaryIO
+from typing import Iterable
+from typing import Iterator
+
+from monitor import codec
+from monitor.dedup import normalize
+from monitor.messages import BaseMessage
+from monitor.messages import ErrorMessage
+from monitor.messages import from_event
+from monitor.messages import LambdaErrorMessage
+from monitor.messages import StepFunctionFailureMessage
+from monitor.watch import bounded_map
+
+
+@dataclass
+class Report:
+    """
+    Failure counts aggregated over a stream of events; reports of batches are merged with update.
+    """
+    records: int = 0
+    unreadable: int = 0
+    signatures: Counter[str] = field(default_factory=Counter)
+    functions: Counter[str] = field(default_factory=Counter)
+    state_machines: Counter[str] = field(default_factory=Counter)
+    days: Counter[str] = field(default_factory=Counter)
+    hours: Counter[int] = field(default_factory=Counter)
+
+    def add(self, message: BaseMessage, timestamp: datetime.datetime | None) -> None:
+        self.records += 1
+        self.signatures[signature(message)] += 1
+        if isinstance(message, LambdaErrorMessage):
+            self.functions[message.envs.get('lambda_function_name') or 'unknown'] += 1
+        if isinstance(message, StepFunctionFailureMessage) and message.state_machine_arn:
+            self.state_machines[message.state_machine_arn.rsplit(':', 1)[-1]] += 1
+        if timestamp is not None:
+            self.days[timestamp.date().isoformat()] += 1
+            self.hours[timestamp.hour] += 1
+
+    def update(self, other: 'Report') -> None:
+        self.records += other.records
+        self.unreadable += other.unreadable
+        self.signatures.update(other.signatures)
+        self.functions.update(other.functions)
+        self.state_machines.update(other.state_machines)
+        self.days.update(other.days)
+        self.hours.update(other.hours)
+
+    def as_dict(self, top: int = 20) -> dict[str, Any]:
+        return {
+            'records': self.records,
+            'unreadable': self.unreadable,
+            'signatures': dict(self.signatures.most_common(top)),
+            'functions': dict(self.functions.most_common(top)),
+            'state_machines': dict(self.state_machines.most_common(top)),
+            'days': dict(sorted(self.days.items())),
+            'hours': {hour: self.hours[hour] for hour in range(24)},
+        }
+
+    def render(self, top: int = 20) -> str:
+        sections = [f'{self.records} failures, {self.unreadable} unreadable records']
+        for title, counter in (
+                ('Signatures', self.signatures),
+                ('Functions', self.functions),
+                ('State machines', self.state_machines)
+        ):
+            if counter:
+                lines = [f'{count:>8}  {key}' for key, count in counter.most_common(top)]
+                sections.append('\n'.join([f'== {title} =='] + lines))
+        for title, histogram in (('Days', sorted(self.days.items())), ('Hours (UTC)', sorted(self.hours.items()))):
+            if histogram:
+                peak = max(count for _, count in histogram)
+                lines = [f'{key!s:>10}  {count:>8}  {bar(count, peak)}' for key, count in histogram]
+                sections.append('\n'.join([f'== {title} =='] + lines))
+        return '\n\n'.join(sections)
+
+
+def bar(count: int, peak: int, width: int = 40) -> str:
+    return '#' * max(1, round(count / peak * width))
+
+
+def signature(message: BaseMessage) -> str:
+    """
+    Error name and normalized exception line; failures that differ only in ids and timestamps share a signature.
+    """
+    match message:
+        case LambdaErrorMessage():
+            lines = [line for line in message.traceback.splitlines() if line.strip()]
+            detail = lines[-1] if lines else message.text
+        case ErrorMessage():
+            detail = message.text.strip().split('\n', 1)[0]
+        case _:
+            return 'Info'
+    return f'{message.name}: {normalize(detail)[:200]}'
+
+
+def event_time(record: dict, message: BaseMessage) -> datetime.datetime | None:
+    """
+    Stop date of Step Functions failures, else the time field of the exported record if there is one.
+    """
+    if isinstance(message, StepFunctionFailureMessage) and isinstance(message.stop_date, int):
+        return datetime.datetime.fromtimestamp(message.stop_date / 1000, datetime.UTC)
+    value = record.get('time') or record.get('timestamp')
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value / 1000 if value > 1e11 else value, datetime.UTC)
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.fromisoformat(value).astimezone(datetime.UTC)
+        except ValueError:
+            return None
+    return None
+
+
+def analyze_batch(lines: list[bytes]) -> Report:
+    """
+    Parse one batch of JSONL records; runs in a worker process.
+    """
+    report = Report()
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = codec.loads(line)
+            # exports wrap the failure event in 'detail', e.g. EventBridge events
+            event = record.get('detail', record)
+            message: BaseMessage = from_event(event)
+        except Exception:
+            report.unreadable += 1
+            continue
+        report.add(message, event_time(record, message))
+    return report
+
+
+def read_batches(file: BinaryIO, batch_size: int) -> Iterator[list[bytes]]:
+    batch = []
+    for line in file:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def open_input(path: str) -> BinaryIO:
+    if path == '-':
+        return sys.stdin.buffer
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')  # type: ignore
+    return open(path, 'rb')
+
+
+def analyze(
+        batches: Iterable[list[bytes]],
+        max_workers: int | None = None,
+        max_in_flight: int | None = None
+) -> Report:
+    """
+    Aggregate batches in a process pool.
+
+    At most max_in_flight batches (default: twice the number of workers) are read ahead,
+    so memory use does not depend on the size of the input.
+    """
+    report = Report()
+    limit = max_in_flight or 2 * (max_workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for partial in bounded_map(executor, analyze_batch, batches, limit):
+            report.update(partial)
+    return report
@@ -0,0 +1,29 @@
+import threading
+from typing import Any
+
+_clients: dict[tuple[str, str | None], Any] = {}
+_lock = threading.Lock()
+
+
+def get_client(service_name: str, region_name: str | None = None) -> Any:
+    """
+    Return a boto3 client for service and region, cached for the process lifetime.
+
+    boto3 is imported on first use only, so it does not add to the cold start of
+    Lambda functions that never talk to AWS.
+    """
+    key = (service_name, region_name)
+    try:
+        return _clients[key]
+    except KeyError:
+        pass
+    with _lock:
+        if key not in _clients:
+            import boto3
+            _clients[key] = boto3.client(service_name, region_name=region_name)  # type: ignore
+        return _clients[key]
+
+
+def clear_clients() -> None:
+    with _lock:
+        _clients.clear()
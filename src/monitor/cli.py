@@ -1,14 +1,33 @@
 import json
 import os
+import sys
+import time
 import uuid
 from enum import Enum
 from typing import Annotated
 
-import boto3
 import typer
 from click import Choice
+from typer import Argument
 from typer import Option
 
+from monitor.analyze import analyze
+from monitor.analyze import open_input
+from monitor.analyze import read_batches
+from monitor.aws import get_client
+from monitor.runner import execution_link
+from monitor.runner import extractload_function_payload
+from monitor.runner import function_arn
+from monitor.runner import job_queue_payload
+from monitor.runner import matrix
+from monitor.runner import render_table
+from monitor.runner import run_matrix
+from monitor.runner import scenarios
+from monitor.runner import state_machine_arn
+from monitor.runner import transform_function_payload
+from monitor.watch import load_monitor
+from monitor.watch import watch
+
 cli = typer.Typer(
     add_completion=False,
     pretty_exceptions_enable=False
@@ -36,37 +55,24 @@ env_ann = Annotated[
 
 def start_statemachine(name: str, payload: str | dict[str, object] | list | None = None):
     env = os.environ.get('APP_ENV', 'dev')
-    aws_region = os.environ.get('AWS_REGION', 'eu-central-1')
-    try:
-        aws_account_id = os.environ['AWS_ACCOUNT_ID']
-    except KeyError:
-        raise KeyError('AWS_ACCOUNT_ID environment variable not set')
-    state_machine_arn = f'arn:aws:states:{aws_region}:{aws_account_id}:stateMachine:{name}-{env}'
     if isinstance(payload, (dict, list)):
         payload = json.dumps(payload)
-    response = boto3.client('stepfunctions').start_execution(
-        stateMachineArn=state_machine_arn,
+    response = get_client('stepfunctions').start_execution(
+        stateMachineArn=state_machine_arn(name, env),
         name=f'Test-Error-Handling-{uuid.uuid4()}',
         input=payload or '{}',
     )
-    execution_arn = response['executionArn']
-    execution_link = f'https://{aws_region}.console.aws.amazon.com/states/home?region={aws_region}#/v2/executions/details/{execution_arn}'
-    print(execution_link)
+    print(execution_link(response['executionArn']))
 
 
 def invoke_lambda_function(name: str, payload: dict | str):
     env = os.environ.get('APP_ENV', 'dev')
-    aws_region = os.environ.get('AWS_REGION', 'eu-central-1')
-    try:
-        aws_account_id = os.environ['AWS_ACCOUNT_ID']
-    except KeyError:
-        raise KeyError('AWS_ACCOUNT_ID environment variable not set')
-    function_arn = f'arn:aws:lambda:{aws_region}:{aws_account_id}:function:{name}-{env}'
+    arn = function_arn(name, env)
     if isinstance(payload, dict):
         payload = json.dumps(payload)
-    print(function_arn)
-    response = boto3.client('lambda').invoke(
-        FunctionName=function_arn,
+    print(arn)
+    response = get_client('lambda').invoke(
+        FunctionName=arn,
         Payload=payload or '{}'
     )
     payload = json.loads(response['Payload'].read())
@@ -84,16 +90,7 @@ def error_handling_schedule(
     Env.set(env)
     start_statemachine(
         'ExtractLoadJobQueue',
-        {
-            'task_type': 'ScheduleTask',
-            'job_id': 'test job id',
-            'task_id': 'test task id',
-            'table_names': [],  # will raise test error in ScheduleTask
-            'options': {
-                'test_error': True,
-                'fail_on_error': fail
-            }
-        }
+        job_queue_payload([], fail)  # will raise test error in ScheduleTask
     )
 
 
@@ -108,16 +105,7 @@ def error_handling_extractload(
     env.set()
     start_statemachine(
         name='ExtractLoadJobQueue',
-        payload={
-            'task_type': 'ScheduleTask',
-            'job_id': 'test job id',
-            'task_id': 'test task id',
-            'table_names': ['any'],  # will raise test error in ExtractLoadJob
-            'options': {
-                'test_error': True,
-                'fail_on_error': fail
-            }
-        }
+        payload=job_queue_payload(['any'], fail)  # will raise test error in ExtractLoadJob
     )
 
 
@@ -158,24 +146,100 @@ def error_handling_lambda(
     if function.lower() == 'transform':
         function = 'TransformFunction'
         if test:
-            arg = 'x-test'
+            mode = 'test'
         elif fail:
-            arg = 'x-fail'
+            mode = 'fail'
         else:
-            arg = 'x-error'
-        payload = {'args': [arg]}
+            mode = 'error'
+        payload = transform_function_payload(mode)
     else:
         function = 'ExtractLoadFunction'
-        payload = {
-            'task_type': 'ErrorTask',
-            'job_id': 'test job id',
-            'task_id': 'test task id',
-            'database_name': 'test database',
-            'schema_name': 'test schema',
-            'table_name': 'test table',
-            'envs': {'FAIL_ON_ERROR': str(fail)}
-        }
+        payload = extractload_function_payload(fail)
     invoke_lambda_function(
         name=function,
         payload=payload
     )
+
+
+@cli.command(name='run-matrix')
+def error_handling_matrix(
+        scenario: Annotated[list[str] | None, Option(
+            '-s', '--scenario',
+            help='Scenario to run, repeatable (default: all)',
+            click_type=Choice(choices=list(scenarios), case_sensitive=False)
+        )] = None,
+        env: Annotated[list[Env] | None, Option(
+            '--env', '-e',
+            help='target environment, repeatable (default: dev)'
+        )] = None,
+        mode: Annotated[list[str] | None, Option(
+            '-m', '--mode',
+            help='Fail mode, repeatable (default: all modes of each scenario)',
+            click_type=Choice(choices=['error', 'fail', 'test'], case_sensitive=False)
+        )] = None,
+        workers: Annotated[int, Option(help='Number of scenarios run concurrently')] = 8,
+        timeout: Annotated[float, Option(help='Seconds to wait for each execution')] = 900
+):
+    """
+    Run a matrix of error handling scenarios concurrently and wait for the results
+    """
+    cases = matrix(
+        scenario or list(scenarios),
+        [e.value for e in env or [Env.dev]],
+        mode
+    )
+    print(f'Running {len(cases)} scenario(s)')
+    results = run_matrix(cases, max_workers=workers, timeout=timeout)
+    print(render_table(results))
+    for result in results:
+        if result.arn.startswith('arn:aws:states:'):
+            print(execution_link(result.arn))
+
+
+@cli.command(name='watch')
+def watch_failures(
+        state_machine: Annotated[list[str], Option(
+            '-s', '--state-machine',
+            help='State machine name (without env suffix) or ARN, repeatable'
+        )],
+        monitor: Annotated[str, Option(
+            help='Monitor to notify, as module:attribute'
+        )] = 'monitor.monitors:BaseMonitor',
+        checkpoint: Annotated[str, Option(help='Checkpoint file')] = '.monitor-watch.json',
+        lookback: Annotated[float, Option(help='Hours to scan back on the first run')] = 24,
+        interval: Annotated[float, Option(help='Poll every interval seconds (default: poll once)')] = 0,
+        workers: Annotated[int, Option(help='Concurrent describe_execution calls')] = 8,
+        env: env_ann = Env.dev
+):
+    """
+    Notify a monitor of failed Step Functions executions since the last poll
+    """
+    state_machine_arns = [
+        name if name.startswith('arn:') else state_machine_arn(name, env.value) for name in state_machine
+    ]
+    target = load_monitor(monitor)
+    while True:
+        count = watch(state_machine_arns, target, checkpoint, lookback=lookback * 3600, max_workers=workers)
+        print(f'{count} new failed execution(s)')
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+@cli.command(name='analyze')
+def analyze_failures(
+        path: Annotated[str, Argument(help='JSONL file of exported failure events (.gz supported, - for stdin)')],
+        workers: Annotated[int | None, Option(help='Worker processes (default: CPU count)')] = None,
+        batch_size: Annotated[int, Option(help='Records per batch')] = 1000,
+        top: Annotated[int, Option(help='Number of signatures, functions and state machines listed')] = 20,
+        as_json: Annotated[bool, Option('--json', help='Print the report as JSON')] = False
+):
+    """
+    Aggregate exported failure events by error signature, function, state machine and time
+    """
+    with open_input(path) as file:
+        report = analyze(read_batches(file, batch_size), max_workers=workers)
+    if as_json:
+        sys.stdout.write(json.dumps(report.as_dict(top), indent=2) + '\n')
+    else:
+        print(report.render(top))
@@ -0,0 +1,56 @@
+import json
+import re
+from typing import Any
+from typing import Callable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+Default = Callable[[Any], Any] | None
+
+# orjson.loads turns integers beyond 64 bit into floats, so documents with numbers this long are
+# parsed by the json module; a match inside a string only costs the faster parser
+long_number = re.compile(r'\d{19,}')
+long_number_bytes = re.compile(rb'\d{19,}')
+
+
+def backend() -> str:
+    """
+    Library used by loads.
+    """
+    return 'orjson' if orjson is not None else 'json'
+
+
+def dumps_bytes(obj: Any, indent: bool = False, default: Default = None) -> bytes:
+    return dumps(obj, indent, default).encode()
+
+
+def dumps(obj: Any, indent: bool = False, default: Default = None) -> str:
+    """
+    Serialize obj to JSON without ASCII escaping; indented output has the layout of json.dumps(indent=2).
+
+    Always the json module: benchmarks/bench_codec.py shows orjson dumping the escape-heavy
+    failure events more slowly.
+    """
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False, default=default)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=default)
+
+
+def loads(data: str | bytes) -> Any:
+    """
+    Parse JSON, using orjson if it is installed. Raises json.JSONDecodeError on invalid input.
+
+    Input orjson would read differently (integers beyond 64 bit) or rejects while the json module
+    accepts it (NaN, Infinity) is parsed by the json module.
+    """
+    if orjson is not None:
+        pattern = long_number_bytes if isinstance(data, bytes) else long_number
+        if not pattern.search(data):  # type: ignore[arg-type]
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                pass
+    return json.loads(data)
@@ -0,0 +1,104 @@
+import contextvars
+import os
+import threading
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+# variables the Lambda runtime sets once per execution environment
+lambda_variables = (
+    'AWS_EXECUTION_ENV',
+    'AWS_DEFAULT_REGION',
+    'AWS_LAMBDA_FUNCTION_NAME',
+    'AWS_LAMBDA_FUNCTION_MEMORY_SIZE',
+    'AWS_LAMBDA_LOG_GROUP_NAME',
+    'AWS_LAMBDA_LOG_STREAM_NAME',
+)
+
+_environment: dict[str, str] | None = None
+_environment_lock = threading.Lock()
+
+
+def lambda_environment() -> dict[str, str]:
+    """
+    The Lambda variables that are set, read on first use and kept for the lifetime of the execution environment.
+    """
+    global _environment
+    if _environment is None:
+        with _environment_lock:
+            if _environment is None:
+                _environment = {key: os.environ[key] for key in lambda_variables if key in os.environ}
+    return _environment
+
+
+def clear_environment() -> None:
+    global _environment
+    with _environment_lock:
+        _environment = None
+
+
+def event_source(event: Any) -> str | None:
+    """
+    Service that sent event, e.g. 'aws:sqs' or 'aws.events'; None for direct invocations.
+    """
+    if not isinstance(event, dict):
+        return None
+    if isinstance(records := event.get('Records'), list) and records and isinstance(records[0], dict):
+        return records[0].get('eventSource') or records[0].get('EventSource')
+    if 'requestContext' in event:
+        return 'aws:apigateway'
+    source = event.get('source')
+    return source if isinstance(source, str) else None
+
+
+@dataclass
+class RequestCounters:
+    """
+    Notification counters of one request, incremented by all threads that run in its context.
+    """
+    suppressed: int = 0
+    retries: int = 0
+    rejected: int = 0
+
+
+# compared by identity, so that requests can key per-request state even if their ids repeat
+@dataclass(frozen=True, eq=False)
+class RequestContext:
+    """
+    The invocation a piece of code runs for. Each thread and asyncio task sees its own,
+    so concurrent invocations in one process are attributed correctly.
+    """
+    request_id: str
+    function_name: str | None = None
+    event_source: str | None = None
+    cold_start: bool = False
+    start: float = field(default_factory=time.perf_counter, repr=False)
+    counters: RequestCounters = field(default_factory=RequestCounters, repr=False)
+
+    @classmethod
+    def from_invocation(cls, event: Any, context: Any, cold_start: bool = False) -> 'RequestContext':
+        return cls(
+            request_id=context.aws_request_id,
+            function_name=lambda_environment().get('AWS_LAMBDA_FUNCTION_NAME'),
+            event_source=event_source(event),
+            cold_start=cold_start,
+        )
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+
+current_request: contextvars.ContextVar[RequestContext | None] = contextvars.ContextVar(
+    'current_request', default=None
+)
+
+
+def request_id() -> str | None:
+    request = current_request.get()
+    return request.request_id if request is not None else None
+
+
+def request_counters() -> RequestCounters | None:
+    request = current_request.get()
+    return request.counters if request is not None else None
@@ -0,0 +1,198 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC
+from abc import abstractmethod
+from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import replace
+from logging import getLogger
+
+from monitor.aws import get_client
+from monitor.context import request_counters
+from monitor.messages import BaseMessageType
+from monitor.messages import ErrorMessage
+from monitor.messages import LambdaErrorMessage
+from monitor.messages import StepFunctionFailureMessage
+from monitor.monitors import BaseMonitor
+
+logger = getLogger()
+
+
+@dataclass
+class DedupStats:
+    suppressed: int = 0
+
+
+stats = DedupStats()
+
+volatile_patterns = (
+    # timestamps, e.g. 2024-11-26T00:36:39.604Z or 2024-11-26 00:36:39
+    re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?'),
+    # request ids and other uuids
+    re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE),
+    # hex job/task ids and memory addresses
+    re.compile(r'\b(?:0x)?[0-9a-f]{12,}\b', re.IGNORECASE),
+    # durations, e.g. "timed out after 600.15 seconds"
+    re.compile(r'\d+\.\d+(?= seconds)'),
+)
+
+
+def normalize(text: str) -> str:
+    """
+    Strip request ids, uuids and timestamps that differ between otherwise identical errors.
+    """
+    for pattern in volatile_patterns:
+        text = pattern.sub('*', text)
+    return text
+
+
+def fingerprint(message: ErrorMessage) -> str:
+    """
+    Stable hash of error name, normalized traceback and function name.
+    """
+    match message:
+        case LambdaErrorMessage():
+            parts = [message.name, message.traceback, message.envs.get('lambda_function_name', '')]
+        case StepFunctionFailureMessage():
+            parts = [message.name, message.text, message.state_machine_arn or '']
+        case _:
+            parts = [message.name, message.text]
+    return hashlib.sha256(normalize('\n'.join(parts)).encode()).hexdigest()
+
+
+class DedupStore(ABC):
+
+    @abstractmethod
+    def hit(self, key: str, now: float, ttl: float) -> int | None:
+        """
+        Record an occurrence of key.
+
+        Returns None if the occurrence falls into an open suppression window. Otherwise, a new
+        window is opened and the number of duplicates suppressed in the previous one is returned.
+        """
+
+
+class MemoryStore(DedupStore):
+    """
+    Per-process store, shared by warm invocations of the same execution environment.
+    """
+
+    def __init__(self, max_keys: int = 1024):
+        self.max_keys = max_keys
+        self._windows: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, now: float, ttl: float) -> int | None:
+        with self._lock:
+            if len(self._windows) >= self.max_keys:
+                self._windows = {k: w for k, w in self._windows.items() if w[0] > now}
+            window = self._windows.get(key)
+            if window is not None and window[0] > now:
+                window[1] += 1
+                return None
+            self._windows[key] = [now + ttl, 0]
+            return int(window[1]) if window is not None else 0
+
+
+class SQLiteStore(DedupStore):
+    """
+    Local file store, shared by all processes on the same host.
+    """
+
+    def __init__(self, path: str = '/tmp/monitor-dedup.sqlite'):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS windows ('
+                'key TEXT PRIMARY KEY, expires_at REAL NOT NULL, suppressed INTEGER NOT NULL)'
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def hit(self, key: str, now: float, ttl: float) -> int | None:
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT expires_at, suppressed FROM windows WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and row[0] > now:
+                connection.execute('UPDATE windows SET suppressed = suppressed + 1 WHERE key = ?', (key,))
+                connection.execute('COMMIT')
+                return None
+            connection.execute(
+                'INSERT OR REPLACE INTO windows (key, expires_at, suppressed) VALUES (?, ?, 0)',
+                (key, now + ttl)
+            )
+            connection.execute('COMMIT')
+            return row[1] if row is not None else 0
+        finally:
+            connection.close()
+
+
+@dataclass
+class DynamoDBStore(DedupStore):
+    """
+    Store shared by all execution environments, backed by a DynamoDB table with
+    a string partition key named 'fingerprint'.
+    """
+    table_name: str
+    region_name: str | None = None
+
+    def hit(self, key: str, now: float, ttl: float) -> int | None:
+        client = get_client('dynamodb', region_name=self.region_name)
+        try:
+            response = client.update_item(
+                TableName=self.table_name,
+                Key={'fingerprint': {'S': key}},
+                UpdateExpression='SET expires_at = :expires_at, suppressed = :zero',
+                ConditionExpression='attribute_not_exists(fingerprint) OR expires_at <= :now',
+                ExpressionAttributeValues={
+                    ':expires_at': {'N': str(now + ttl)},
+                    ':zero': {'N': '0'},
+                    ':now': {'N': str(now)},
+                },
+                ReturnValues='ALL_OLD'
+            )
+        except client.exceptions.ConditionalCheckFailedException:
+            client.update_item(
+                TableName=self.table_name,
+                Key={'fingerprint': {'S': key}},
+                UpdateExpression='ADD suppressed :one',
+                ExpressionAttributeValues={':one': {'N': '1'}},
+            )
+            return None
+        previous = response.get('Attributes', {})
+        return int(previous['suppressed']['N']) if 'suppressed' in previous else 0
+
+
+@dataclass
+class DedupMonitor(BaseMonitor):
+    """
+    Suppress repeated error messages with the same fingerprint within ttl seconds.
+    """
+    monitor: BaseMonitor
+    store: DedupStore = field(default_factory=MemoryStore)
+    ttl: float = 300
+
+    def notify(self, message: BaseMessageType):
+        if not isinstance(message, ErrorMessage):
+            return self.monitor.notify(message)
+        key = fingerprint(message)
+        suppressed = self.store.hit(key, time.time(), self.ttl)
+        if suppressed is None:
+            stats.suppressed += 1
+            if (counters := request_counters()) is not None:
+                counters.suppressed += 1
+            logger.info(f'Suppressed duplicate {message.name} alert ({key[:12]})')
+            return None
+        if suppressed:
+            message = replace(
+                message,
+                text=f'{message.text}\n({suppressed} duplicate alerts suppressed in the last {self.ttl:g}s)'
+            )
+        return self.monitor.notify(message)
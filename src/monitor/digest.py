@@ -0,0 +1,125 @@
+import atexit
+import threading
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from dataclasses import field
+from logging import getLogger
+
+from monitor.messages import BaseMessage
+from monitor.messages import BaseMessageType
+from monitor.messages import ErrorMessage
+from monitor.messages import LambdaErrorMessage
+from monitor.messages import SimpleMessage
+from monitor.messages import StepFunctionFailureMessage
+from monitor.monitors import BaseMonitor
+from monitor.monitors import deliver
+from monitor.monitors import Outbox
+
+logger = getLogger()
+
+# digest monitors with a buffer to flush at process shutdown
+_monitors: weakref.WeakSet['DigestMonitor'] = weakref.WeakSet()
+
+
+def summary_line(message: BaseMessage) -> str:
+    match message:
+        case LambdaErrorMessage():
+            return f'AWS Request ID: {message.request_id}'
+        case StepFunctionFailureMessage():
+            return f'ExecutionArn: {message.execution_arn}'
+        case _:
+            return message.as_str.split('\n', 1)[0]
+
+
+def render_digest(messages: list[BaseMessage]) -> BaseMessage:
+    """
+    Combine messages into one, grouped by message type and error name.
+
+    Each error group shows its first message in full and one summary line per repetition.
+    """
+    if len(messages) == 1:
+        return messages[0]
+    groups: dict[tuple[str, str], list[BaseMessage]] = defaultdict(list)
+    for message in messages:
+        groups[(type(message).__name__, getattr(message, 'name', ''))].append(message)
+    sections = []
+    for (type_name, name), group in groups.items():
+        heading = f'{len(group)}x {type_name}' + (f' ({name})' if name else '')
+        if isinstance(group[0], ErrorMessage):
+            lines = [group[0].as_str] + [f'- {summary_line(message)}' for message in group[1:]]
+        else:
+            lines = [f'- {message.as_str}' for message in group]
+        sections.append('\n'.join([f'== {heading} =='] + lines))
+    text = '\n\n'.join(sections)
+    error_names = sorted({name for (_, name) in groups if name})
+    if error_names:
+        return ErrorMessage(name=', '.join(error_names), text=f'Digest of {len(messages)} messages\n{text}')
+    return SimpleMessage(text=text)
+
+
+@dataclass(eq=False)
+class DigestMonitor(BaseMonitor):
+    """
+    Buffer messages and forward them as one combined message.
+
+    The buffer is flushed when it holds max_messages, when window seconds have passed
+    since the first buffered message, and at process shutdown. Lambda execution environments
+    are frozen rather than shut down, so lambda_monitor flushes the buffer after each invocation;
+    other handlers should call flush themselves.
+    A digest that is not delivered is spooled to outbox, or else logged.
+    """
+    monitor: BaseMonitor
+    window: float = 60
+    max_messages: int = 50
+    outbox: Outbox | None = None
+    _buffer: list[BaseMessage] = field(default_factory=list, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    _timer: threading.Timer | None = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        _monitors.add(self)
+
+    def notify(self, message: BaseMessageType) -> None:
+        """
+        Buffer message; delivery, and spooling or logging a failed digest, is done by flush.
+        """
+        with self._lock:
+            self._buffer.append(message)
+            full = len(self._buffer) >= self.max_messages
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self, outbox: Outbox | None = None) -> bool:
+        """
+        Send the buffered messages as one digest. Returns False if it was not delivered,
+        in which case it was spooled to outbox (default self.outbox) or logged.
+        """
+        with self._lock:
+            messages, self._buffer = self._buffer, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not messages:
+            return True
+        digest = render_digest(messages)
+        outbox = outbox if outbox is not None else self.outbox
+        try:
+            delivered = deliver(self.monitor, digest, outbox)
+        except Exception as e:
+            # also called from the timer thread, where an exception would lose the digest
+            logger.error(f'{type(self.monitor).__name__} failed: {e}', exc_info=True)
+            delivered = False
+        if not delivered and outbox is None:
+            logger.error(f'Digest not delivered, {type(digest).__name__} only logged:\n{digest.as_str}')
+        return delivered
+
+
+@atexit.register
+def flush_all() -> None:
+    for monitor in list(_monitors):
+        monitor.flush()
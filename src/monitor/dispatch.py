@@ -0,0 +1,129 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from collections import deque
+from logging import getLogger
+from typing import Callable
+
+from monitor.context import current_request
+from monitor.context import RequestContext
+from monitor.messages import BaseMessageType
+from monitor.monitors import BaseMonitor
+from monitor.monitors import deliver
+from monitor.monitors import Outbox
+
+logger = getLogger()
+
+# called with message and spooled_at when a message is not delivered and there is no outbox
+Fallback = Callable[[BaseMessageType, float | None], None]
+
+# monitor, message, outbox to spool to on failure, the original spool time of a replayed message,
+# the submitter's context variables (e.g. the notification deadline) to run the job in,
+# the request that submitted it (None outside monitored invocations), and the fallback
+Job = tuple[
+    BaseMonitor, BaseMessageType, Outbox | None, float | None, contextvars.Context, RequestContext | None,
+    Fallback | None
+]
+
+
+class BackgroundDispatcher:
+    """
+    Sends notifications from an in-process queue on a background worker thread.
+
+    Pending jobs and notify time are kept per request, so concurrent invocations only
+    wait for, drain and account for their own notifications.
+    """
+
+    def __init__(self):
+        self._jobs: deque[Job] = deque()
+        self._condition = threading.Condition()
+        self._pending: defaultdict[RequestContext | None, int] = defaultdict(int)
+        self._notify_seconds: defaultdict[RequestContext | None, float] = defaultdict(float)
+        self._worker: threading.Thread | None = None
+
+    def submit(
+            self,
+            monitor: BaseMonitor,
+            message: BaseMessageType,
+            outbox: Outbox | None = None,
+            spooled_at: float | None = None,
+            fallback: Fallback | None = None
+    ) -> None:
+        request = current_request.get()
+        with self._condition:
+            self._pending[request] += 1
+            self._jobs.append((monitor, message, outbox, spooled_at, contextvars.copy_context(), request, fallback))
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='monitor-dispatch', daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._jobs)
+                monitor, message, outbox, spooled_at, context, request, fallback = self._jobs.popleft()
+            start = time.perf_counter()
+            try:
+                try:
+                    delivered = context.run(deliver, monitor, message, outbox, spooled_at)
+                except Exception as error:
+                    logger.error(f'Background notification failed: {error}', exc_info=True)
+                    delivered = False
+                # with an outbox, deliver has spooled the message already
+                if not delivered and outbox is None and fallback is not None:
+                    context.run(fallback, message, spooled_at)
+            except Exception as error:
+                logger.error(f'Background notification fallback failed: {error}', exc_info=True)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._condition:
+                    self._notify_seconds[request] += elapsed
+                    self._done(request, 1)
+
+    def _done(self, request: RequestContext | None, count: int) -> None:
+        self._pending[request] -= count
+        if not self._pending[request]:
+            del self._pending[request]
+        self._condition.notify_all()
+
+    @property
+    def pending(self) -> int:
+        with self._condition:
+            return sum(self._pending.values())
+
+    def pending_for(self, request: RequestContext | None) -> int:
+        with self._condition:
+            return self._pending.get(request, 0)
+
+    def flush(self, timeout: float | None = None, request: RequestContext | None = None) -> bool:
+        """
+        Wait until the queued notifications of request (of all requests if None) are sent.
+        Returns False if the timeout expired first.
+        """
+        with self._condition:
+            if request is None:
+                return self._condition.wait_for(lambda: not self._pending, timeout)
+            return self._condition.wait_for(lambda: request not in self._pending, timeout)
+
+    def drain(self, request: RequestContext | None = None) -> list[Job]:
+        """
+        Remove and return the jobs of request (of all requests if None) that the worker has not started yet.
+        """
+        with self._condition:
+            jobs = [job for job in self._jobs if request is None or job[5] is request]
+            self._jobs = deque(job for job in self._jobs if request is not None and job[5] is not request)
+            for job in jobs:
+                self._done(job[5], 1)
+        return jobs
+
+    def take_notify_seconds(self, request: RequestContext | None = None) -> float:
+        """
+        Return the time spent notifying for request since the last call and reset its counter.
+        """
+        with self._condition:
+            return self._notify_seconds.pop(request, 0.0)
+
+
+dispatcher = BackgroundDispatcher()
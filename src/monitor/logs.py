@@ -0,0 +1,81 @@
+import datetime
+import logging
+from typing import Any
+
+from monitor import codec
+from monitor.context import request_id
+from monitor.context import RequestContext
+from monitor.messages import LambdaErrorMessage
+
+logger = logging.getLogger()
+
+# attributes of every log record; anything else was passed with extra= and is logged as a field
+reserved_attributes = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format each record as one line of JSON, e.g. for CloudWatch Logs Insights.
+
+    Fields passed with extra= are added at the top level; request_id is that of the current
+    request context, or else the one the Lambda runtime attaches to records.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.UTC).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in reserved_attributes:
+                entry['request_id' if key == 'aws_request_id' else key] = value
+        if (current := request_id()) is not None:
+            entry['request_id'] = current
+        if record.exc_info and not record.exc_text:
+            # cached on the record like logging.Formatter does, so other handlers do not format it again
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['traceback'] = record.exc_text
+        return codec.dumps(entry, default=str)
+
+
+def install_json_logging(level: int | None = None) -> None:
+    """
+    Format all records of the root logger as JSON, keeping the handler of the Lambda runtime.
+    """
+    root = logging.getLogger()
+    if not root.handlers:
+        root.addHandler(logging.StreamHandler())
+    for handler in root.handlers:
+        if not isinstance(handler.formatter, JsonFormatter):
+            handler.setFormatter(JsonFormatter())
+    if level is not None:
+        root.setLevel(level)
+
+
+def failure_fields(
+        message: LambdaErrorMessage,
+        error: Exception,
+        event: Any,
+        request: RequestContext
+) -> dict[str, Any]:
+    return {
+        'request_id': request.request_id,
+        'error_name': message.name,
+        'error_message': str(error),
+        'traceback': message.traceback,
+        'event': event,
+        'event_source': request.event_source,
+        'function_name': request.function_name,
+        'cold_start': request.cold_start,
+        'duration_ms': round(request.elapsed() * 1000, 1),
+    }
+
+
+def log_failure(message: LambdaErrorMessage, error: Exception, event: Any, request: RequestContext) -> None:
+    """
+    Log a failed invocation as one record, reusing the traceback already formatted for message.
+    """
+    logger.error(f'{message.name}: {error}', extra=failure_fields(message, error, event, request))
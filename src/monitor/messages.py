@@ -1,31 +1,65 @@
 import datetime
-import json
 import logging
-import os
 import traceback
 import urllib.parse
 from abc import ABC
 from abc import abstractmethod
 from dataclasses import dataclass
 from dataclasses import field
+from dataclasses import fields
 from json import JSONDecodeError
 from typing import Any
+from typing import Callable
 from typing import Generic
 from typing import TypeVar
 
+from monitor import codec
+from monitor.context import lambda_environment
+from monitor.context import lambda_variables
+
 logger = logging.getLogger()
 BaseMessageType = TypeVar('BaseMessageType', bound='BaseMessage')
 
 
 class BaseMessage(ABC, Generic[BaseMessageType]):
+    """
+    Messages are immutable, so as_str and as_json are rendered once and cached; as_dict returns
+    a new dict on each access, so callers cannot change the cached renderings through it.
+    """
+    __slots__ = ('_rendered',)
+    _rendered: dict[str, Any]
+
+    def _memo(self, key: str, render: Callable[[], Any]) -> Any:
+        try:
+            rendered = self._rendered
+        except AttributeError:
+            rendered = {}
+            object.__setattr__(self, '_rendered', rendered)
+        if key not in rendered:
+            rendered[key] = render()
+        return rendered[key]
+
+    def _reset(self) -> None:
+        object.__setattr__(self, '_rendered', {})
 
     @property
     def as_dict(self) -> dict[str, Any]:
-        return self.__dict__
+        return self._init_fields()
+
+    def _init_fields(self) -> dict[str, Any]:
+        # optional fields are left out while unset, so consumers of older versions can still read the dict
+        return {
+            f.name: value for f in fields(self) if f.init  # type: ignore
+            if (value := getattr(self, f.name)) is not None or not f.metadata.get('optional')
+        }
 
     @property
     def as_json(self) -> str:
-        return json.dumps(self.as_dict, default=str)
+        return self._memo('json', lambda: codec.dumps(self._init_fields(), default=str))
+
+    @property
+    def as_str(self) -> str:
+        return self._memo('str', self.render_str)
 
     @classmethod
     def from_dict(cls, message: dict):
@@ -35,60 +69,72 @@ class BaseMessage(ABC, Generic[BaseMessageType]):
     @classmethod
     def from_error(cls, error: Exception, event: dict, context) -> BaseMessageType:
         try:
-            error_dict = json.loads(str(error))
-        except json.JSONDecodeError:
+            error_dict = codec.loads(str(error))
+        except JSONDecodeError:
             logger.error(f'Error message is not a JSON string: {str(error)}')
             raise ValueError('Error message is not a JSON string.')
         return cls.from_dict(error_dict)
 
-    @property
     @abstractmethod
-    def as_str(self) -> str:
+    def render_str(self) -> str:
         pass
 
 
-@dataclass
+# slotted dataclasses do not support zero-argument super(), so subclasses call the parent's render_str explicitly
+@dataclass(frozen=True, slots=True)
 class SimpleMessage(BaseMessage):
     text: str
 
-    @property
-    def as_str(self) -> str:
+    def render_str(self) -> str:
         return self.text
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ErrorMessage(BaseMessage):
     name: str
     text: str
+    # reference to the complete message when it was shortened to fit a size budget, see monitor.offload
+    payload_ref: str | None = field(default=None, kw_only=True, metadata={'optional': True})
 
-    @property
-    def as_str(self) -> str:
-        return (
+    def render_str(self) -> str:
+        text = (
             f'Error: {self.name}\n'
             f'Message: {self.text}'
         )
+        if self.payload_ref:
+            text += f'\nFull message: {self.payload_ref}'
+        return text
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LambdaErrorMessage(ErrorMessage):
     traceback: str
     request_id: str
     cloudwatch: str
     envs: dict[str, str] = field(default_factory=dict)
+    profile: dict[str, Any] | None = field(default=None, kw_only=True, metadata={'optional': True})
 
-    @property
-    def as_str(self) -> str:
-        return super().as_str + '\n' + (
+    def render_str(self) -> str:
+        text = ErrorMessage.render_str(self) + '\n' + (
             f'Traceback:\n{self.traceback}\n'
             f'AWS Request ID: {self.request_id}\n'
             f'CloudWatch Logs: {self.cloudwatch}\n'
-            f'Environment:\n{json.dumps(self.envs, indent=2)}\n'
+            f'Environment:\n{codec.dumps(self.envs, indent=True)}\n'
         )
+        if self.profile:
+            text += f'Profile:\n{codec.dumps(self.profile, indent=True)}\n'
+        return text
 
     @classmethod
-    def from_error(cls, error: Exception, event: dict, context) -> 'LambdaErrorMessage':
+    def from_error(
+            cls,
+            error: Exception,
+            event: dict,
+            context,
+            profile: dict[str, Any] | None = None
+    ) -> 'LambdaErrorMessage':
         envs = cls.get_envs()
-        event_str = json.dumps(event, indent=2, ensure_ascii=False, default=str)
+        event_str = codec.dumps(event, indent=True, default=str)
         return cls(
             name=type(error).__name__,
             text=f'Event:\n{event_str}\n{str(error)}',
@@ -101,24 +147,19 @@ class LambdaErrorMessage(ErrorMessage):
                 aws_request_id=context.aws_request_id
             ),
             envs=envs,
+            profile=profile or None,
         )
 
     def add_envs(self):
-        self.envs = self.get_envs()
+        # the one in-place update of a message, kept for compatibility; drops the cached renderings
+        object.__setattr__(self, 'envs', self.get_envs())
+        self._reset()
 
     @staticmethod
     def get_envs():
-        envs = {}
-        for key in (
-                'AWS_EXECUTION_ENV',
-                'AWS_DEFAULT_REGION',
-                'AWS_LAMBDA_FUNCTION_NAME',
-                'AWS_LAMBDA_FUNCTION_MEMORY_SIZE',
-                'AWS_LAMBDA_LOG_GROUP_NAME',
-                'AWS_LAMBDA_LOG_STREAM_NAME',
-        ):
-            envs[key.lower()[4:]] = os.environ[key]
-        return envs
+        # snapshot taken once per execution environment, see monitor.context
+        environment = lambda_environment()
+        return {key.lower()[4:]: environment[key] for key in lambda_variables}
 
     @staticmethod
     def get_cloudwatch_link(
@@ -142,34 +183,83 @@ class LambdaErrorMessage(ErrorMessage):
         )
 
 
-@dataclass
+def truncate(text: str, limit: int) -> str:
+    """
+    Shorten text to at most limit characters, keeping its head and tail, e.g. the outermost
+    frames and the exception of a traceback.
+    """
+    if len(text) <= limit:
+        return text
+    marker = f'\n[... {len(text) - limit} characters omitted ...]\n'
+    keep = max(0, limit - len(marker))
+    head = keep // 2
+    return text[:head] + marker + text[len(text) - (keep - head):]
+
+
+def parse_cause(cause: str) -> Any:
+    """
+    Parse the JSON part of a Step Functions cause. Returns None if there is none.
+    """
+    if 'Returned payload:' in cause:
+        cause = cause.split('Returned payload:')[1].strip()
+    try:
+        return codec.loads(cause)
+    except JSONDecodeError:
+        return None
+
+
+def parse_json(text: str | None) -> Any:
+    try:
+        return codec.loads(text)  # type: ignore
+    except (JSONDecodeError, TypeError):
+        return None
+
+
+unparsed: Any = object()
+
+
+@dataclass(frozen=True, slots=True)
 class StepFunctionFailureMessage(ErrorMessage):
     input: str
     execution_arn: str
     state_machine_arn: str
     start_date: int
     stop_date: int
+    _cause: Any = field(default=unparsed, init=False, repr=False, compare=False)
+    _input: Any = field(default=unparsed, init=False, repr=False, compare=False)
+
+    @property
+    def cause_data(self) -> Any:
+        """
+        Parsed cause, decoded on first access. None if the cause is not JSON or too large to decode.
+        """
+        if self._cause is unparsed:
+            object.__setattr__(self, '_cause', parse_cause(self.text))
+        return self._cause
+
+    @property
+    def input_data(self) -> Any:
+        """
+        Parsed input, decoded on first access. None if the input is not JSON or too large to decode.
+        """
+        if self._input is unparsed:
+            object.__setattr__(self, '_input', parse_json(self.input))
+        return self._input
 
     @property
     def cause_json(self) -> str:
-        cause_str = self.text
-        if 'Returned payload:' in self.text:
-            cause_str = self.text.split('Returned payload:')[1].strip()
-        try:
-            return json.dumps(json.loads(cause_str), indent=2, ensure_ascii=False)
-        except JSONDecodeError:
+        if self.cause_data is None:
             return self.text
+        return codec.dumps(self.cause_data, indent=True)
 
     @property
     def input_json(self) -> str:
-        try:
-            return json.dumps(json.loads(self.input), indent=2, ensure_ascii=False)
-        except JSONDecodeError:
+        if self.input_data is None:
             return self.input
+        return codec.dumps(self.input_data, indent=True)
 
-    @property
-    def as_str(self) -> str:
-        return super().as_str + '\n' + (
+    def render_str(self) -> str:
+        return ErrorMessage.render_str(self) + '\n' + (
             f'Cause:\n{self.cause_json}\n'
             f'ExecutionArn: {self.execution_arn}\n'
             f'StateMachineArn: {self.state_machine_arn}\n'
@@ -179,29 +269,57 @@ class StepFunctionFailureMessage(ErrorMessage):
         )
 
 
-def from_event(event: dict) -> BaseMessageType:
-    if 'Error' in event and 'Cause' in event:
+def from_event(event: dict, max_depth: int = 16, max_size: int = 1_048_576) -> BaseMessageType:
+    """
+    Convert a Step Functions or Lambda failure event into a message.
+
+    Causes nested in causes are unwrapped iteratively, decoding each level exactly once.
+    Unwrapping stops after max_depth levels or at a cause longer than max_size characters,
+    which is then kept as raw text.
+    """
+    cause_data: Any = unparsed
+    depth = 0
+    while 'Error' in event and 'Cause' in event:
+        cause = event['Cause']
+        if depth >= max_depth or not isinstance(cause, str) or len(cause) > max_size:
+            cause_data = None
+            break
         try:
-            cause_dict = json.loads(event['Cause'])
-            return from_event(cause_dict)
+            decoded = codec.loads(cause)
         except JSONDecodeError:
-            pass
-        event['errorType'] = 'StepFunctionFailure'
+            cause_data = parse_cause(cause)
+            break
+        if not isinstance(decoded, dict):
+            cause_data = decoded
+            break
+        event = decoded
+        depth += 1
+
+    if 'Error' in event and 'Cause' in event:
+        message = StepFunctionFailureMessage(
+            name=event['Error'],
+            text=event['Cause'],
+            input=event.get('Input'),  # type: ignore
+            execution_arn=event.get('ExecutionArn'),  # type: ignore
+            state_machine_arn=event.get('StateMachineArn'),  # type: ignore
+            start_date=event.get('StartDate'),  # type: ignore
+            stop_date=event.get('StopDate')  # type: ignore
+        )
+        object.__setattr__(message, '_cause', cause_data)
+        if isinstance(message.input, str) and len(message.input) > max_size:
+            object.__setattr__(message, '_input', None)
+        return message
 
     match event.get('errorType'):
         case 'LambdaException':
-            error_message_dict = json.loads(event['errorMessage'])
+            error_message_dict = codec.loads(event['errorMessage'])
             return LambdaErrorMessage(**error_message_dict)
-        case 'StepFunctionFailure':
-            return StepFunctionFailureMessage(
-                name=event['Error'],
-                text=event['Cause'],
-                input=event.get('Input'),
-                execution_arn=event.get('ExecutionArn'),
-                state_machine_arn=event.get('StateMachineArn'),
-                start_date=event.get('StartDate'),
-                stop_date=event.get('StopDate')
-            )
         case _:
-            text = json.dumps(event, indent=2, default=str)
+            text = codec.dumps(event, indent=True, default=str)
             return ErrorMessage(name='Unknown', text=text)
+
+
+# message classes by name, used to restore messages that were serialized with their type
+message_types: dict[str, type[BaseMessage]] = {
+    cls.__name__: cls for cls in (SimpleMessage, ErrorMessage, LambdaErrorMessage, StepFunctionFailureMessage)
+}
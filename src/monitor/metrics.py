@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from typing import TextIO
+
+from monitor import codec
+from monitor.context import lambda_environment
+from monitor.context import RequestCounters
+
+Dimension = tuple[str, str]
+
+
+def counter_metrics(counters: RequestCounters) -> dict[str, int]:
+    """
+    Notification counters of one invocation; other invocations in the same process count separately.
+    """
+    return {
+        'SuppressedNotifications': counters.suppressed,
+        'RetriedNotifications': counters.retries,
+        'RejectedNotifications': counters.rejected,
+    }
+
+
+@dataclass
+class Metrics:
+    """
+    Metrics of one invocation, written as a single CloudWatch Embedded Metric Format log line.
+
+    Metrics without dimension are reported per function and environment; a metric can add
+    one extra dimension, e.g. ('ErrorName', 'RuntimeError').
+    """
+    namespace: str
+    dimensions: dict[str, str]
+    _values: dict[str, float] = field(default_factory=dict, init=False)
+    _units: dict[str, str] = field(default_factory=dict, init=False)
+    _groups: dict[Dimension | None, list[str]] = field(default_factory=dict, init=False)
+
+    @classmethod
+    def for_function(cls, namespace: str) -> 'Metrics':
+        return cls(namespace, {
+            'FunctionName': lambda_environment().get('AWS_LAMBDA_FUNCTION_NAME', 'unknown'),
+            'Env': os.environ.get('APP_ENV', 'dev'),
+        })
+
+    def put(self, name: str, value: float, unit: str = 'Count', dimension: Dimension | None = None) -> None:
+        if name not in self._values:
+            self._groups.setdefault(dimension, []).append(name)
+        self._values[name] = value
+        self._units[name] = unit
+
+    def as_dict(self, timestamp: int | None = None) -> dict:
+        directives = []
+        properties: dict[str, object] = dict(self.dimensions)
+        for dimension, names in self._groups.items():
+            keys = list(self.dimensions)
+            if dimension is not None:
+                keys.append(dimension[0])
+                properties[dimension[0]] = dimension[1]
+            directives.append({
+                'Namespace': self.namespace,
+                'Dimensions': [keys],
+                'Metrics': [{'Name': name, 'Unit': self._units[name]} for name in names],
+            })
+        return {
+            '_aws': {
+                'Timestamp': timestamp if timestamp is not None else int(time.time() * 1000),
+                'CloudWatchMetrics': directives,
+            },
+            **properties,
+            **self._values,
+        }
+
+    def emit(self, stream: TextIO | None = None) -> None:
+        """
+        Write all metrics as one line to stdout, where CloudWatch Logs picks them up.
+        """
+        (stream or sys.stdout).write(codec.dumps(self.as_dict()) + '\n')
@@ -1,32 +1,84 @@
+import contextvars
 import datetime
-import json
+import gzip
+import hashlib
 import os
-import socket
-import urllib.parse
-import urllib.request
+import threading
+import time
 import zoneinfo
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from dataclasses import field
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
 from logging import getLogger
+from typing import Any
 from typing import cast
+from typing import ClassVar
 from typing import Generic
 
-import boto3
-from botocore.exceptions import ClientError
-
+from monitor import codec
+from monitor.aws import get_client
+from monitor.messages import BaseMessage
 from monitor.messages import BaseMessageType
-from monitor.messages import ErrorMessage
+from monitor.messages import LambdaErrorMessage
+from monitor.messages import message_types
+from monitor.messages import StepFunctionFailureMessage
+from monitor.messages import truncate
+from monitor.offload import Offloader
+from monitor.offload import shrink
+from monitor.offload import slack_budget
+from monitor.offload import text_size
+from monitor.pool import connection_pool
+from monitor.resilience import CircuitOpenError
+from monitor.resilience import current_deadline
+from monitor.resilience import DeadlineExceeded
+from monitor.resilience import fit_timeout
+from monitor.resilience import get_resilience
+from monitor.resilience import Resilience
+from monitor.resilience import RetryableError
+from monitor.resilience import RetryPolicy
+from monitor.resilience import TokenBucket
+from monitor.routing import current_env
+from monitor.routing import mention_severities
+from monitor.routing import Route
+from monitor.routing import Router
+from monitor.routing import Rule
 
-env = os.environ.get('APP_ENV', 'dev')
 timezone = zoneinfo.ZoneInfo('Europe/Berlin')
 
 logger = getLogger()
 
+ses_throttling_codes = ('Throttling', 'ThrottlingException', 'TooManyRequestsException')
+slack_retry_policy = RetryPolicy(attempts=3, base_delay=0.2, max_delay=5)
+
+
+def ses_resilience() -> Resilience:
+    # default SES sending quota is 14 messages per second
+    return Resilience(retry=RetryPolicy(attempts=4), bucket=TokenBucket(rate=10, capacity=10))
+
+
+def slack_resilience() -> Resilience:
+    # Slack allows about one message per second per webhook, with short bursts
+    return Resilience(retry=slack_retry_policy, bucket=TokenBucket(rate=1, capacity=5))
+
 
 class BaseMonitor(Generic[BaseMessageType]):
 
-    def notify(self, message: BaseMessageType) -> None:
+    def notify(self, message: BaseMessageType) -> Any:
+        """
+        Monitors that report delivery return False when the message was dropped.
+        """
         print(message.as_str)
 
+    async def anotify(self, message: BaseMessageType) -> Any:
+        """
+        Notify without blocking the event loop; by default, notify runs in a worker thread.
+        """
+        import asyncio
+        return await asyncio.to_thread(self.notify, message)
+
 
 @dataclass
 class Email:
@@ -34,44 +86,126 @@ class Email:
     message: str
     to_addresses: list[str]
     source: str
+    # file name -> content; emails with attachments are sent as raw MIME messages
+    attachments: dict[str, bytes] = field(default_factory=dict)
+
+    def as_mime(self) -> bytes:
+        mime = MIMEMultipart()
+        mime['Subject'] = self.subject
+        mime['From'] = self.source
+        mime['To'] = ', '.join(self.to_addresses)
+        mime.attach(MIMEText(self.message, 'plain', 'utf-8'))
+        for name, data in self.attachments.items():
+            part = MIMEApplication(data, 'gzip')
+            part.add_header('Content-Disposition', 'attachment', filename=name)
+            mime.attach(part)
+        return mime.as_bytes()
 
     def send(self):
-        client = boto3.client('ses', region_name='eu-central-1')
-        email_message = {
-            'Subject': {'Data': self.subject},
-            'Body': {'Text': {'Data': self.message}},
-        }
+        from botocore.exceptions import ClientError
+        client = get_client('ses', region_name='eu-central-1')
+
+        def send_email():
+            try:
+                if self.attachments:
+                    return client.send_raw_email(
+                        Source=self.source,
+                        Destinations=self.to_addresses,
+                        RawMessage={'Data': self.as_mime()}
+                    )
+                return client.send_email(
+                    Source=self.source,
+                    Destination={'ToAddresses': self.to_addresses},
+                    Message={
+                        'Subject': {'Data': self.subject},
+                        'Body': {'Text': {'Data': self.message}},
+                    }
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] in ses_throttling_codes:
+                    raise RetryableError(e.__str__()) from e
+                raise
+
         try:
-            response = client.send_email(
-                Source=self.source,
-                Destination={'ToAddresses': self.to_addresses},
-                Message=email_message  # type: ignore
-            )
+            response = get_resilience('ses', ses_resilience).call(send_email)
             message_id = response['MessageId']
             logger.info(f'Email sent to {self.to_addresses}. Message ID: {message_id}')
-        except ClientError as e:
+            return message_id
+        except (ClientError, CircuitOpenError) as e:
             logger.error(e.__str__())
             raise
 
 
+def email_summary(message: BaseMessageType, budget: int) -> str:
+    """
+    Short plain-text version of message for the email body; the event and input are left to the attachment.
+    """
+    match message:
+        case LambdaErrorMessage():
+            summary = (
+                f'Error: {message.name}\n'
+                f'Message: {message.text.rsplit('\n', 1)[-1]}\n'
+                f'AWS Request ID: {message.request_id}\n'
+                f'CloudWatch Logs: {message.cloudwatch}\n'
+                f'Traceback:\n{message.traceback}'
+            )
+        case StepFunctionFailureMessage():
+            summary = (
+                f'Error: {message.name}\n'
+                f'ExecutionArn: {message.execution_arn}\n'
+                f'StateMachineArn: {message.state_machine_arn}\n'
+                f'Cause:\n{message.text}'
+            )
+        case _:
+            summary = message.as_str
+    return truncate(summary, budget)
+
+
+def compress_json(data: str) -> bytes:
+    return gzip.compress(data.encode())
+
+
 @dataclass
 class EmailMonitor(BaseMonitor):
+    """
+    Messages longer than inline_budget characters are sent as a summary, with the complete
+    message attached as gzip-compressed JSON.
+
+    Only messages the router routes to the 'email' sink (by default, all) are sent, so routers
+    can be shared with other monitors; prod_addresses get the emails when APP_ENV is prod at
+    the time of sending.
+    """
+    sinks: ClassVar[tuple[str, ...]] = ('email',)
+
     sender_address: str
     prod_addresses: list[str]
     dev_addresses: tuple[str] = (
         'christian.schaefer@tatenmitdaten.com',
     )
+    inline_budget: int = 10_000
+    router: Router = field(default_factory=lambda: Router([Rule(sink='email')]))
 
     def notify(self, message: BaseMessageType):
+        env = current_env()
+        route = self.router.route(message, env)
+        if route is None or route.sink not in self.sinks:
+            logger.info(f'{type(message).__name__} not routed to email')
+            return None
         to_addresses = list(self.dev_addresses)
         if env == 'prod':
             to_addresses.extend(self.prod_addresses)
         datetime_str = datetime.datetime.now(timezone).strftime("%d.%m.%Y %H:%M:%S")
+        text = cast(str, message.as_str)  # workaround for PyCharm bug
+        attachments = {}
+        if len(text) > self.inline_budget:
+            text = email_summary(message, self.inline_budget) + '\n\nFull message attached as message.json.gz'
+            attachments['message.json.gz'] = compress_json(message.as_json)
         email = Email(
             subject=f'⚠ ELT-Fehler ({message.name or 'unbekannt'}) - {datetime_str}',
-            message=cast(str, message.as_str),  # workaround for PyCharm bug
+            message=text,
             to_addresses=to_addresses,
-            source=self.sender_address
+            source=self.sender_address,
+            attachments=attachments
         )
         return email.send()
 
@@ -80,26 +214,78 @@ class EmailMonitor(BaseMonitor):
 class SlackChannel:
     name: str
     webhook_path: str
+    base_url: str = 'https://hooks.slack.com/services'
+    # per attempt, shortened to the time left before the current deadline
+    timeout: float = 3
 
     @property
     def webhook_url(self) -> str:
-        return f'https://hooks.slack.com/services/{self.webhook_path}'
+        return f'{self.base_url}/{self.webhook_path}'
 
-    def send(self, text: str | None, payload: dict | None = None):
+    def send(self, text: str | None, payload: dict | None = None) -> bool:
+        """
+        Post to the webhook, retrying timeouts, 429 and 5xx responses. Returns whether the message was delivered.
+        """
         payload = payload or {'text': text}
-        request = urllib.request.Request(
-            url=self.webhook_url,
-            data=json.dumps(payload).encode('ascii'),
-            headers={"Content-Type": "application/json"}
-        )
+        body = codec.dumps_bytes(payload)
         logger.info(f'Sending message to {self.name} Slack channel')
         try:
-            with urllib.request.urlopen(request, timeout=3) as response:
-                if response.status != 200:
-                    logger.info(response.status)
-                    logger.info(response.content)
-        except socket.timeout:
-            logger.info(f"Request to {self.webhook_url} timed out 3 times.")
+            return get_resilience(f'slack:{self.name}', slack_resilience).call(lambda: self._post(body))
+        except CircuitOpenError:
+            logger.warning(f'Slack channel {self.name} is unhealthy, message dropped.')
+        except DeadlineExceeded as e:
+            logger.warning(f'Message to Slack channel {self.name} not sent: {e}')
+        except (RetryableError, OSError) as e:
+            logger.info(f"Request to {self.webhook_url} failed after {slack_retry_policy.attempts} attempts: {e}")
+        return False
+
+    async def asend(self, text: str | None, payload: dict | None = None) -> bool:
+        """
+        Like send, without blocking the event loop.
+        """
+        payload = payload or {'text': text}
+        body = codec.dumps_bytes(payload)
+        logger.info(f'Sending message to {self.name} Slack channel')
+        try:
+            return await get_resilience(f'slack:{self.name}', slack_resilience).acall(lambda: self._apost(body))
+        except CircuitOpenError:
+            logger.warning(f'Slack channel {self.name} is unhealthy, message dropped.')
+        except DeadlineExceeded as e:
+            logger.warning(f'Message to Slack channel {self.name} not sent: {e}')
+        except (RetryableError, OSError) as e:
+            logger.info(f"Request to {self.webhook_url} failed after {slack_retry_policy.attempts} attempts: {e}")
+        return False
+
+    def _post(self, body: bytes) -> bool:
+        try:
+            response = connection_pool.request(
+                'POST',
+                self.webhook_url,
+                body=body,
+                headers={"Content-Type": "application/json"},
+                timeout=fit_timeout(self.timeout)
+            )
+        except OSError as e:
+            raise RetryableError(f'Request to {self.name} Slack channel failed: {e}') from e
+        return self._check_response(*response)
+
+    async def _apost(self, body: bytes) -> bool:
+        import asyncio
+        # over the pooled keep-alive connection; the worker thread gets a copy of the context, so of the deadline
+        return await asyncio.to_thread(self._post, body)
+
+    def _check_response(self, status: int, headers: dict[str, str], data: bytes) -> bool:
+        if status == 429 or status >= 500:
+            retry_after = headers.get('retry-after')
+            raise RetryableError(
+                f'Slack channel {self.name} responded with {status}',
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        if status != 200:
+            logger.info(status)
+            logger.info(data)
+            return False
+        return True
 
 
 @dataclass(frozen=True)
@@ -122,19 +308,313 @@ dev_channel_set = SlackChannelSet(
 
 @dataclass
 class SlackMonitor(BaseMonitor):
+    """
+    The router picks the channel ('alert' or 'info') and severity of each message; by default,
+    errors go to alert and notify the channel, everything else goes to info. Messages it does
+    not route, or routes to sinks of other monitors (e.g. 'email'), are dropped before any
+    request is made.
+
+    Messages longer than text_budget characters are shortened; with an offloader, the
+    complete message is stored in S3 and linked.
+    """
+    sinks: ClassVar[tuple[str, ...]] = ('alert', 'info')
     prod_channels: SlackChannelSet | None
     dev_channels: SlackChannelSet = dev_channel_set
+    text_budget: int = slack_budget
+    offloader: Offloader | None = None
+    router: Router = field(default_factory=Router)
 
     @property
     def channels(self) -> SlackChannelSet:
-        return self.prod_channels if env == 'prod' else self.dev_channels
+        return self.prod_channels if current_env() == 'prod' else self.dev_channels
+
+    def route(self, message: BaseMessageType) -> Route | None:
+        route = self.router.route(message)
+        if route is None or route.sink not in self.sinks:
+            logger.info(f'{type(message).__name__} not routed to Slack')
+            return None
+        return route
+
+    def render(self, route: Route, message: BaseMessageType) -> tuple[SlackChannel, str]:
+        mention = '<!channel> ' if route.severity in mention_severities else ''
+        return getattr(self.channels, route.sink), truncate(f'{mention}{message.as_str}', self.text_budget)
 
     def notify(self, message: BaseMessageType):
-        logger.info(message.as_str)
-        if isinstance(message, ErrorMessage):
-            channel = self.channels.alert
-            text = f'<!channel> {message.as_str}'
-        else:
-            channel = self.channels.info
-            text = message.as_str
-        channel.send(text=text)
+        logger.info(f'Notifying Slack of {type(message).__name__}')
+        logger.debug(message.as_str)
+        if (route := self.route(message)) is None:
+            return None
+        message = shrink(message, self.text_budget, self.offloader, text_size)
+        channel, text = self.render(route, message)
+        return channel.send(text=text)
+
+    async def anotify(self, message: BaseMessageType):
+        import asyncio
+        logger.info(f'Notifying Slack of {type(message).__name__}')
+        logger.debug(message.as_str)
+        if (route := self.route(message)) is None:
+            return None
+        message = await asyncio.to_thread(shrink, message, self.text_budget, self.offloader, text_size)
+        channel, text = self.render(route, message)
+        return await channel.asend(text=text)
+
+
+@dataclass
+class SinkResult:
+    name: str
+    ok: bool
+    latency: float
+    error: str | None = None
+
+
+# results of composite monitors, collected by the invocation that sets a list, e.g. for per-sink metrics
+sink_results: contextvars.ContextVar[list[SinkResult] | None] = contextvars.ContextVar(
+    'sink_results', default=None
+)
+
+
+def collect(results: list[SinkResult]) -> list[SinkResult]:
+    if (collected := sink_results.get()) is not None:
+        collected.extend(results)
+    return results
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def shared_executor() -> ThreadPoolExecutor:
+    """
+    Thread pool shared by all composite monitors, created on first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='monitor-sink')
+        return _executor
+
+
+def timed_notify(monitor: BaseMonitor, message: BaseMessageType) -> SinkResult:
+    name = type(monitor).__name__
+    start = time.perf_counter()
+    try:
+        result = monitor.notify(message)
+    except Exception as e:
+        logger.error(f'{name} failed: {e}', exc_info=True)
+        return SinkResult(name, False, time.perf_counter() - start, repr(e))
+    # monitors that report delivery return False when the message was dropped
+    return SinkResult(name, result is not False, time.perf_counter() - start)
+
+
+@dataclass
+class CompositeMonitor(BaseMonitor):
+    """
+    Send each message to all monitors in parallel.
+
+    Every sink gets at most timeout seconds; a slow or failing sink does not affect the others.
+    """
+    monitors: list[BaseMonitor]
+    timeout: float = 5
+
+    def sink_timeout(self) -> float:
+        deadline = current_deadline.get()
+        return self.timeout if deadline is None else min(self.timeout, deadline.remaining())
+
+    def notify(self, message: BaseMessageType) -> list[SinkResult]:
+        executor = shared_executor()
+        timeout = self.sink_timeout()
+        deadline = time.perf_counter() + timeout
+        # sinks see the caller's context variables, e.g. the notification deadline
+        futures = [
+            (monitor, executor.submit(contextvars.copy_context().run, timed_notify, monitor, message))
+            for monitor in self.monitors
+        ]
+        results = []
+        for monitor, future in futures:
+            try:
+                results.append(future.result(timeout=max(0.0, deadline - time.perf_counter())))
+            except TimeoutError:
+                # frees the worker if the sink has not started yet, e.g. queued behind stuck sinks
+                future.cancel()
+                results.append(SinkResult(type(monitor).__name__, False, timeout, 'timed out'))
+        return collect(results)
+
+    async def anotify(self, message: BaseMessageType) -> list[SinkResult]:
+        import asyncio
+        timeout = self.sink_timeout()
+        return collect(list(await asyncio.gather(*(
+            self._atimed_notify(monitor, message, timeout) for monitor in self.monitors
+        ))))
+
+    async def _atimed_notify(self, monitor: BaseMonitor, message: BaseMessageType, timeout: float) -> SinkResult:
+        import asyncio
+        name = type(monitor).__name__
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(monitor.anotify(message), timeout)
+        except TimeoutError:
+            return SinkResult(name, False, timeout, 'timed out')
+        except Exception as e:
+            logger.error(f'{name} failed: {e}', exc_info=True)
+            return SinkResult(name, False, time.perf_counter() - start, repr(e))
+        return SinkResult(name, result is not False, time.perf_counter() - start)
+
+
+@dataclass
+class Outbox:
+    """
+    Journal of undelivered notifications, one JSON line per message, kept in /tmp so that
+    a later invocation in the same execution environment can replay them.
+
+    Identical messages are stored once; entries older than max_age seconds are dropped and
+    the journal is compacted to the newest max_entries entries that fit into max_bytes once it
+    grows beyond max_bytes.
+    """
+    path: str = '/tmp/monitor-outbox.jsonl'
+    max_entries: int = 100
+    max_bytes: int = 1_048_576
+    max_age: float = 24 * 3600
+    batch_size: int = 10
+
+    _lock = threading.Lock()
+
+    def spool(self, message: BaseMessage, spooled_at: float | None = None) -> None:
+        """
+        Append message to the journal; spooled_at keeps the age of a message that failed again on replay.
+        """
+        entry = {
+            'key': hashlib.sha256(message.as_json.encode()).hexdigest()[:16],
+            'spooled_at': spooled_at or time.time(),
+            'type': type(message).__name__,
+            'message': message.as_dict,
+        }
+        line = codec.dumps_bytes(entry, default=str) + b'\n'
+        with self._lock:
+            with open(self.path, 'ab') as file:
+                file.write(line)
+                size = file.tell()
+            if size > self.max_bytes:
+                self._write(self._read())
+        logger.info(f'Spooled undelivered {type(message).__name__} to {self.path}')
+
+    def take(self, limit: int | None = None) -> list[tuple[float, BaseMessage]]:
+        """
+        Remove up to limit (default batch_size) of the oldest entries from the journal and
+        return them as (spooled_at, message) pairs.
+        """
+        with self._lock:
+            entries = self._read()
+            if not entries:
+                return []
+            limit = limit or self.batch_size
+            batch, rest = entries[:limit], entries[limit:]
+            self._write(rest)
+        messages = []
+        for entry in batch:
+            try:
+                message = message_types[entry['type']].from_dict(entry['message'])
+            except (KeyError, TypeError) as e:
+                logger.warning(f'Dropped unreadable outbox entry: {e!r}')
+                continue
+            messages.append((entry['spooled_at'], message))
+        return messages
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._read())
+
+    def _read(self) -> list[dict]:
+        """
+        Return the live entries, oldest first, without duplicates or expired entries.
+        """
+        try:
+            with open(self.path, 'rb') as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return []
+        cutoff = time.time() - self.max_age
+        entries: dict[str, dict] = {}
+        for line in lines:
+            try:
+                entry = codec.loads(line)
+            except ValueError:
+                # torn write, e.g. the execution environment was frozen mid-append
+                continue
+            if entry['spooled_at'] >= cutoff:
+                entries.setdefault(entry['key'], entry)
+        return list(entries.values())[-self.max_entries:]
+
+    def _write(self, entries: list[dict]) -> None:
+        if not entries:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        lines = [codec.dumps_bytes(entry, default=str) + b'\n' for entry in entries]
+        size = sum(len(line) for line in lines)
+        # oldest first, so that a compacted journal does not exceed max_bytes and is not rewritten on every spool
+        dropped = 0
+        while size > self.max_bytes and dropped < len(lines) - 1:
+            size -= len(lines[dropped])
+            dropped += 1
+        if dropped:
+            logger.warning(f'Dropped {dropped} outbox entries to fit {self.max_bytes} bytes')
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.writelines(lines[dropped:])
+        os.replace(temp_path, self.path)
+
+
+def delivered(result: Any) -> bool:
+    """
+    Interpret the return value of notify; monitors that report delivery return False when the
+    message was dropped, and a composite counts as delivered if any of its sinks succeeded.
+    """
+    if isinstance(result, list):
+        return any(sink.ok for sink in result)
+    return result is not False
+
+
+def deliver(
+        monitor: BaseMonitor,
+        message: BaseMessageType,
+        outbox: Outbox | None = None,
+        spooled_at: float | None = None
+) -> bool:
+    """
+    Notify monitor and spool the message to outbox if it was not delivered.
+
+    Without an outbox, exceptions from notify propagate as before.
+    """
+    try:
+        result = monitor.notify(message)
+    except Exception as e:
+        if outbox is None:
+            raise
+        logger.error(f'{type(monitor).__name__} failed: {e}', exc_info=True)
+        result = False
+    if not delivered(result) and outbox is not None:
+        outbox.spool(message, spooled_at)
+    return delivered(result)
+
+
+async def adeliver(
+        monitor: BaseMonitor,
+        message: BaseMessageType,
+        outbox: Outbox | None = None,
+        spooled_at: float | None = None
+) -> bool:
+    """
+    Like deliver, using monitor.anotify.
+    """
+    import asyncio
+    try:
+        result = await monitor.anotify(message)
+    except Exception as e:
+        if outbox is None:
+            raise
+        logger.error(f'{type(monitor).__name__} failed: {e}', exc_info=True)
+        result = False
+    if not delivered(result) and outbox is not None:
+        await asyncio.to_thread(outbox.spool, message, spooled_at)
+    return delivered(result)
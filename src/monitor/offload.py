@@ -0,0 +1,141 @@
+import datetime
+import hashlib
+from dataclasses import dataclass
+from dataclasses import replace
+from logging import getLogger
+from typing import Callable
+
+from monitor import codec
+from monitor.aws import get_client
+from monitor.messages import BaseMessage
+from monitor.messages import BaseMessageType
+from monitor.messages import ErrorMessage
+from monitor.messages import LambdaErrorMessage
+from monitor.messages import message_types
+from monitor.messages import StepFunctionFailureMessage
+from monitor.messages import truncate
+
+logger = getLogger()
+
+# Step Functions keeps at most 32 KB of an error cause, which wraps the JSON escaped error message
+step_functions_budget = 30 * 1024
+# Slack rejects message texts longer than 40,000 characters
+slack_budget = 39_000
+
+
+def json_size(message: BaseMessage) -> int:
+    return len(message.as_json.encode())
+
+
+def cause_size(message: BaseMessage) -> int:
+    """
+    Size of the message once it is embedded as a string in a Lambda error and a Step Functions cause.
+    """
+    return len(codec.dumps_bytes(message.as_json))
+
+
+def text_size(message: BaseMessage) -> int:
+    return len(message.as_str)
+
+
+@dataclass
+class Offloader:
+    """
+    Store complete messages in S3 so shortened copies can reference them.
+    """
+    bucket: str
+    prefix: str = 'monitor/'
+    region_name: str | None = None
+
+    def store(self, message: BaseMessage) -> str:
+        """
+        Upload message and return its s3:// reference.
+        """
+        body = codec.dumps_bytes({'type': type(message).__name__, 'message': message.as_dict}, default=str)
+        date = datetime.datetime.now(datetime.UTC).strftime('%Y/%m/%d')
+        key = f'{self.prefix}{type(message).__name__}/{date}/{hashlib.sha256(body).hexdigest()[:32]}.json'
+        get_client('s3', region_name=self.region_name).put_object(
+            Bucket=self.bucket, Key=key, Body=body, ContentType='application/json'
+        )
+        logger.info(f'Offloaded {len(body)} bytes to s3://{self.bucket}/{key}')
+        return f's3://{self.bucket}/{key}'
+
+    def load(self, reference: str) -> BaseMessage:
+        bucket, _, key = reference.removeprefix('s3://').partition('/')
+        response = get_client('s3', region_name=self.region_name).get_object(Bucket=bucket, Key=key)
+        data = codec.loads(response['Body'].read())
+        return message_types[data['type']].from_dict(data['message'])
+
+    def resolve(self, message: BaseMessageType) -> BaseMessageType:
+        """
+        Return the complete message if message was shortened, else message itself.
+        """
+        if isinstance(message, ErrorMessage) and message.payload_ref:
+            return self.load(message.payload_ref)  # type: ignore
+        return message
+
+
+def shrinkable_fields(message: BaseMessage) -> tuple[str, ...]:
+    match message:
+        case LambdaErrorMessage():
+            # text holds the event dump and the error
+            return 'text', 'traceback'
+        case StepFunctionFailureMessage():
+            return 'text', 'input'
+        case _:
+            return 'text',
+
+
+def shrink(
+        message: BaseMessageType,
+        budget: int,
+        offloader: Offloader | None = None,
+        size: Callable[[BaseMessage], int] = json_size
+) -> BaseMessageType:
+    """
+    Fit message into budget by truncating its longest text fields, keeping their head and tail.
+
+    With an offloader, the complete message is stored first and referenced by payload_ref.
+    Fields that are not shortened (ids, links, environment) count against the budget as well,
+    so the result can still exceed a budget that is smaller than them.
+    """
+    if size(message) <= budget:
+        return message
+    if offloader is not None and isinstance(message, ErrorMessage):
+        try:
+            message = replace(message, payload_ref=offloader.store(message))
+        except Exception as e:
+            logger.error(f'Offloading {type(message).__name__} failed: {e}')
+    lengths = {name: len(getattr(message, name) or '') for name in shrinkable_fields(message)}
+    if not sum(lengths.values()):
+        # only fixed fields, nothing left to shorten
+        return message
+    # size without the shrinkable fields, and how much each of their characters adds once serialized
+    fixed = size(replace(message, **{name: '' for name, length in lengths.items() if length}))  # type: ignore
+    expansion = (size(message) - fixed) / max(1, sum(lengths.values()))
+    limit = fair_share(list(lengths.values()), int((budget - fixed) / expansion))
+    shortened = message
+    for _ in range(10):
+        shortened = replace(message, **{  # type: ignore
+            name: truncate(getattr(message, name), limit)
+            for name, length in lengths.items() if length > limit
+        })
+        if size(shortened) <= budget:
+            break
+        # escaping makes the serialized size grow faster than the text
+        limit = int(limit * 0.8)
+    return shortened
+
+
+def fair_share(lengths: list[int], available: int) -> int:
+    """
+    Largest limit such that the fields, each cut to at most limit, fit into available;
+    short fields are kept whole and the long ones share the rest equally.
+    """
+    remaining = max(0, available)
+    for i, length in enumerate(sorted(lengths)):
+        share = remaining // (len(lengths) - i)
+        if length > share:
+            return share
+        remaining -= length
+    return max(lengths, default=0)
@@ -0,0 +1,127 @@
+import http.client
+import threading
+import urllib.parse
+from dataclasses import dataclass
+
+ConnectionKey = tuple[str, str, int | None]
+
+# errors raised when a kept-alive socket was closed by the server in the meantime
+stale_connection_errors = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+@dataclass
+class PoolStats:
+    created: int = 0
+    reused: int = 0
+    reconnects: int = 0
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections keyed by scheme, host and port.
+
+    Connections are kept at module level, so they survive warm Lambda invocations.
+    """
+
+    def __init__(self, max_idle: int = 4):
+        self.max_idle = max_idle
+        self.stats = PoolStats()
+        self._idle: dict[ConnectionKey, list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, key: ConnectionKey, timeout: float) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        with self._lock:
+            self.stats.created += 1
+        return connection_class(host, port, timeout=timeout)
+
+    def _acquire(self, key: ConnectionKey, timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                connection = idle.pop()
+                self.stats.reused += 1
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+        return self._connect(key, timeout), False
+
+    def _release(self, key: ConnectionKey, connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def clear(self) -> None:
+        with self._lock:
+            connections = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for connection in connections:
+            connection.close()
+
+    def request(
+            self,
+            method: str,
+            url: str,
+            body: bytes | None = None,
+            headers: dict[str, str] | None = None,
+            timeout: float = 3
+    ) -> tuple[int, dict[str, str], bytes]:
+        """
+        Send a request over a pooled connection and return status, headers (lower-cased names) and body.
+
+        A connection that turns out to be stale is replaced by a fresh one once.
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname or '', parts.port)
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+        connection, reused = self._acquire(key, timeout)
+        try:
+            response = self._send(connection, method, path, body, headers or {})
+        except stale_connection_errors:
+            connection.close()
+            if not reused:
+                raise
+            with self._lock:
+                self.stats.reconnects += 1
+            connection = self._connect(key, timeout)
+            try:
+                response = self._send(connection, method, path, body, headers or {})
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+        status, response_headers, data, will_close = response
+        if will_close:
+            connection.close()
+        else:
+            self._release(key, connection)
+        return status, response_headers, data
+
+    @staticmethod
+    def _send(
+            connection: http.client.HTTPConnection,
+            method: str,
+            path: str,
+            body: bytes | None,
+            headers: dict[str, str]
+    ) -> tuple[int, dict[str, str], bytes, bool]:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        headers = {name.lower(): value for name, value in response.getheaders()}
+        return response.status, headers, data, response.will_close
+
+
+connection_pool = ConnectionPool()
@@ -0,0 +1,59 @@
+import gc
+import time
+import tracemalloc
+from typing import Any
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore
+
+
+class InvocationProfile:
+    """
+    Resource usage of one invocation, from construction until as_dict is called.
+
+    With trace_allocations=True, tracemalloc runs during the invocation and the peak
+    traced memory and the top allocation sites are reported as well.
+    """
+
+    def __init__(self, cold_start: bool = False, trace_allocations: bool = False, top: int = 5):
+        self.cold_start = cold_start
+        self.top = top
+        self.trace_allocations = trace_allocations and not tracemalloc.is_tracing()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._gc = [generation['collections'] for generation in gc.get_stats()]
+        if self.trace_allocations:
+            tracemalloc.start()
+
+    def as_dict(self) -> dict[str, Any]:
+        profile: dict[str, Any] = {
+            'wall_time_ms': round((time.perf_counter() - self._wall) * 1000, 1),
+            'cpu_time_ms': round((time.process_time() - self._cpu) * 1000, 1),
+            'gc_collections': [
+                generation['collections'] - before for generation, before in zip(gc.get_stats(), self._gc)
+            ],
+            'cold_start': self.cold_start,
+        }
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux
+            profile['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        if self.trace_allocations:
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            self.close()
+            profile['tracemalloc_peak_mb'] = round(peak / 1024 ** 2, 2)
+            profile['top_allocations'] = [
+                f'{statistic.traceback[0].filename}:{statistic.traceback[0].lineno} {statistic.size / 1024:.1f} KiB'
+                for statistic in snapshot.statistics('lineno')[:self.top]
+            ]
+        return profile
+
+    def close(self) -> None:
+        """
+        Stop allocation tracing if this profile started it.
+        """
+        if self.trace_allocations:
+            tracemalloc.stop()
+            self.trace_allocations = False
@@ -0,0 +1,246 @@
+import atexit
+import hashlib
+import threading
+import time
+from abc import ABC
+from abc import abstractmethod
+from dataclasses import dataclass
+from dataclasses import field
+from logging import getLogger
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import TypeVar
+
+from monitor.aws import get_client
+from monitor.messages import BaseMessage
+from monitor.messages import BaseMessageType
+from monitor.monitors import BaseMonitor
+from monitor.resilience import current_deadline
+from monitor.resilience import RetryPolicy
+
+logger = getLogger()
+T = TypeVar('T')
+
+# PutEvents and SendMessageBatch both take at most 10 entries and 256 KB per request
+max_batch_entries = 10
+max_batch_bytes = 256 * 1024
+# request-level errors after which the whole batch is sent again
+throttling_codes = ('Throttling', 'ThrottlingException', 'RequestThrottled', 'InternalFailure', 'ServiceUnavailable')
+
+
+@dataclass(frozen=True)
+class Failure:
+    """
+    Entry of a batch that was not accepted; retryable failures are sent again with the next attempt.
+    """
+    index: int
+    code: str
+    retryable: bool
+
+
+def pack(
+        items: Iterable[T],
+        size: Callable[[T], int],
+        max_entries: int = max_batch_entries,
+        max_bytes: int = max_batch_bytes
+) -> Iterator[list[T]]:
+    """
+    Group items into batches of at most max_entries items and max_bytes bytes, keeping their order.
+    """
+    batch: list[T] = []
+    batch_bytes = 0
+    for item in items:
+        item_bytes = size(item)
+        if batch and (len(batch) >= max_entries or batch_bytes + item_bytes > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(item)
+        batch_bytes += item_bytes
+    if batch:
+        yield batch
+
+
+@dataclass
+class BatchMonitor(BaseMonitor, ABC):
+    """
+    Publish messages as JSON with a batch API.
+
+    With a buffer_size above 1, notify collects messages and sends them once the buffer is full;
+    the rest is sent by flush, which also runs when the interpreter exits. Lambda execution
+    environments are frozen rather than shut down, so handlers should call flush themselves.
+    """
+    buffer_size: int = field(default=1, kw_only=True)
+    retry: RetryPolicy = field(
+        default_factory=lambda: RetryPolicy(attempts=4, base_delay=0.1, max_delay=2), kw_only=True
+    )
+    sleep: Callable[[float], None] = field(default=time.sleep, kw_only=True, repr=False)
+    _buffer: list[BaseMessage] = field(default_factory=list, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.buffer_size > 1:
+            atexit.register(self.flush)
+
+    @abstractmethod
+    def entry(self, message: BaseMessage) -> dict[str, Any]:
+        """
+        Request entry for message.
+        """
+
+    @abstractmethod
+    def entry_size(self, entry: dict[str, Any]) -> int:
+        """
+        Size of entry as the service counts it against the batch limit.
+        """
+
+    @abstractmethod
+    def send_batch(self, entries: list[dict[str, Any]]) -> list[Failure]:
+        """
+        Send one batch and return the entries that were not accepted.
+        """
+
+    def notify(self, message: BaseMessageType) -> bool:
+        """
+        Returns whether the message was delivered or buffered.
+        """
+        with self._lock:
+            self._buffer.append(message)
+            if len(self._buffer) < self.buffer_size:
+                return True
+            messages, self._buffer = self._buffer, []
+        return not self.publish(messages)
+
+    def flush(self) -> list[BaseMessage]:
+        with self._lock:
+            messages, self._buffer = self._buffer, []
+        return self.publish(messages) if messages else []
+
+    def publish(self, messages: Iterable[BaseMessage]) -> list[BaseMessage]:
+        """
+        Send messages in as few requests as possible and return those that were not delivered.
+        """
+        failed = []
+        entries = []
+        for message in messages:
+            entry = self.entry(message)
+            if self.entry_size(entry) > max_batch_bytes:
+                logger.error(f'{type(message).__name__} exceeds the batch size limit of {max_batch_bytes} bytes')
+                failed.append(message)
+            else:
+                entries.append((message, entry))
+        for batch in pack(entries, lambda item: self.entry_size(item[1])):
+            failed.extend(self._send(batch))
+        return failed
+
+    def _send(self, batch: list[tuple[BaseMessage, dict[str, Any]]]) -> list[BaseMessage]:
+        """
+        Send batch, retrying only the entries that failed with a retryable error.
+        """
+        from botocore.exceptions import ClientError
+        name = type(self).__name__
+        failed = []
+        attempt = 0
+        while True:
+            try:
+                failures = self.send_batch([entry for _, entry in batch])
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                failures = [Failure(index, code, code in throttling_codes) for index in range(len(batch))]
+            retryable = [batch[failure.index] for failure in failures if failure.retryable]
+            for failure in failures:
+                if not failure.retryable:
+                    logger.error(f'{name} rejected {type(batch[failure.index][0]).__name__}: {failure.code}')
+                    failed.append(batch[failure.index][0])
+            attempt += 1
+            if not retryable:
+                return failed
+            if attempt >= self.retry.attempts or not self._wait(attempt):
+                logger.error(f'{name} gave up on {len(retryable)} entries after {attempt} attempts')
+                return failed + [message for message, _ in retryable]
+            logger.info(f'{name} retrying {len(retryable)} of {len(batch)} entries (attempt {attempt + 1})')
+            batch = retryable
+
+    def _wait(self, attempt: int) -> bool:
+        """
+        Sleep before the next attempt; returns False if that would outlast the notification deadline.
+        """
+        delay = self.retry.delay(attempt)
+        deadline = current_deadline.get()
+        if deadline is not None and delay >= deadline.remaining():
+            return False
+        self.sleep(delay)
+        return True
+
+
+@dataclass
+class EventBridgeMonitor(BatchMonitor):
+    """
+    Put messages on an event bus; the detail type is the message class name.
+    """
+    event_bus_name: str = 'default'
+    source: str = 'monitor'
+    region_name: str | None = None
+
+    def entry(self, message: BaseMessage) -> dict[str, Any]:
+        return {
+            'Source': self.source,
+            'DetailType': type(message).__name__,
+            'Detail': message.as_json,
+            'EventBusName': self.event_bus_name,
+        }
+
+    def entry_size(self, entry: dict[str, Any]) -> int:
+        # as calculated by EventBridge, with 14 bytes for the event time
+        return 14 + sum(len(entry[key].encode()) for key in ('Source', 'DetailType', 'Detail'))
+
+    def send_batch(self, entries: list[dict[str, Any]]) -> list[Failure]:
+        response = get_client('events', region_name=self.region_name).put_events(Entries=entries)
+        if not response.get('FailedEntryCount'):
+            return []
+        return [
+            Failure(index, result['ErrorCode'], result['ErrorCode'] in throttling_codes)
+            for index, result in enumerate(response['Entries'])
+            if 'ErrorCode' in result
+        ]
+
+
+@dataclass
+class SQSMonitor(BatchMonitor):
+    """
+    Send messages to a queue, with the message class name in the 'type' attribute.
+
+    FIFO queues get message_group_id and a deduplication id derived from the message body.
+    """
+    queue_url: str
+    message_group_id: str | None = None
+    region_name: str | None = None
+
+    def entry(self, message: BaseMessage) -> dict[str, Any]:
+        body = message.as_json
+        entry: dict[str, Any] = {
+            'MessageBody': body,
+            'MessageAttributes': {'type': {'DataType': 'String', 'StringValue': type(message).__name__}},
+        }
+        if self.message_group_id is not None:
+            entry['MessageGroupId'] = self.message_group_id
+            entry['MessageDeduplicationId'] = hashlib.sha256(body.encode()).hexdigest()
+        return entry
+
+    def entry_size(self, entry: dict[str, Any]) -> int:
+        attributes = sum(
+            len(name.encode()) + len(value['DataType'].encode()) + len(value['StringValue'].encode())
+            for name, value in entry['MessageAttributes'].items()
+        )
+        return len(entry['MessageBody'].encode()) + attributes
+
+    def send_batch(self, entries: list[dict[str, Any]]) -> list[Failure]:
+        response = get_client('sqs', region_name=self.region_name).send_message_batch(
+            QueueUrl=self.queue_url,
+            Entries=[{'Id': str(index), **entry} for index, entry in enumerate(entries)]
+        )
+        return [
+            Failure(int(result['Id']), result['Code'], not result['SenderFault'])
+            for result in response.get('Failed', [])
+        ]
@@ -0,0 +1,256 @@
+import contextvars
+import random
+import threading
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from logging import getLogger
+from typing import Awaitable
+from typing import Callable
+from typing import TypeVar
+
+from monitor.context import request_counters
+
+logger = getLogger()
+T = TypeVar('T')
+
+
+class RetryableError(Exception):
+    """
+    Transient transport failure, e.g. a timeout, HTTP 429/5xx or SES throttling.
+    """
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    """
+    The notification budget of the current invocation is used up.
+    """
+
+
+@dataclass
+class Deadline:
+    """
+    Point in time by which notifications have to be done, e.g. shortly before the Lambda timeout.
+    """
+    expires_at: float
+    clock: Callable[[], float] = time.monotonic
+
+    @classmethod
+    def from_context(cls, context, margin: float, clock: Callable[[], float] = time.monotonic) -> 'Deadline | None':
+        """
+        Deadline margin seconds before the invocation times out, None for contexts without a timeout.
+        """
+        if not hasattr(context, 'get_remaining_time_in_millis'):
+            return None
+        return cls(clock() + context.get_remaining_time_in_millis() / 1000 - margin, clock)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+current_deadline: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar('current_deadline', default=None)
+
+
+def fit_timeout(timeout: float) -> float:
+    """
+    Shorten a per-attempt timeout to the time left before the current deadline.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return timeout
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded('No time left to notify')
+    return min(timeout, remaining)
+
+
+@dataclass
+class ResilienceStats:
+    retries: int = 0
+    rejected: int = 0
+
+
+stats = ResilienceStats()
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 3
+    base_delay: float = 0.2
+    max_delay: float = 5
+    min_delay: float = 0
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """
+        Exponential backoff with full jitter, at least min_delay; a Retry-After from the server takes precedence.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(self.min_delay, max(self.min_delay, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+
+@dataclass
+class TokenBucket:
+    rate: float
+    capacity: float
+    clock: Callable[[], float] = time.monotonic
+    _tokens: float = field(init=False)
+    _updated: float = field(init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        self._tokens = self.capacity
+        self._updated = self.clock()
+
+    def reserve(self) -> float:
+        """
+        Take a token and return the number of seconds to wait before using it.
+        """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+
+@dataclass
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and lets a single trial
+    call through once reset_timeout seconds have passed.
+    """
+    failure_threshold: int = 5
+    reset_timeout: float = 30
+    clock: Callable[[], float] = time.monotonic
+    _failures: int = field(default=0, init=False)
+    _opened_at: float | None = field(default=None, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self.clock() - self._opened_at >= self.reset_timeout:
+                # half-open: let one trial through and block the rest until it reports back
+                self._opened_at = self.clock()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+
+
+@dataclass
+class Resilience:
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    bucket: TokenBucket | None = None
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    sleep: Callable[[float], None] = time.sleep
+
+    def call(self, func: Callable[[], T]) -> T:
+        """
+        Call func, retrying on RetryableError. When all attempts fail, the original
+        cause is raised if there is one.
+
+        Within a deadline (see current_deadline), waits that would outlast it raise DeadlineExceeded instead.
+        """
+        self._check_circuit()
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.sleep(self._fit_delay(self.bucket.reserve()))
+            try:
+                result = func()
+            except RetryableError as error:
+                attempt += 1
+                self.sleep(self._fit_delay(self._retry_delay(error, attempt), error))
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def acall(self, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Like call, for coroutine functions; waits without blocking the event loop.
+        """
+        import asyncio
+        self._check_circuit()
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                await asyncio.sleep(self._fit_delay(self.bucket.reserve()))
+            try:
+                result = await func()
+            except RetryableError as error:
+                attempt += 1
+                await asyncio.sleep(self._fit_delay(self._retry_delay(error, attempt), error))
+            else:
+                self.breaker.record_success()
+                return result
+
+    def _check_circuit(self) -> None:
+        if not self.breaker.allow():
+            stats.rejected += 1
+            if (counters := request_counters()) is not None:
+                counters.rejected += 1
+            raise CircuitOpenError('Circuit is open, endpoint considered unhealthy')
+
+    @staticmethod
+    def _fit_delay(delay: float, error: Exception | None = None) -> float:
+        deadline = current_deadline.get()
+        if deadline is not None and delay >= deadline.remaining():
+            raise DeadlineExceeded(f'Waiting {delay:.2f}s would exceed the notification deadline') from error
+        return delay
+
+    def _retry_delay(self, error: RetryableError, attempt: int) -> float:
+        """
+        Return the delay before the next attempt, or raise if this was the last one.
+        """
+        if attempt >= self.retry.attempts:
+            self.breaker.record_failure()
+            raise error.__cause__ or error
+        stats.retries += 1
+        if (counters := request_counters()) is not None:
+            counters.retries += 1
+        delay = self.retry.delay(attempt, error.retry_after)
+        logger.info(f'{error}, retrying in {delay:.2f}s (attempt {attempt + 1}/{self.retry.attempts})')
+        return delay
+
+
+_registry: dict[str, Resilience] = {}
+_registry_lock = threading.Lock()
+
+
+def get_resilience(key: str, factory: Callable[[], Resilience] = Resilience) -> Resilience:
+    """
+    Return the Resilience shared by all senders for key (e.g. one Slack channel),
+    created by factory on first use.
+    """
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = factory()
+        return _registry[key]
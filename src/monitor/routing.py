@@ -0,0 +1,116 @@
+import fnmatch
+import os
+import random
+import re
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+
+from monitor.messages import BaseMessage
+from monitor.messages import ErrorMessage
+from monitor.messages import LambdaErrorMessage
+from monitor.messages import StepFunctionFailureMessage
+
+# sink name of rules that discard matching messages
+drop = 'drop'
+# severities that notify everyone in a Slack channel
+mention_severities = ('critical', 'error')
+
+
+def current_env() -> str:
+    """
+    Target environment, read on every call so that it can change after import.
+    """
+    return os.environ.get('APP_ENV', 'dev')
+
+
+def message_attributes(message: BaseMessage, env: str) -> dict[str, str]:
+    """
+    Values that rules match against; missing values are empty strings.
+    """
+    match message:
+        case LambdaErrorMessage():
+            function_name = message.envs.get('lambda_function_name', '')
+            state_machine = ''
+        case StepFunctionFailureMessage():
+            function_name = ''
+            state_machine = message.state_machine_arn or ''
+        case _:
+            function_name = state_machine = ''
+    return {
+        'kind': 'error' if isinstance(message, ErrorMessage) else 'info',
+        'error_name': getattr(message, 'name', ''),
+        'function_name': function_name,
+        'state_machine': state_machine,
+        'env': env,
+    }
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    Route matching messages to sink with severity, forwarding a sample_rate fraction of them.
+
+    Conditions are shell-style patterns (e.g. 'Dbt*', '*:stateMachine:ExtractLoad-*'); a rule
+    without conditions matches every message. All patterns are compiled when the rule is created.
+    """
+    sink: str
+    severity: str = 'info'
+    sample_rate: float = 1.0
+    kind: str | None = None  # 'error' or 'info'
+    error_name: str | None = None
+    function_name: str | None = None
+    state_machine: str | None = None
+    env: str | None = None
+    _matchers: tuple[tuple[str, re.Pattern], ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        matchers = tuple(
+            (name, re.compile(fnmatch.translate(pattern)))
+            for name in ('kind', 'error_name', 'function_name', 'state_machine', 'env')
+            if (pattern := getattr(self, name)) is not None
+        )
+        object.__setattr__(self, '_matchers', matchers)
+
+    def matches(self, attributes: dict[str, str]) -> bool:
+        return all(pattern.match(attributes[name]) for name, pattern in self._matchers)
+
+
+@dataclass(frozen=True)
+class Route:
+    sink: str
+    severity: str
+
+
+# the routing that SlackMonitor uses without a router: errors to the alert channel, the rest to info
+default_rules = (
+    Rule(sink='alert', severity='error', kind='error'),
+    Rule(sink='info', severity='info'),
+)
+
+
+@dataclass
+class Router:
+    """
+    First matching rule wins; messages that match no rule, a 'drop' rule or fall outside
+    the sample are not routed.
+    """
+    rules: list[Rule] | tuple[Rule, ...] = default_rules
+    sample: Callable[[], float] = random.random
+
+    @classmethod
+    def from_table(cls, table: list[dict[str, Any]]) -> 'Router':
+        """
+        Router from plain rule dicts, e.g. loaded from a JSON config file.
+        """
+        return cls([Rule(**row) for row in table])
+
+    def route(self, message: BaseMessage, env: str | None = None) -> Route | None:
+        attributes = message_attributes(message, env or current_env())
+        for rule in self.rules:
+            if rule.matches(attributes):
+                if rule.sink == drop or (rule.sample_rate < 1 and self.sample() >= rule.sample_rate):
+                    return None
+                return Route(rule.sink, rule.severity)
+        return None
@@ -0,0 +1,221 @@
+import itertools
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+from typing import Callable
+
+from monitor.aws import get_client
+from monitor.resilience import RetryPolicy
+
+# polling interval grows from 1s to 15s; jitter spreads the describe_execution calls of a large matrix
+# without polling more often than once a second
+poll_policy = RetryPolicy(base_delay=1, max_delay=15, min_delay=1)
+
+
+def aws_region() -> str:
+    return os.environ.get('AWS_REGION', 'eu-central-1')
+
+
+def aws_account_id() -> str:
+    try:
+        return os.environ['AWS_ACCOUNT_ID']
+    except KeyError:
+        raise KeyError('AWS_ACCOUNT_ID environment variable not set')
+
+
+def state_machine_arn(name: str, env: str) -> str:
+    return f'arn:aws:states:{aws_region()}:{aws_account_id()}:stateMachine:{name}-{env}'
+
+
+def function_arn(name: str, env: str) -> str:
+    return f'arn:aws:lambda:{aws_region()}:{aws_account_id()}:function:{name}-{env}'
+
+
+def execution_link(execution_arn: str) -> str:
+    region = aws_region()
+    return f'https://{region}.console.aws.amazon.com/states/home?region={region}#/v2/executions/details/{execution_arn}'
+
+
+def job_queue_payload(table_names: list[str], fail: bool) -> dict[str, Any]:
+    return {
+        'task_type': 'ScheduleTask',
+        'job_id': 'test job id',
+        'task_id': 'test task id',
+        'table_names': table_names,
+        'options': {
+            'test_error': True,
+            'fail_on_error': fail
+        }
+    }
+
+
+def transform_function_payload(mode: str) -> dict[str, Any]:
+    return {'args': [f'x-{mode}']}
+
+
+def extractload_function_payload(fail: bool) -> dict[str, Any]:
+    return {
+        'task_type': 'ErrorTask',
+        'job_id': 'test job id',
+        'task_id': 'test task id',
+        'database_name': 'test database',
+        'schema_name': 'test schema',
+        'table_name': 'test table',
+        'envs': {'FAIL_ON_ERROR': str(fail)}
+    }
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    Error handling test case; payload builds the input for one of the fail modes.
+
+    Fail mode 'error' reports the error and lets the execution succeed, 'fail' fails it.
+    """
+    name: str
+    kind: str  # 'statemachine' or 'lambda'
+    target: str
+    payload: Callable[[str], Any]
+    fail_modes: tuple[str, ...] = ('error', 'fail')
+
+
+scenarios = {
+    scenario.name: scenario for scenario in (
+        # empty table_names raises the test error in ScheduleTask
+        Scenario('schedule', 'statemachine', 'ExtractLoadJobQueue', lambda mode: job_queue_payload([], mode == 'fail')),
+        # any table name raises the test error in ExtractLoadJob
+        Scenario(
+            'extractload', 'statemachine', 'ExtractLoadJobQueue',
+            lambda mode: job_queue_payload(['any'], mode == 'fail')
+        ),
+        Scenario('transform', 'statemachine', 'Transform', lambda mode: [[f'x-{mode}']], ('error', 'fail', 'test')),
+        Scenario(
+            'lambda-extractload', 'lambda', 'ExtractLoadFunction',
+            lambda mode: extractload_function_payload(mode == 'fail')
+        ),
+        Scenario(
+            'lambda-transform', 'lambda', 'TransformFunction',
+            transform_function_payload, ('error', 'fail', 'test')
+        ),
+    )
+}
+
+
+@dataclass(frozen=True)
+class Case:
+    scenario: Scenario
+    env: str
+    fail_mode: str
+
+
+@dataclass
+class RunResult:
+    scenario: str
+    env: str
+    fail_mode: str
+    status: str
+    duration: float
+    arn: str
+    error: str | None = None
+
+
+def matrix(names: list[str], envs: list[str], fail_modes: list[str] | None = None) -> list[Case]:
+    """
+    All combinations of scenarios, envs and fail modes; modes a scenario does not support are skipped.
+    """
+    return [
+        Case(scenarios[name], env, mode)
+        for name, env in itertools.product(names, envs)
+        for mode in scenarios[name].fail_modes
+        if fail_modes is None or mode in fail_modes
+    ]
+
+
+def run_case(case: Case, timeout: float = 900, sleep: Callable[[float], None] = time.sleep) -> RunResult:
+    start = time.perf_counter()
+    try:
+        if case.scenario.kind == 'lambda':
+            return invoke_case(case, start)
+        return execute_case(case, start, timeout, sleep)
+    except Exception as e:
+        return RunResult(
+            case.scenario.name, case.env, case.fail_mode, 'ERROR', time.perf_counter() - start, '', repr(e)
+        )
+
+
+def execute_case(case: Case, start: float, timeout: float, sleep: Callable[[float], None]) -> RunResult:
+    client = get_client('stepfunctions', region_name=aws_region())
+    response = client.start_execution(
+        stateMachineArn=state_machine_arn(case.scenario.target, case.env),
+        name=f'Test-Error-Handling-{uuid.uuid4()}',
+        input=json.dumps(case.scenario.payload(case.fail_mode)),
+    )
+    execution_arn = response['executionArn']
+    attempt = 0
+    while True:
+        execution = client.describe_execution(executionArn=execution_arn)
+        if execution['status'] != 'RUNNING':
+            break
+        if time.perf_counter() - start > timeout:
+            return RunResult(
+                case.scenario.name, case.env, case.fail_mode, 'RUNNING', time.perf_counter() - start,
+                execution_arn, f'still running after {timeout:g}s'
+            )
+        attempt += 1
+        sleep(poll_policy.delay(attempt))
+    if 'stopDate' in execution:
+        duration = (execution['stopDate'] - execution['startDate']).total_seconds()
+    else:
+        duration = time.perf_counter() - start
+    return RunResult(
+        case.scenario.name, case.env, case.fail_mode, execution['status'], duration,
+        execution_arn, execution.get('error')
+    )
+
+
+def invoke_case(case: Case, start: float) -> RunResult:
+    arn = function_arn(case.scenario.target, case.env)
+    response = get_client('lambda', region_name=aws_region()).invoke(
+        FunctionName=arn,
+        Payload=json.dumps(case.scenario.payload(case.fail_mode))
+    )
+    payload = json.loads(response['Payload'].read() or 'null')
+    error = response.get('FunctionError')
+    if error is None and isinstance(payload, dict) and payload.get('statusCode') == 500:
+        # the wrapper reported the error and returned normally
+        error = payload['message'].get('name')
+    return RunResult(
+        case.scenario.name, case.env, case.fail_mode, 'FAILED' if 'FunctionError' in response else 'SUCCEEDED',
+        time.perf_counter() - start, arn, error
+    )
+
+
+def run_matrix(
+        cases: list[Case],
+        max_workers: int = 8,
+        timeout: float = 900,
+        sleep: Callable[[float], None] = time.sleep
+) -> list[RunResult]:
+    """
+    Run all cases concurrently and wait for each execution to finish, at most timeout seconds.
+    """
+    if not cases:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='monitor-run') as executor:
+        return list(executor.map(lambda case: run_case(case, timeout, sleep), cases))
+
+
+def render_table(results: list[RunResult]) -> str:
+    header = ('Scenario', 'Env', 'Mode', 'Status', 'Duration', 'Error')
+    rows = [header] + [
+        (r.scenario, r.env, r.fail_mode, r.status, f'{r.duration:.1f}s', r.error or '')
+        for r in results
+    ]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
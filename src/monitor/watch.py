@@ -0,0 +1,160 @@
+import datetime
+import importlib
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+from logging import getLogger
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import TypeVar
+
+from monitor import codec
+from monitor.aws import get_client
+from monitor.messages import from_event
+from monitor.monitors import BaseMonitor
+
+logger = getLogger()
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+@dataclass
+class Checkpoint:
+    """
+    Newest stop date (epoch milliseconds) seen for a state machine and the executions that stopped then.
+    """
+    stop_date: int
+    execution_arns: list[str] = field(default_factory=list)
+
+    def is_new(self, execution: dict) -> bool:
+        stop_date = epoch_millis(execution['stopDate'])
+        return stop_date > self.stop_date or (
+            stop_date == self.stop_date and execution['executionArn'] not in self.execution_arns
+        )
+
+    def advance(self, execution: dict) -> None:
+        stop_date = epoch_millis(execution['stopDate'])
+        if stop_date > self.stop_date:
+            self.stop_date, self.execution_arns = stop_date, [execution['executionArn']]
+        elif stop_date == self.stop_date:
+            self.execution_arns.append(execution['executionArn'])
+
+
+def epoch_millis(date: datetime.datetime) -> int:
+    return int(date.timestamp() * 1000)
+
+
+def load_checkpoints(path: str) -> dict[str, Checkpoint]:
+    try:
+        with open(path, 'rb') as file:
+            data = codec.loads(file.read())
+    except FileNotFoundError:
+        return {}
+    return {arn: Checkpoint(**checkpoint) for arn, checkpoint in data.items()}
+
+
+def save_checkpoints(path: str, checkpoints: dict[str, Checkpoint]) -> None:
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(codec.dumps_bytes({arn: asdict(c) for arn, c in checkpoints.items()}, indent=True))
+    os.replace(temp_path, path)
+
+
+def load_monitor(spec: str) -> BaseMonitor:
+    """
+    Resolve 'module:attribute' to a monitor; classes are instantiated without arguments.
+    """
+    module_name, _, attribute = spec.partition(':')
+    if not attribute:
+        raise ValueError(f'Expected module:attribute, got {spec!r}')
+    monitor = getattr(importlib.import_module(module_name), attribute)
+    return monitor() if isinstance(monitor, type) else monitor
+
+
+def failed_executions(client: Any, state_machine_arn: str, checkpoint: Checkpoint, lookback: float) -> Iterator[dict]:
+    """
+    Yield failed executions that stopped after the checkpoint, newest first.
+
+    Executions are listed by start date, so paging stops at executions that started more than
+    lookback seconds before the checkpoint; longer running executions are not picked up.
+    """
+    oldest_start = checkpoint.stop_date - lookback * 1000
+    paginator = client.get_paginator('list_executions')
+    for page in paginator.paginate(stateMachineArn=state_machine_arn, statusFilter='FAILED'):
+        for execution in page['executions']:
+            if epoch_millis(execution['startDate']) < oldest_start:
+                return
+            if checkpoint.is_new(execution):
+                yield execution
+
+
+def bounded_map(executor: Executor, func: Callable[[T], R], items: Iterable[T], limit: int) -> Iterator[R]:
+    """
+    Like executor.map, but consumes items lazily and keeps at most limit calls in flight.
+    """
+    futures: deque[Future[R]] = deque()
+    for item in items:
+        if len(futures) >= limit:
+            yield futures.popleft().result()
+        futures.append(executor.submit(func, item))
+    while futures:
+        yield futures.popleft().result()
+
+
+def failure_event(execution: dict) -> dict:
+    """
+    Shape a describe_execution response like the failure event a catch handler receives.
+    """
+    return {
+        'Error': execution.get('error', 'States.Failed'),
+        'Cause': execution.get('cause', ''),
+        'ExecutionArn': execution['executionArn'],
+        'StateMachineArn': execution['stateMachineArn'],
+        'Input': execution.get('input'),
+        'StartDate': epoch_millis(execution['startDate']),
+        'StopDate': epoch_millis(execution['stopDate']),
+    }
+
+
+def watch(
+        state_machine_arns: list[str],
+        monitor: BaseMonitor,
+        checkpoint_path: str,
+        lookback: float = 24 * 3600,
+        max_workers: int = 8,
+        client: Any = None
+) -> int:
+    """
+    Notify monitor of executions that failed since the last call and return how many there were.
+
+    Without a checkpoint, a state machine is scanned for failures of the last lookback seconds.
+    The checkpoint file is updated after each state machine.
+    """
+    client = client or get_client('stepfunctions')
+    checkpoints = load_checkpoints(checkpoint_path)
+    count = 0
+
+    def describe(execution: dict) -> dict:
+        return client.describe_execution(executionArn=execution['executionArn'])
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='monitor-watch') as executor:
+        for state_machine_arn in state_machine_arns:
+            checkpoint = checkpoints.get(state_machine_arn) or Checkpoint(int((time.time() - lookback) * 1000))
+            executions = failed_executions(client, state_machine_arn, checkpoint, lookback)
+            updated = Checkpoint(checkpoint.stop_date, list(checkpoint.execution_arns))
+            for execution in bounded_map(executor, describe, executions, max_workers):
+                monitor.notify(from_event(failure_event(execution)))
+                updated.advance(execution)
+                count += 1
+            checkpoints[state_machine_arn] = updated
+            save_checkpoints(checkpoint_path, checkpoints)
+    logger.info(f'Found {count} new failed execution(s)')
+    return count
@@ -1,55 +1,435 @@
+import contextlib
 import functools
+import inspect
 import logging
 import os
+import time
+from dataclasses import dataclass
 from typing import Any
+from typing import TYPE_CHECKING
+from typing import Awaitable
 from typing import Callable
 
+from monitor.context import current_request
+from monitor.context import RequestContext
+from monitor.digest import DigestMonitor
+from monitor.dispatch import dispatcher
+from monitor.logs import log_failure
+from monitor.messages import BaseMessage
 from monitor.messages import ErrorMessage
 from monitor.messages import LambdaErrorMessage
 from monitor.messages import SimpleMessage
+from monitor.metrics import counter_metrics
+from monitor.metrics import Metrics
+from monitor.monitors import adeliver
 from monitor.monitors import BaseMonitor
+from monitor.monitors import deliver
+from monitor.monitors import Outbox
+from monitor.monitors import sink_results
+from monitor.monitors import SinkResult
+from monitor.offload import cause_size
+from monitor.offload import Offloader
+from monitor.offload import shrink
+from monitor.offload import step_functions_budget
+from monitor.profiling import InvocationProfile
+from monitor.resilience import current_deadline
+from monitor.resilience import Deadline
+from monitor.resilience import DeadlineExceeded
+
+if TYPE_CHECKING:
+    import asyncio
 
 payload = dict[str, Any]
 
+# set after the first invocation of any monitored handler in this execution environment
+_warm = False
+
 
 class LambdaException(Exception):
     pass
 
 
+def take_cold_start() -> bool:
+    global _warm
+    cold_start, _warm = not _warm, True
+    return cold_start
+
+
+def fail_on_error() -> bool:
+    return os.environ.get('FAIL_ON_ERROR', 'false').lower() == 'true'
+
+
+@dataclass(frozen=True)
+class Options:
+    monitor: BaseMonitor
+    notify_hook: Callable[[Any], str | None]
+    background: bool
+    flush_timeout: float
+    metrics: bool
+    metrics_namespace: str
+    profile: bool
+    trace_allocations: bool
+    outbox: Outbox | None
+    size_budget: int
+    offloader: Offloader | None
+    deadline_margin: float
+    structured_logs: bool
+
+
+class Invocation:
+    """
+    State of one monitored invocation, shared by the sync and async wrappers.
+    """
+
+    def __init__(self, options: Options, event: payload, context: Any):
+        self.options = options
+        self.event = event
+        self.context = context
+        self.cold_start = take_cold_start()
+        # scoped to the calling thread or task, so concurrent invocations do not see each other's request
+        self.request = RequestContext.from_invocation(event, context, self.cold_start)
+        self.request_token = current_request.set(self.request)
+        self.error_name: str | None = None
+        self.notify_seconds = 0.0
+        self.handler_seconds = 0.0
+        # background notification tasks and the (message, spooled_at) they deliver
+        self.tasks: dict[asyncio.Task, tuple[BaseMessage, float | None]] = {}
+        self.profile = InvocationProfile(self.cold_start, options.trace_allocations) if options.profile else None
+        # notifications have to be done deadline_margin seconds before the invocation times out
+        self.deadline = Deadline.from_context(context, options.deadline_margin)
+        self.deadline_token = current_deadline.set(self.deadline)
+        # filled by composite monitors, also from background workers, which run in a copy of this context
+        self.sink_results: list[SinkResult] = []
+        self.sink_results_token = sink_results.set(self.sink_results)
+
+    def handler_finished(self) -> None:
+        self.handler_seconds = self.request.elapsed()
+
+    def hook_message(self, response: Any) -> BaseMessage | None:
+        if text := self.options.notify_hook(response):
+            if 'error' in response:
+                self.error_name = response['error']
+                return ErrorMessage(name=response['error'], text=text)
+            return SimpleMessage(text=text)
+        return None
+
+    def error_message(self, error: Exception) -> LambdaErrorMessage:
+        self.handler_finished()
+        self.error_name = type(error).__name__
+        if not self.options.structured_logs:
+            logging.error(error, exc_info=True)
+        message = LambdaErrorMessage.from_error(
+            error, self.event, self.context,
+            profile=self.profile.as_dict() if self.profile else None
+        )
+        if self.options.structured_logs:
+            log_failure(message, error, self.event, self.request)
+        return message
+
+    def compact(self, message: LambdaErrorMessage) -> LambdaErrorMessage:
+        """
+        Shorten message to fit size_budget once embedded in a Step Functions error cause.
+        """
+        return shrink(message, self.options.size_budget, self.options.offloader, cause_size)
+
+    def take_spooled(self) -> list[tuple[float, BaseMessage]]:
+        if self.options.outbox is None:
+            return []
+        entries = self.options.outbox.take()
+        if entries:
+            logging.info(f'Replaying {len(entries)} spooled notification(s)')
+        return entries
+
+    @contextlib.contextmanager
+    def replay_budget(self):
+        """
+        Limit notifications to flush_timeout seconds, so that replaying adds little to the invocation's
+        latency; messages that do not fit are spooled again.
+        """
+        deadline = self.deadline
+        self.deadline = Deadline(time.monotonic() + self.flush_timeout())
+        token = current_deadline.set(self.deadline)
+        try:
+            yield
+        finally:
+            current_deadline.reset(token)
+            self.deadline = deadline
+
+    def replay(self) -> None:
+        with self.replay_budget():
+            for spooled_at, message in self.take_spooled():
+                self.notify(message, spooled_at)
+
+    async def areplay(self) -> None:
+        with self.replay_budget():
+            for spooled_at, message in self.take_spooled():
+                await self.anotify(message, spooled_at)
+
+    def out_of_time(self) -> bool:
+        return self.deadline is not None and self.deadline.expired
+
+    def flush_timeout(self) -> float:
+        if self.deadline is None:
+            return self.options.flush_timeout
+        return min(self.options.flush_timeout, self.deadline.remaining())
+
+    def fallback(self, message: BaseMessage, spooled_at: float | None = None) -> None:
+        """
+        Cheapest way to keep a message once the notification budget is used up or it was not
+        delivered: spool it, or log it.
+        """
+        if self.options.outbox is not None:
+            self.options.outbox.spool(message, spooled_at)
+        else:
+            reason = 'No time left to notify' if self.out_of_time() else 'Notification failed'
+            logging.error(f'{reason}, {type(message).__name__} only logged:\n{message.as_str}')
+
+    def notify(self, message: BaseMessage, spooled_at: float | None = None) -> None:
+        if self.out_of_time():
+            self.fallback(message, spooled_at)
+            return
+        if self.options.background:
+            dispatcher.submit(self.options.monitor, message, self.options.outbox, spooled_at, self.fallback)
+            return
+        start = time.perf_counter()
+        try:
+            delivered = deliver(self.options.monitor, message, self.options.outbox, spooled_at)
+        except DeadlineExceeded:
+            self.fallback(message, spooled_at)
+        else:
+            # senders like SlackChannel report running out of time as not delivered; with an outbox,
+            # deliver has spooled the message already
+            if not delivered and self.options.outbox is None:
+                self.fallback(message, spooled_at)
+        finally:
+            self.notify_seconds += time.perf_counter() - start
+
+    async def anotify(self, message: BaseMessage, spooled_at: float | None = None) -> None:
+        import asyncio
+        if self.out_of_time():
+            self.fallback(message, spooled_at)
+            return
+        if self.options.background:
+            # runs concurrently with the rest of the handler's event loop work
+            task = asyncio.create_task(self._timed_anotify(message, spooled_at))
+            self.tasks[task] = (message, spooled_at)
+            return
+        await self._timed_anotify(message, spooled_at)
+
+    async def _timed_anotify(self, message: BaseMessage, spooled_at: float | None = None) -> None:
+        start = time.perf_counter()
+        try:
+            delivered = await adeliver(self.options.monitor, message, self.options.outbox, spooled_at)
+        except DeadlineExceeded:
+            self.fallback(message, spooled_at)
+        else:
+            if not delivered and self.options.outbox is None:
+                self.fallback(message, spooled_at)
+        finally:
+            self.notify_seconds += time.perf_counter() - start
+
+    def flush_digest(self) -> None:
+        """
+        Send the messages a digest monitor buffered; its timer does not run while the environment is frozen.
+        """
+        if isinstance(self.options.monitor, DigestMonitor):
+            start = time.perf_counter()
+            self.options.monitor.flush(self.options.outbox)
+            self.notify_seconds += time.perf_counter() - start
+
+    def finish(self) -> None:
+        if self.profile is not None:
+            self.profile.close()
+        # after the handler, so that retrying an endpoint that failed before does not delay it
+        self.replay()
+        if self.options.background:
+            self.notify_seconds += flush_background(
+                self.handler_seconds, self.flush_timeout(), self.options.outbox, self.request
+            )
+        self.flush_digest()
+        self.emit_metrics()
+        self.reset_context()
+
+    async def afinish(self) -> None:
+        import asyncio
+        if self.profile is not None:
+            self.profile.close()
+        await self.areplay()
+        if self.tasks:
+            timeout = self.flush_timeout()
+            _, pending = await asyncio.wait(self.tasks, timeout=timeout)
+            if pending:
+                logging.warning(f'{len(pending)} notification(s) still pending after {timeout:.1f}s')
+                if self.options.outbox is not None:
+                    for task in pending:
+                        task.cancel()
+                        self.options.outbox.spool(*self.tasks[task])
+            logging.info(f'Handler took {self.handler_seconds:.3f}s, notifications took {self.notify_seconds:.3f}s')
+        if isinstance(self.options.monitor, DigestMonitor):
+            await asyncio.to_thread(self.flush_digest)
+        self.emit_metrics()
+        self.reset_context()
+
+    def reset_context(self) -> None:
+        current_deadline.reset(self.deadline_token)
+        current_request.reset(self.request_token)
+        sink_results.reset(self.sink_results_token)
+
+    def emit_metrics(self) -> None:
+        if not self.options.metrics:
+            return
+        metrics = Metrics.for_function(self.options.metrics_namespace)
+        metrics.put('HandlerDuration', self.handler_seconds * 1000, 'Milliseconds')
+        metrics.put('ColdStart', int(self.cold_start))
+        for name, value in counter_metrics(self.request.counters).items():
+            metrics.put(name, value)
+        metrics.put(
+            'NotifyDuration', self.notify_seconds * 1000, 'Milliseconds',
+            dimension=('Monitor', type(self.options.monitor).__name__)
+        )
+        if self.error_name is not None:
+            metrics.put('Errors', 1, dimension=('ErrorName', self.error_name))
+        metrics.emit()
+        # a document has one value per dimension, so each sink of a composite monitor gets its own line
+        sink_seconds: dict[str, float] = {}
+        for result in self.sink_results:
+            sink_seconds[result.name] = sink_seconds.get(result.name, 0.0) + result.latency
+        for name, seconds in sink_seconds.items():
+            sink_metrics = Metrics(metrics.namespace, {**metrics.dimensions, 'Monitor': name})
+            sink_metrics.put('NotifyDuration', seconds * 1000, 'Milliseconds')
+            sink_metrics.emit()
+
+
 # noinspection PyUnusedLocal
 def lambda_monitor(
         monitor: BaseMonitor,
-        notify_hook: Callable[[Any], str | None] = lambda x: None
+        notify_hook: Callable[[Any], str | None] = lambda x: None,
+        background: bool = False,
+        flush_timeout: float = 2.0,
+        metrics: bool = False,
+        metrics_namespace: str = 'LambdaMonitor',
+        profile: bool = False,
+        trace_allocations: bool = False,
+        outbox: Outbox | None = None,
+        size_budget: int = step_functions_budget,
+        offloader: Offloader | None = None,
+        deadline_margin: float = 1.0,
+        structured_logs: bool = False
 ):
     """
     Decorator factory for AWS Lambda handlers
+
+    Coroutine handlers get an async wrapper that notifies via monitor.anotify.
+    With background=True, notifications are sent from a worker thread (or as tasks on the
+    event loop) and flushed, waiting at most flush_timeout seconds, before the handler returns or raises.
+    With metrics=True, one CloudWatch EMF log line is written per invocation, plus one with the
+    notify duration of each sink of a composite monitor.
+    With profile=True, error messages include the resource usage of the failed invocation
+    (trace_allocations=True adds tracemalloc peak and top allocation sites).
+    With an outbox, notifications that fail or are still pending after flush_timeout are spooled
+    to disk and replayed once the next invocation's handler is done (in the background if background=True),
+    for at most flush_timeout seconds.
+    Error messages raised or returned to Step Functions are shortened to size_budget bytes; with an
+    offloader, the complete message is stored in S3 and referenced by payload_ref.
+    Notifications get the invocation's remaining time minus deadline_margin seconds; Slack timeouts,
+    retries and the background flush are shortened to fit, and once the time is used up, messages
+    are spooled to the outbox or only logged.
+    A DigestMonitor is flushed after each invocation, so that no message waits in a frozen environment.
+    With structured_logs=True, a failure is logged as one record with request_id, error_name,
+    traceback and event fields instead of a formatted traceback; see monitor.logs.install_json_logging.
     """
+    options = Options(
+        monitor=monitor,
+        notify_hook=notify_hook,
+        background=background,
+        flush_timeout=flush_timeout,
+        metrics=metrics,
+        metrics_namespace=metrics_namespace,
+        profile=profile,
+        trace_allocations=trace_allocations,
+        outbox=outbox,
+        size_budget=size_budget,
+        offloader=offloader,
+        deadline_margin=deadline_margin,
+        structured_logs=structured_logs,
+    )
 
-    def decorator(func: Callable[[payload, Any], payload]):
+    def decorator(func: Callable[[payload, Any], payload] | Callable[[payload, Any], Awaitable[payload]]):
+        if inspect.iscoroutinefunction(func):
+            return async_wrapper(func, options)
 
         @functools.wraps(func)
         def wrapper(event: payload, context: Any):
-            os.environ['AWS_REQUEST_ID'] = context.aws_request_id
+            invocation = Invocation(options, event, context)
             try:
                 response = func(event, context)
-                if text := notify_hook(response):
-                    if 'error' in response:
-                        monitor.notify(ErrorMessage(name=response['error'], text=text))
-                    else:
-                        monitor.notify(SimpleMessage(text=text))
+                invocation.handler_finished()
+                if message := invocation.hook_message(response):
+                    invocation.notify(message)
             except Exception as error:
-                logging.error(error, exc_info=True)
-                message = LambdaErrorMessage.from_error(error, event, context)
-                if os.environ.get('FAIL_ON_ERROR', 'false').lower() == 'true':
-                    raise LambdaException(message.as_json)
+                message = invocation.error_message(error)
+                if fail_on_error():
+                    raise LambdaException(invocation.compact(message).as_json)
                 else:
-                    monitor.notify(message)
+                    invocation.notify(message)
                     return {
                         'statusCode': 500,
-                        'message': message.as_dict
+                        'message': invocation.compact(message).as_dict
                     }
+            finally:
+                invocation.finish()
             return response
 
         return wrapper
 
     return decorator
+
+
+def async_wrapper(func: Callable[[payload, Any], Awaitable[payload]], options: Options):
+
+    @functools.wraps(func)
+    async def wrapper(event: payload, context: Any):
+        import asyncio
+        invocation = Invocation(options, event, context)
+        try:
+            response = await func(event, context)
+            invocation.handler_finished()
+            if message := invocation.hook_message(response):
+                await invocation.anotify(message)
+        except Exception as error:
+            message = invocation.error_message(error)
+            if fail_on_error():
+                raise LambdaException((await asyncio.to_thread(invocation.compact, message)).as_json)
+            else:
+                await invocation.anotify(message)
+                return {
+                    'statusCode': 500,
+                    'message': (await asyncio.to_thread(invocation.compact, message)).as_dict
+                }
+        finally:
+            await invocation.afinish()
+        return response
+
+    return wrapper
+
+
+def flush_background(
+        handler_seconds: float,
+        timeout: float,
+        outbox: Outbox | None = None,
+        request: RequestContext | None = None
+) -> float:
+    """
+    Flush the queued notifications of request and report notification time separately from handler time.
+
+    With an outbox, notifications the worker has not started within timeout are spooled instead.
+    Notifications of other requests running concurrently are neither waited for nor spooled.
+    """
+    if not dispatcher.flush(timeout, request):
+        logging.warning(f'{dispatcher.pending_for(request)} notification(s) still pending after {timeout:.1f}s')
+        if outbox is not None:
+            for _, message, job_outbox, spooled_at, _, _, _ in dispatcher.drain(request):
+                (job_outbox or outbox).spool(message, spooled_at)
+    notify_seconds = dispatcher.take_notify_seconds(request)
+    logging.info(f'Handler took {handler_seconds:.3f}s, notifications took {notify_seconds:.3f}s')
+    return notify_seconds
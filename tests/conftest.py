@@ -0,0 +1,151 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from monitor.context import request_id
+from monitor.messages import LambdaErrorMessage
+from monitor.monitors import BaseMonitor
+
+lambda_vars = {
+    'AWS_EXECUTION_ENV': 'python3.12',
+    'AWS_DEFAULT_REGION': 'eu-central-1',
+    'AWS_LAMBDA_FUNCTION_NAME': 'TestFunction-dev',
+    'AWS_LAMBDA_FUNCTION_VERSION': '$LATEST',
+    'AWS_LAMBDA_FUNCTION_MEMORY_SIZE': '128',
+    'AWS_LAMBDA_LOG_GROUP_NAME': '/aws/lambda/TestFunction-dev',
+    'AWS_LAMBDA_LOG_STREAM_NAME': '2024/10/31/[$LATEST]1ef30f6c48d24e3287ee2b41908216b2',
+}
+
+
+class RecordingMonitor(BaseMonitor):
+    """
+    Keeps the messages it is notified of, and the request each one was sent for.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.request_ids = []
+
+    def notify(self, message):
+        self.messages.append(message)
+        self.request_ids.append(request_id())
+
+
+def lambda_error(
+        name: str = 'RuntimeError',
+        function_name: str = 'TestFunction-dev',
+        text: str = 'Test Message',
+        traceback: str = '',
+        request_id: str = '24dfa092-ca3b-400c-954d-7ce9cfbf4bc3',
+        cloudwatch: str = ''
+) -> LambdaErrorMessage:
+    return LambdaErrorMessage(
+        name=name,
+        text=text,
+        traceback=traceback,
+        request_id=request_id,
+        cloudwatch=cloudwatch,
+        envs={'lambda_function_name': function_name}
+    )
+
+
+def large_lambda_error(rows: int = 5000) -> LambdaErrorMessage:
+    """
+    Error of a handler that failed deep in its call stack on a large event.
+    """
+    event = json.dumps({'rows': [{'id': i, 'name': f'row "{i}"'} for i in range(rows)]}, indent=2)
+    frames = ''.join(f'  File "/var/task/app.py", line {i}, in step_{i}\n    step_{i + 1}()\n' for i in range(500))
+    return lambda_error(
+        text=f'Event:\n{event}\nTest Error',
+        traceback=f'Traceback (most recent call last):\n{frames}RuntimeError: Test Error\n',
+        cloudwatch='https://eu-central-1.console.aws.amazon.com/cloudwatch/home',
+    )
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append(json.loads(body))  # type: ignore
+        self.server.paths.append(self.path)  # type: ignore
+        status = self.server.statuses.pop(0) if self.server.statuses else 200  # type: ignore
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+        # drop the kept-alive socket without telling the client, like an idle timeout would
+        self.close_connection = self.server.drop_connections  # type: ignore
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def webhook_server():
+    """
+    Local stand-in for the Slack webhook endpoint.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookHandler)
+    server.requests = []  # type: ignore
+    server.paths = []  # type: ignore
+    server.drop_connections = False  # type: ignore
+    server.statuses = []  # type: ignore
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def webhook_url(webhook_server):
+    host, port = webhook_server.server_address
+    return f'http://{host}:{port}'
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """
+    Mocked AWS account; cached clients are dropped so they are recreated inside the mock.
+    """
+    from moto import mock_aws
+    from monitor.aws import clear_clients
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'eu-central-1')
+    # a profile set by another test would make boto3 look for it instead of using the mock credentials
+    monkeypatch.delenv('AWS_PROFILE', raising=False)
+    with mock_aws():
+        clear_clients()
+        yield
+    clear_clients()
+
+
+@pytest.fixture(autouse=True)
+def fresh_lambda_environment():
+    """
+    Tests set the Lambda variables themselves, so the per-environment snapshot is retaken for each test.
+    """
+    from monitor.context import clear_environment
+    clear_environment()
+    yield
+    clear_environment()
+
+
+@pytest.fixture
+def aws_lambda_vars(monkeypatch):
+    for key, value in lambda_vars.items():
+        monkeypatch.setenv(key, value)
+
+
+@pytest.fixture
+def context():
+    class Context:
+        aws_request_id = '24dfa092-ca3b-400c-954d-7ce9cfbf4bc3'
+
+    return Context()
@@ -0,0 +1,82 @@
+import gzip
+import json
+
+from monitor.analyze import analyze
+from monitor.analyze import analyze_batch
+from monitor.analyze import read_batches
+from monitor.analyze import Report
+
+
+def lambda_exception(request_id: str, function_name: str) -> dict:
+    error_message = {
+        'name': 'DbtTestError',
+        'text': 'Event:\n{}\nFail',
+        'traceback': (
+            'Traceback (most recent call last):\n'
+            '  File "/var/task/dbt_lambda/app.py", line 33, in lambda_handler\n'
+            f'dbt_lambda.app.DbtTestError: Fail for request {request_id}\n'
+        ),
+        'request_id': request_id,
+        'cloudwatch': 'https://eu-central-1.console.aws.amazon.com/cloudwatch/home',
+        'envs': {'lambda_function_name': function_name},
+    }
+    return {
+        'errorMessage': json.dumps(error_message),
+        'errorType': 'LambdaException',
+        'requestId': request_id,
+    }
+
+
+def step_function_failure(cause: str, stop_date: int) -> dict:
+    return {
+        'Error': 'States.Timeout',
+        'Cause': cause,
+        'ExecutionArn': 'arn:aws:states:eu-central-1:123456789012:execution:ExtractLoad-prod:1',
+        'Input': '{}',
+        'StateMachineArn': 'arn:aws:states:eu-central-1:123456789012:stateMachine:ExtractLoad-prod',
+        'StartDate': stop_date - 1000,
+        'StopDate': stop_date,
+    }
+
+
+def export_lines() -> list[bytes]:
+    records = [
+        {
+            'time': '2024-12-01T08:15:00Z',
+            'detail': lambda_exception(f'5b1c368c-fa4f-448d-8d37-59{i:010d}', 'TransformFunction-prod')
+        }
+        for i in range(5)
+    ] + [
+        step_function_failure(f'Task timed out after {600 + i}.15 seconds', 1733089875458 + i) for i in range(3)
+    ]
+    return [json.dumps(record).encode() + b'\n' for record in records] + [b'\n', b'not json\n']
+
+
+def test_analyze_batch_groups_signatures():
+    report = analyze_batch(export_lines())
+    assert report.records == 8
+    assert report.unreadable == 1
+    assert report.signatures == {
+        'DbtTestError: dbt_lambda.app.DbtTestError: Fail for request *': 5,
+        'States.Timeout: Task timed out after * seconds': 3,
+    }
+    assert report.functions == {'TransformFunction-prod': 5}
+    assert report.state_machines == {'ExtractLoad-prod': 3}
+    assert report.days == {'2024-12-01': 8}
+    assert report.hours == {8: 5, 21: 3}
+
+
+def test_analyze_streams_batches_through_process_pool(tmp_path):
+    path = tmp_path / 'failures.jsonl.gz'
+    with gzip.open(path, 'wb') as file:
+        for _ in range(10):
+            file.writelines(export_lines())
+    with gzip.open(path, 'rb') as file:
+        report = analyze(read_batches(file, batch_size=7), max_workers=2)
+    expected = Report()
+    for _ in range(10):
+        expected.update(analyze_batch(export_lines()))
+    assert report == expected
+    assert report.records == 80
+    assert report.render().startswith('80 failures, 10 unreadable records\n\n== Signatures ==\n')
+    assert json.loads(json.dumps(report.as_dict()))['hours']['8'] == 50
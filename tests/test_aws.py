@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+from monitor.aws import get_client
+
+
+def test_wrapper_import_does_not_load_boto3_or_asyncio():
+    code = (
+        'import sys\n'
+        'import monitor.wrapper\n'
+        'import monitor.monitors\n'
+        'loaded = [name for name in ("boto3", "botocore", "asyncio") if name in sys.modules]\n'
+        'assert not loaded, loaded\n'
+    )
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_clients_are_cached():
+    client = get_client('ses', region_name='eu-central-1')
+    assert get_client('ses', region_name='eu-central-1') is client
+    assert get_client('ses', region_name='eu-west-1') is not client
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from monitor.aws import get_client
+from monitor.runner import Case
+from monitor.runner import matrix
+from monitor.runner import render_table
+from monitor.runner import run_matrix
+from monitor.runner import RunResult
+from monitor.runner import scenarios
+from monitor.runner import state_machine_arn
+
+definition = json.dumps({'StartAt': 'Done', 'States': {'Done': {'Type': 'Succeed'}}})
+
+
+@pytest.fixture
+def state_machines(aws, monkeypatch):
+    monkeypatch.setenv('AWS_ACCOUNT_ID', '123456789012')
+    monkeypatch.setenv('AWS_REGION', 'eu-central-1')
+    client = get_client('stepfunctions', region_name='eu-central-1')
+    for name in ('ExtractLoadJobQueue-dev', 'ExtractLoadJobQueue-prod', 'Transform-dev'):
+        client.create_state_machine(
+            name=name,
+            definition=definition,
+            roleArn='arn:aws:iam::123456789012:role/monitor-test'
+        )
+    return client
+
+
+def stop_running_executions(client):
+    """
+    Stand-in for sleep between polls: moto executions stay RUNNING until stopped.
+    """
+    def sleep(_):
+        for machine in client.list_state_machines()['stateMachines']:
+            executions = client.list_executions(stateMachineArn=machine['stateMachineArn'], statusFilter='RUNNING')
+            for execution in executions['executions']:
+                client.stop_execution(executionArn=execution['executionArn'], error='Stopped')
+    return sleep
+
+
+def test_matrix_skips_unsupported_modes():
+    cases = matrix(['schedule', 'transform'], ['dev', 'prod'], ['fail', 'test'])
+    assert [(c.scenario.name, c.env, c.fail_mode) for c in cases] == [
+        ('schedule', 'dev', 'fail'),
+        ('schedule', 'prod', 'fail'),
+        ('transform', 'dev', 'fail'),
+        ('transform', 'dev', 'test'),
+        ('transform', 'prod', 'fail'),
+        ('transform', 'prod', 'test'),
+    ]
+
+
+def test_run_matrix_polls_until_finished(state_machines):
+    cases = matrix(['schedule', 'extractload'], ['dev', 'prod']) + [Case(scenarios['transform'], 'dev', 'test')]
+    results = run_matrix(cases, max_workers=4, sleep=stop_running_executions(state_machines))
+    assert [(r.scenario, r.env, r.fail_mode, r.status) for r in results] == [
+        (c.scenario.name, c.env, c.fail_mode, 'ABORTED') for c in cases
+    ]
+    assert all(r.arn.startswith('arn:aws:states:eu-central-1:123456789012:execution:') for r in results)
+    executions = state_machines.list_executions(stateMachineArn=state_machine_arn('Transform', 'dev'))
+    execution = state_machines.describe_execution(executionArn=executions['executions'][0]['executionArn'])
+    assert json.loads(execution['input']) == [['x-test']]
+
+
+def test_run_matrix_reports_missing_state_machine(state_machines):
+    results = run_matrix([Case(scenarios['transform'], 'prod', 'error')], sleep=stop_running_executions(state_machines))
+    assert results[0].status == 'ERROR'
+    assert 'StateMachineDoesNotExist' in results[0].error
+
+
+def test_render_table():
+    table = render_table([
+        RunResult('schedule', 'dev', 'error', 'SUCCEEDED', 12.34, 'arn'),
+        RunResult('transform', 'prod', 'fail', 'FAILED', 3, 'arn', 'States.TaskFailed'),
+    ])
+    assert table.split('\n') == [
+        'Scenario   Env   Mode   Status     Duration  Error',
+        '---------  ----  -----  ---------  --------  -----------------',
+        'schedule   dev   error  SUCCEEDED  12.3s',
+        'transform  prod  fail   FAILED     3.0s      States.TaskFailed',
+    ]
+
+
+def test_run_matrix_command(state_machines):
+    from typer.testing import CliRunner
+    from monitor import cli
+
+    result = CliRunner().invoke(
+        cli.cli, ['run-matrix', '-s', 'schedule', '-e', 'dev', '-e', 'prod', '-m', 'error', '--timeout', '0']
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith('Running 2 scenario(s)\n')
+    assert result.output.count('still running after 0s') == 2
+    assert result.output.count('/states/home?region=eu-central-1#/v2/executions/details/') == 2
@@ -0,0 +1,63 @@
+import datetime
+import json
+
+import pytest
+
+from monitor import codec
+
+event = {
+    'args': ['x-test'],
+    'tätigkeit': 'Prüfung',
+    'nested': {'empty': {}, 'list': [], 'values': [1, 2.5, None, True]},
+    'timestamp': datetime.datetime(2024, 12, 11, 8, 30),
+    1: 'integer key',
+}
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def backend(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(codec, 'orjson', None)
+    elif codec.orjson is None:
+        pytest.skip('orjson is not installed')
+    return request.param
+
+
+def test_indented_output_matches_json_module(backend):
+    assert codec.backend() == backend
+    expected = json.dumps(event, indent=2, ensure_ascii=False, default=str)
+    assert codec.dumps(event, indent=True, default=str) == expected
+    assert codec.dumps_bytes(event, indent=True, default=str) == expected.encode()
+
+
+def test_compact_output(backend):
+    expected = json.dumps(event, separators=(',', ':'), ensure_ascii=False, default=str)
+    assert codec.dumps(event, default=str) == expected
+
+
+def test_big_integers_fall_back(backend):
+    assert codec.dumps({'id': 2 ** 70}) == '{"id":1180591620717411303424}'
+
+
+def test_float_formatting_matches_json_module(backend):
+    floats = {'small': 1e-7, 'nan': float('nan'), 'inf': float('inf')}
+    assert codec.dumps(floats) == '{"small":1e-07,"nan":NaN,"inf":Infinity}'
+
+
+def test_loads(backend):
+    assert codec.loads('{"a": [1, "ä"]}') == {'a': [1, 'ä']}
+    assert codec.loads(b'{"a": null}') == {'a': None}
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads('not json')
+
+
+def test_loads_big_integers(backend):
+    assert codec.loads('{"id": 1180591620717411303424}') == {'id': 2 ** 70}
+    assert codec.loads(b'[-9223372036854775809, 18446744073709551616]') == [-2 ** 63 - 1, 2 ** 64]
+
+
+def test_loads_nan_and_infinity(backend):
+    loaded = codec.loads(b'{"nan": NaN, "inf": Infinity, "id": 1}')
+    assert loaded['nan'] != loaded['nan']
+    assert loaded['inf'] == float('inf')
+    assert loaded['id'] == 1
@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+
+from conftest import RecordingMonitor
+from monitor.context import current_request
+from monitor.context import event_source
+from monitor.context import lambda_environment
+from monitor.context import RequestContext
+from monitor.dispatch import dispatcher
+from monitor.messages import LambdaErrorMessage
+from monitor.messages import SimpleMessage
+from monitor.monitors import BaseMonitor
+from monitor.resilience import Resilience
+from monitor.resilience import RetryableError
+from monitor.resilience import RetryPolicy
+from monitor.wrapper import lambda_monitor
+
+
+def make_context(aws_request_id: str):
+    class Context:
+        pass
+
+    context = Context()
+    context.aws_request_id = aws_request_id  # type: ignore
+    return context
+
+
+def test_event_source():
+    assert event_source({'Records': [{'eventSource': 'aws:sqs'}]}) == 'aws:sqs'
+    assert event_source({'Records': [{'EventSource': 'aws:sns'}]}) == 'aws:sns'
+    assert event_source({'source': 'aws.events', 'detail': {}}) == 'aws.events'
+    assert event_source({'requestContext': {}}) == 'aws:apigateway'
+    assert event_source({'args': ['x']}) is None
+    assert event_source([['x']]) is None
+
+
+def test_lambda_environment_is_read_once(monkeypatch):
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'TestFunction-dev')
+    assert lambda_environment()['AWS_LAMBDA_FUNCTION_NAME'] == 'TestFunction-dev'
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'OtherFunction-dev')
+    assert lambda_environment()['AWS_LAMBDA_FUNCTION_NAME'] == 'TestFunction-dev'
+
+
+def test_concurrent_invocations_keep_their_request(monkeypatch):
+    monkeypatch.delenv('AWS_REQUEST_ID', raising=False)
+    barrier = threading.Barrier(4)
+    seen = {}
+
+    @lambda_monitor(monitor=BaseMonitor())
+    def my_lambda_handler(event, _):
+        # all invocations are running at this point
+        barrier.wait(timeout=5)
+        seen[event['id']] = current_request.get()
+
+    threads = [
+        threading.Thread(target=my_lambda_handler, args=({'id': i}, make_context(f'request-{i}')))
+        for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert {i: request.request_id for i, request in seen.items()} == {i: f'request-{i}' for i in range(4)}
+    assert 'AWS_REQUEST_ID' not in os.environ
+    assert current_request.get() is None
+
+
+def test_concurrent_async_invocations_keep_their_request():
+    monitor = RecordingMonitor()
+
+    @lambda_monitor(monitor=monitor, notify_hook=lambda response: response['text'])
+    async def my_lambda_handler(event, _):
+        await asyncio.sleep(0.01 * (3 - event['id']))
+        return {'text': f'done {event["id"]}'}
+
+    async def main():
+        await asyncio.gather(*(my_lambda_handler({'id': i}, make_context(f'request-{i}')) for i in range(3)))
+
+    asyncio.run(main())
+    assert sorted(zip([message.text for message in monitor.messages], monitor.request_ids)) == [(f'done {i}', f'request-{i}') for i in range(3)]
+
+
+def test_background_notifications_keep_their_request():
+    monitor = RecordingMonitor()
+
+    @lambda_monitor(monitor=monitor, notify_hook=lambda response: response['text'], background=True)
+    def my_lambda_handler(event, _):
+        return {'text': f'done {event["id"]}'}
+
+    for i in range(3):
+        my_lambda_handler({'id': i}, make_context(f'request-{i}'))
+    assert [message.text for message in monitor.messages] == [f'done {i}' for i in range(3)]
+    assert monitor.request_ids == [f'request-{i}' for i in range(3)]
+
+
+def test_error_message_uses_environment_snapshot(aws_lambda_vars, monkeypatch):
+    assert LambdaErrorMessage.get_envs()['lambda_function_name'] == 'TestFunction-dev'
+    monkeypatch.delenv('AWS_LAMBDA_FUNCTION_NAME')
+    assert LambdaErrorMessage.get_envs()['lambda_function_name'] == 'TestFunction-dev'
+
+
+class SleepingMonitor(BaseMonitor):
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def notify(self, message):
+        time.sleep(self.delay)
+
+
+def in_request(request: RequestContext, func, *args):
+    context = contextvars.copy_context()
+    context.run(current_request.set, request)
+    return context.run(func, *args)
+
+
+def test_dispatcher_keeps_requests_apart():
+    slow, fast = RequestContext('slow'), RequestContext('fast')
+    in_request(slow, dispatcher.submit, SleepingMonitor(0.2), SimpleMessage('slow 1'))
+    in_request(slow, dispatcher.submit, SleepingMonitor(0.2), SimpleMessage('slow 2'))
+    in_request(fast, dispatcher.submit, SleepingMonitor(0), SimpleMessage('fast'))
+    # queued behind the slow request's jobs, so the fast one gives up and takes back only its own job
+    assert not dispatcher.flush(0.05, fast)
+    assert [job[1].text for job in dispatcher.drain(fast)] == ['fast']
+    assert dispatcher.pending_for(fast) == 0
+    assert dispatcher.pending_for(slow) == 2
+    assert dispatcher.flush(2, slow)
+    assert dispatcher.take_notify_seconds(slow) >= 0.4
+    assert dispatcher.take_notify_seconds(fast) == 0
+
+
+def test_counters_are_kept_per_request():
+    retried, quiet = RequestContext('retried'), RequestContext('quiet')
+    resilience = Resilience(retry=RetryPolicy(attempts=3, base_delay=0), sleep=lambda _: None)
+    attempts = iter([RetryableError('timeout'), 'ok'])
+
+    def flaky():
+        result = next(attempts)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert in_request(retried, resilience.call, flaky) == 'ok'
+    assert in_request(quiet, resilience.call, lambda: 'ok') == 'ok'
+    assert retried.counters.retries == 1
+    assert quiet.counters.retries == 0
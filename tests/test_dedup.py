@@ -0,0 +1,91 @@
+import time
+from dataclasses import replace
+
+import pytest
+
+from conftest import lambda_error
+from conftest import RecordingMonitor
+
+from monitor.aws import get_client
+from monitor.dedup import DedupMonitor
+from monitor.dedup import DynamoDBStore
+from monitor.dedup import fingerprint
+from monitor.dedup import MemoryStore
+from monitor.dedup import SQLiteStore
+from monitor.messages import ErrorMessage
+from monitor.messages import LambdaErrorMessage
+from monitor.messages import SimpleMessage
+
+
+def source_error(request_id: str, job_id: str) -> LambdaErrorMessage:
+    return lambda_error(
+        name='SourceError',
+        function_name='ExtractLoadFunction-prod',
+        text=f'Event:\n{{"job_id": "{job_id}"}}\nSource unavailable',
+        traceback=(
+            'Traceback (most recent call last):\n'
+            '  File "/var/task/app.py", line 14, in lambda_handler\n'
+            f'app.SourceError: 2024-11-26T00:36:39.604Z {request_id} job {job_id} failed\n'
+        ),
+        request_id=request_id,
+        cloudwatch=f'https://example.com/?filterPattern={request_id}',
+    )
+
+
+def test_fingerprint_ignores_volatile_parts():
+    first = source_error('5b1c368c-fa4f-448d-8d37-595d2633cc9b', '74d69da730b04488b7978b40719861e3')
+    second = source_error('d53c5f6b-eb1d-49bd-a1f9-98b0112f1781', '122afa1e5f2d414ba3df3f697fbb541a')
+    assert fingerprint(first) == fingerprint(second)
+    second = replace(second, envs={'lambda_function_name': 'TransformFunction-prod'})
+    assert fingerprint(first) != fingerprint(second)
+
+
+def test_memory_store_windows():
+    store = MemoryStore()
+    assert store.hit('key', now=0, ttl=10) == 0
+    assert store.hit('key', now=1, ttl=10) is None
+    assert store.hit('key', now=2, ttl=10) is None
+    assert store.hit('key', now=10, ttl=10) == 2
+    assert store.hit('other', now=10, ttl=10) == 0
+
+
+def test_sqlite_store_windows(tmp_path):
+    path = str(tmp_path / 'dedup.sqlite')
+    assert SQLiteStore(path).hit('key', now=0, ttl=10) == 0
+    assert SQLiteStore(path).hit('key', now=1, ttl=10) is None
+    assert SQLiteStore(path).hit('key', now=11, ttl=10) == 1
+
+
+@pytest.fixture
+def dynamodb_table(aws):
+    get_client('dynamodb', region_name='eu-central-1').create_table(
+        TableName='monitor-dedup',
+        KeySchema=[{'AttributeName': 'fingerprint', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'fingerprint', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    return 'monitor-dedup'
+
+
+def test_dynamodb_store_windows(dynamodb_table):
+    store = DynamoDBStore(dynamodb_table, region_name='eu-central-1')
+    assert store.hit('key', now=0, ttl=10) == 0
+    assert store.hit('key', now=1, ttl=10) is None
+    assert store.hit('key', now=2, ttl=10) is None
+    assert store.hit('key', now=10, ttl=10) == 2
+
+
+def test_dedup_monitor_reports_suppressed_count():
+    recorder = RecordingMonitor()
+    monitor = DedupMonitor(recorder, ttl=0.05)
+    for request_id in ('5b1c368c-fa4f-448d-8d37-595d2633cc9b', 'd53c5f6b-eb1d-49bd-a1f9-98b0112f1781'):
+        monitor.notify(source_error(request_id, '74d69da730b04488b7978b40719861e3'))
+    monitor.notify(SimpleMessage('info'))
+    monitor.notify(ErrorMessage('OtherError', 'other'))
+    assert [m.name if isinstance(m, ErrorMessage) else m.text for m in recorder.messages] == [
+        'SourceError', 'info', 'OtherError'
+    ]
+
+    time.sleep(0.1)
+    monitor.notify(source_error('24dfa092-ca3b-400c-954d-7ce9cfbf4bc3', '74d69da730b04488b7978b40719861e3'))
+    assert recorder.messages[-1].text.endswith('(1 duplicate alerts suppressed in the last 0.05s)')
@@ -0,0 +1,90 @@
+import time
+
+from conftest import RecordingMonitor
+from monitor.digest import DigestMonitor
+from monitor.digest import render_digest
+from monitor.messages import ErrorMessage
+from monitor.messages import SimpleMessage
+from monitor.monitors import BaseMonitor
+from monitor.monitors import Outbox
+from monitor.wrapper import lambda_monitor
+
+
+def test_render_digest_groups_messages():
+    message = render_digest([
+        SimpleMessage('table_a loaded'),
+        ErrorMessage('SourceError', 'source a down'),
+        SimpleMessage('table_b loaded'),
+        ErrorMessage('SourceError', 'source b down'),
+        ErrorMessage('DbtTestError', 'test failed'),
+    ])
+    assert isinstance(message, ErrorMessage)
+    assert message.name == 'DbtTestError, SourceError'
+    assert message.text == (
+        'Digest of 5 messages\n'
+        '== 2x SimpleMessage ==\n'
+        '- table_a loaded\n'
+        '- table_b loaded\n\n'
+        '== 2x ErrorMessage (SourceError) ==\n'
+        'Error: SourceError\n'
+        'Message: source a down\n'
+        '- Error: SourceError\n\n'
+        '== 1x ErrorMessage (DbtTestError) ==\n'
+        'Error: DbtTestError\n'
+        'Message: test failed'
+    )
+
+
+def test_digest_monitor_flushes_on_count():
+    recorder = RecordingMonitor()
+    monitor = DigestMonitor(recorder, window=60, max_messages=3)
+    for i in range(7):
+        monitor.notify(SimpleMessage(f'table_{i} loaded'))
+    assert len(recorder.messages) == 2
+    assert recorder.messages[0].text == '== 3x SimpleMessage ==\n- table_0 loaded\n- table_1 loaded\n- table_2 loaded'
+    monitor.flush()
+    assert recorder.messages[2].text == 'table_6 loaded'
+
+
+def test_digest_monitor_flushes_on_window():
+    recorder = RecordingMonitor()
+    monitor = DigestMonitor(recorder, window=0.05)
+    monitor.notify(SimpleMessage('table_a loaded'))
+    monitor.notify(SimpleMessage('table_b loaded'))
+    assert recorder.messages == []
+    time.sleep(0.2)
+    assert len(recorder.messages) == 1
+
+
+class FailingMonitor(BaseMonitor):
+
+    def notify(self, message):
+        raise RuntimeError('Slack unavailable')
+
+
+def test_digest_monitor_spools_failed_flush(tmp_path):
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'))
+    monitor = DigestMonitor(FailingMonitor(), window=0.05, outbox=outbox)
+    monitor.notify(ErrorMessage('SourceError', 'source a down'))
+    monitor.notify(ErrorMessage('SourceError', 'source b down'))
+    time.sleep(0.2)
+    [(_, digest)] = outbox.take()
+    assert digest.text.startswith('Digest of 2 messages')
+
+
+def test_digest_monitor_logs_failed_flush(caplog):
+    monitor = DigestMonitor(FailingMonitor())
+    monitor.notify(ErrorMessage('SourceError', 'source a down'))
+    assert monitor.flush() is False
+    assert 'Digest not delivered, ErrorMessage only logged:\nError: SourceError\nMessage: source a down' in caplog.text
+
+
+def test_lambda_monitor_flushes_digest(context):
+    recorder = RecordingMonitor()
+
+    @lambda_monitor(monitor=DigestMonitor(recorder), notify_hook=lambda response: response['text'])
+    def my_lambda_handler(_, __):
+        return {'text': 'table_a loaded'}
+
+    my_lambda_handler({}, context)
+    assert [message.text for message in recorder.messages] == ['table_a loaded']
@@ -0,0 +1,53 @@
+import json
+import logging
+import sys
+
+from monitor.logs import JsonFormatter
+from monitor.monitors import BaseMonitor
+from monitor.wrapper import lambda_monitor
+
+
+def test_json_formatter_adds_extra_fields():
+    record = logging.makeLogRecord({
+        'name': 'root', 'levelname': 'INFO', 'msg': 'Sent %d messages', 'args': (3,),
+        'aws_request_id': 'abc', 'sink': 'slack',
+    })
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'Sent 3 messages'
+    assert entry['level'] == 'INFO'
+    assert entry['request_id'] == 'abc'
+    assert entry['sink'] == 'slack'
+    assert 'args' not in entry
+    assert entry['time'].endswith('+00:00')
+
+
+def test_json_formatter_formats_traceback_once():
+    try:
+        raise RuntimeError('Test Error')
+    except RuntimeError:
+        record = logging.makeLogRecord({'msg': 'failed', 'exc_info': sys.exc_info()})
+    line = JsonFormatter().format(record)
+    assert '\n' not in line
+    assert json.loads(line)['traceback'] == record.exc_text
+    assert record.exc_text.endswith('RuntimeError: Test Error')
+
+
+def test_structured_failure_is_one_record(aws_lambda_vars, context, caplog, monkeypatch):
+    monkeypatch.setenv('FAIL_ON_ERROR', 'false')
+
+    @lambda_monitor(monitor=BaseMonitor(), structured_logs=True)
+    def my_lambda_handler(_, __):
+        raise RuntimeError('Test Error')
+
+    with caplog.at_level(logging.INFO):
+        response = my_lambda_handler({'args': 'test'}, context)
+    errors = [record for record in caplog.records if record.levelno >= logging.ERROR]
+    assert len(errors) == 1
+    assert errors[0].exc_info is None
+    entry = json.loads(JsonFormatter().format(errors[0]))
+    assert entry['message'] == 'RuntimeError: Test Error'
+    assert entry['error_name'] == 'RuntimeError'
+    assert entry['request_id'] == context.aws_request_id
+    assert entry['function_name'] == 'TestFunction-dev'
+    assert entry['event'] == {'args': 'test'}
+    assert entry['traceback'] == response['message']['traceback']
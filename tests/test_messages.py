@@ -1,4 +1,14 @@
+import json
+from dataclasses import FrozenInstanceError
+
+import pytest
+
+from monitor import codec
+from monitor.messages import ErrorMessage
 from monitor.messages import from_event
+from monitor.messages import LambdaErrorMessage
+from monitor.messages import StepFunctionFailureMessage
+from monitor.messages import truncate
 
 
 def test_step_function_error_handler1():
@@ -38,3 +48,154 @@ def test_step_function_error_handler3():
     }
     message = from_event(event)
     print(message.as_str)
+
+
+def nest(event: dict, levels: int) -> dict:
+    for level in range(levels):
+        event = {
+            'Error': 'States.TaskFailed',
+            'Cause': json.dumps(event),
+            'ExecutionArn': f'arn:aws:states:eu-central-1:123456789:execution:Level{level}:1',
+            'Input': json.dumps({'level': level}),
+            'StateMachineArn': f'arn:aws:states:eu-central-1:123456789:stateMachine:Level{level}',
+            'StartDate': 1732579237465,
+            'StopDate': 1732581399675,
+        }
+    return event
+
+
+@pytest.fixture
+def lambda_exception_event():
+    error_message = {
+        'name': 'DbtTestError',
+        'text': 'Event:\n' + json.dumps({'rows': ['x' * 100] * 2000}, indent=2),
+        'traceback': 'Traceback (most recent call last):\n' * 50,
+        'request_id': 'dadaf7fd-c55a-441a-9345-e8b0945a1c32',
+        'cloudwatch': 'https://eu-central-1.console.aws.amazon.com/cloudwatch/home',
+        'envs': {'lambda_function_name': 'TransformFunction-dev'},
+    }
+    return {
+        'errorMessage': json.dumps(error_message),
+        'errorType': 'LambdaException',
+        'requestId': 'dadaf7fd-c55a-441a-9345-e8b0945a1c32',
+    }
+
+
+@pytest.fixture
+def count_json_loads(monkeypatch):
+    calls = []
+    loads = codec.loads
+
+    def counting_loads(data):
+        calls.append(len(data))
+        return loads(data)
+
+    monkeypatch.setattr(codec, 'loads', counting_loads)
+    return calls
+
+
+def test_from_event_decodes_each_level_once(lambda_exception_event, count_json_loads):
+    event = nest(lambda_exception_event, levels=6)
+    assert len(event['Cause']) > 256_000
+    message = from_event(event)
+    assert isinstance(message, LambdaErrorMessage)
+    assert message.name == 'DbtTestError'
+    # six causes and the error message
+    assert len(count_json_loads) == 7
+
+
+def test_from_event_stops_at_max_depth(lambda_exception_event):
+    event = nest(lambda_exception_event, levels=6)
+    message = from_event(event, max_depth=2)
+    assert isinstance(message, StepFunctionFailureMessage)
+    assert message.execution_arn.endswith('Level3:1')
+    assert message.cause_data is None
+    assert message.cause_json == message.text
+    assert message.input_data == {'level': 3}
+
+
+def test_from_event_stops_at_max_size(lambda_exception_event):
+    event = nest(lambda_exception_event, levels=3)
+    message = from_event(event, max_size=100_000)
+    assert isinstance(message, StepFunctionFailureMessage)
+    assert message.execution_arn.endswith('Level2:1')
+    assert message.cause_json == event['Cause']
+
+
+def test_step_function_message_parses_once(count_json_loads):
+    event = {
+        'Error': 'States.TaskFailed',
+        'Cause': json.dumps({
+            'Error': 'Lambda.Unknown',
+            'Cause': 'Returned payload: {"errorMessage": "timed out"}',
+            'Input': '{"level": 0}',
+            'StartDate': 1732579237465,
+            'StopDate': 1732581399675,
+        })
+    }
+    message = from_event(event)
+    message.as_str
+    message.as_str
+    assert message.cause_data == {'errorMessage': 'timed out'}
+    assert message.input_data == {'level': 0}
+    # outer cause, inner cause (not JSON), inner cause payload and input
+    assert len(count_json_loads) == 4
+    assert 'Input' not in message.as_dict and '_cause' not in message.as_dict
+
+
+def test_messages_are_slotted_and_frozen():
+    message = ErrorMessage('Test Error', 'Test Message')
+    assert not hasattr(message, '__dict__')
+    with pytest.raises(FrozenInstanceError):
+        message.text = 'changed'  # type: ignore
+
+
+def test_rendering_is_cached(count_json_loads):
+    inner = {
+        'Error': 'Lambda.Unknown',
+        'Cause': 'Returned payload: {"errorMessage": "timed out"}',
+        'Input': '{"level": 0}',
+        'StartDate': 1732579237465,
+        'StopDate': 1732581399675,
+    }
+    message = from_event(nest(inner, levels=1))
+    assert message.as_str is message.as_str
+    assert message.as_json is message.as_json
+    assert message.as_dict == message.as_dict
+    assert len(count_json_loads) == 4
+
+
+def test_as_dict_does_not_change_cached_json():
+    message = ErrorMessage('Test Error', 'Test Message')
+    rendered = message.as_json
+    message.as_dict['name'] = 'mutated'
+    assert message.as_dict['name'] == 'Test Error'
+    assert message.as_json == rendered
+
+
+def test_from_dict_round_trip(lambda_exception_event):
+    message = from_event(lambda_exception_event)
+    assert LambdaErrorMessage.from_dict(json.loads(message.as_json)) == message
+    message = from_event(nest({}, 1), max_depth=0)
+    assert StepFunctionFailureMessage.from_dict(message.as_dict) == message
+
+
+def test_lambda_error_without_profile_keeps_old_fields():
+    # the catch handler may still run a version that builds the message with LambdaErrorMessage(**data)
+    old_fields = {'name', 'text', 'traceback', 'request_id', 'cloudwatch', 'envs'}
+    message = LambdaErrorMessage('RuntimeError', 'Test Message', '', '24dfa092-ca3b-400c-954d-7ce9cfbf4bc3', '')
+    data = json.loads(message.as_json)
+    assert set(data) == old_fields
+    assert LambdaErrorMessage(**data) == message
+    profiled = LambdaErrorMessage.from_dict({**data, 'profile': {'wall_time_ms': 12.5}})
+    assert LambdaErrorMessage.from_dict(json.loads(profiled.as_json)) == profiled
+
+
+def test_truncate_keeps_head_and_tail():
+    text = '\n'.join(f'line {i}' for i in range(1000))
+    assert truncate(text, len(text)) == text
+    shortened = truncate(text, 200)
+    assert len(shortened) == 200
+    assert shortened.startswith('line 0\nline 1\n')
+    assert shortened.endswith('line 998\nline 999')
+    assert f'[... {len(text) - 200} characters omitted ...]' in shortened
@@ -0,0 +1,86 @@
+import io
+import json
+
+from monitor.metrics import Metrics
+from monitor.monitors import BaseMonitor
+from monitor.monitors import CompositeMonitor
+from monitor.wrapper import lambda_monitor
+
+
+def test_metrics_document():
+    metrics = Metrics('Test', {'FunctionName': 'TestFunction-dev', 'Env': 'dev'})
+    metrics.put('HandlerDuration', 12.5, 'Milliseconds')
+    metrics.put('Errors', 1, dimension=('ErrorName', 'RuntimeError'))
+    stream = io.StringIO()
+    metrics.emit(stream)
+    line = stream.getvalue()
+    assert line.count('\n') == 1
+    document = json.loads(line)
+    assert document['_aws']['CloudWatchMetrics'] == [
+        {
+            'Namespace': 'Test',
+            'Dimensions': [['FunctionName', 'Env']],
+            'Metrics': [{'Name': 'HandlerDuration', 'Unit': 'Milliseconds'}],
+        },
+        {
+            'Namespace': 'Test',
+            'Dimensions': [['FunctionName', 'Env', 'ErrorName']],
+            'Metrics': [{'Name': 'Errors', 'Unit': 'Count'}],
+        },
+    ]
+    assert document['FunctionName'] == 'TestFunction-dev'
+    assert document['ErrorName'] == 'RuntimeError'
+    assert (document['HandlerDuration'], document['Errors']) == (12.5, 1)
+
+
+def test_lambda_monitor_emits_one_line(capsys, monkeypatch):
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'TestFunction-dev')
+
+    class Context:
+        aws_request_id = '24dfa092-ca3b-400c-954d-7ce9cfbf4bc3'
+
+    @lambda_monitor(
+        monitor=BaseMonitor(),
+        notify_hook=lambda result: result['error'],
+        metrics=True
+    )
+    def my_lambda_handler(_, __):
+        return {'error': 'SourceError'}
+
+    my_lambda_handler({}, Context())
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[:2] == ['Error: SourceError', 'Message: SourceError']
+    document = json.loads(lines[2])
+    assert document['Errors'] == 1
+    assert document['ErrorName'] == 'SourceError'
+    assert document['Monitor'] == 'BaseMonitor'
+    assert document['NotifyDuration'] >= 0
+    assert document['SuppressedNotifications'] == 0
+    assert document['ColdStart'] in (0, 1)
+
+
+def test_lambda_monitor_emits_notify_duration_per_sink(capsys, monkeypatch):
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'TestFunction-dev')
+
+    class Context:
+        aws_request_id = '24dfa092-ca3b-400c-954d-7ce9cfbf4bc3'
+
+    class QuietMonitor(BaseMonitor):
+        def notify(self, message):
+            pass
+
+    @lambda_monitor(
+        monitor=CompositeMonitor([BaseMonitor(), QuietMonitor()]),
+        notify_hook=lambda result: result['error'],
+        metrics=True
+    )
+    def my_lambda_handler(_, __):
+        return {'error': 'SourceError'}
+
+    my_lambda_handler({}, Context())
+    documents = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    assert [document['Monitor'] for document in documents] == ['CompositeMonitor', 'BaseMonitor', 'QuietMonitor']
+    for document in documents[1:]:
+        assert document['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['FunctionName', 'Env', 'Monitor']]
+        assert document['NotifyDuration'] >= 0
+        assert document['FunctionName'] == 'TestFunction-dev'
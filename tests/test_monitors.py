@@ -1,8 +1,23 @@
+import asyncio
+import email
+import gzip
+import json
 import os
+import time
 
+from conftest import large_lambda_error
+from monitor.aws import get_client
 from monitor.messages import ErrorMessage
+from monitor.messages import LambdaErrorMessage
+from monitor.messages import SimpleMessage
+from monitor.monitors import BaseMonitor
+from monitor.monitors import CompositeMonitor
+from monitor.monitors import deliver
 from monitor.monitors import dev_channel_set
+from monitor.monitors import Email
 from monitor.monitors import EmailMonitor
+from monitor.monitors import Outbox
+from monitor.monitors import SlackChannel
 from monitor.monitors import SlackMonitor
 
 
@@ -14,6 +29,25 @@ def test_slack_channel_alert():
     dev_channel_set.alert.send('Test Message Alert')
 
 
+def test_slack_channel_webhook_stub(webhook_server, webhook_url):
+    channel = SlackChannel('test', 'T000/B000/XXXX', base_url=f'{webhook_url}/services')
+    channel.send('Test Message')
+    channel.send(None, payload={'text': 'Test Payload'})
+    assert webhook_server.requests == [{'text': 'Test Message'}, {'text': 'Test Payload'}]
+
+
+def test_slack_channel_async_webhook_stub(webhook_server, webhook_url):
+    channel = SlackChannel('test-async', 'T000/B000/XXXX', base_url=f'{webhook_url}/services')
+
+    async def main():
+        return await asyncio.gather(*(channel.asend(f'Test Message {i}') for i in range(3)))
+
+    assert asyncio.run(main()) == [True, True, True]
+    assert sorted(request['text'] for request in webhook_server.requests) == [
+        'Test Message 0', 'Test Message 1', 'Test Message 2'
+    ]
+
+
 def test_slack_monitor():
     monitor = SlackMonitor(None, dev_channel_set)
     message = ErrorMessage('Test Error', 'Test Message')
@@ -25,3 +59,142 @@ def test_email_monitor():
     monitor = EmailMonitor('christian.schaefer@tatenmitdaten.com', [])
     message = ErrorMessage('Test Error', 'Test Message')
     monitor.notify(message)
+
+
+def test_email_as_mime():
+    mail = Email('Subject', 'Body', ['to@example.com'], 'from@example.com', {'message.json.gz': gzip.compress(b'{}')})
+    parsed = email.message_from_bytes(mail.as_mime())
+    assert parsed['Subject'] == 'Subject'
+    body, attachment = parsed.get_payload()
+    assert body.get_payload(decode=True) == b'Body'
+    assert attachment.get_filename() == 'message.json.gz'
+    assert gzip.decompress(attachment.get_payload(decode=True)) == b'{}'
+
+
+def test_email_monitor_attaches_large_messages(aws):
+    from moto.core import DEFAULT_ACCOUNT_ID
+    from moto.ses.models import ses_backends
+    sender = 'monitor@example.com'
+    get_client('ses', region_name='eu-central-1').verify_email_identity(EmailAddress=sender)
+    monitor = EmailMonitor(sender, [], dev_addresses=(sender,), inline_budget=2000)
+
+    monitor.notify(ErrorMessage('Test Error', 'Test Message'))
+    message = large_lambda_error()
+    monitor.notify(message)
+
+    small, large = ses_backends[DEFAULT_ACCOUNT_ID]['eu-central-1'].sent_messages
+    assert small.body == 'Error: Test Error\nMessage: Test Message'
+    parsed = email.message_from_bytes(large.raw_data.encode())
+    body, attachment = parsed.get_payload()
+    text = body.get_payload(decode=True).decode()
+    assert len(text) < 2100
+    assert 'Message: Test Error\nAWS Request ID: 24dfa092-ca3b-400c-954d-7ce9cfbf4bc3' in text
+    assert 'RuntimeError: Test Error' in text
+    data = json.loads(gzip.decompress(attachment.get_payload(decode=True)))
+    assert LambdaErrorMessage.from_dict(data) == message
+
+
+class SleepingMonitor(BaseMonitor):
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def notify(self, message):
+        time.sleep(self.delay)
+
+
+class FailingMonitor(BaseMonitor):
+
+    def notify(self, message):
+        raise RuntimeError('sink down')
+
+
+def test_composite_monitor_isolates_sinks():
+    monitor = CompositeMonitor(
+        [SleepingMonitor(0.1), FailingMonitor(), SleepingMonitor(1), SleepingMonitor(0.1)],
+        timeout=0.3
+    )
+    start = time.perf_counter()
+    results = monitor.notify(ErrorMessage('Test Error', 'Test Message'))
+    assert time.perf_counter() - start < 0.5
+    assert [(result.name, result.ok) for result in results] == [
+        ('SleepingMonitor', True),
+        ('FailingMonitor', False),
+        ('SleepingMonitor', False),
+        ('SleepingMonitor', True),
+    ]
+    assert results[1].error == "RuntimeError('sink down')"
+    assert results[2].error == 'timed out'
+    assert results[0].latency < 0.3
+
+
+def test_composite_monitor_cancels_queued_sinks(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from monitor import monitors
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(monitors, '_executor', executor)
+    calls = []
+    queued = SleepingMonitor(0)
+    queued.notify = calls.append  # type: ignore
+    results = CompositeMonitor([SleepingMonitor(0.3), queued], timeout=0.1).notify(
+        ErrorMessage('Test Error', 'Test Message')
+    )
+    assert [result.error for result in results] == ['timed out', 'timed out']
+    executor.shutdown(wait=True)
+    assert calls == []
+
+
+def test_composite_monitor_async():
+    monitor = CompositeMonitor([SleepingMonitor(0.2), FailingMonitor(), SleepingMonitor(0.2)], timeout=1)
+    start = time.perf_counter()
+    results = asyncio.run(monitor.anotify(ErrorMessage('Test Error', 'Test Message')))
+    assert time.perf_counter() - start < 0.35
+    assert [result.ok for result in results] == [True, False, True]
+
+
+def test_outbox_dedups_and_replays_in_batches(tmp_path):
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'), batch_size=2)
+    messages = [ErrorMessage('Test Error', f'Test Message {i}') for i in range(3)]
+    for message in messages + [messages[0]]:
+        outbox.spool(message)
+    outbox.spool(SimpleMessage('info'))
+    assert outbox.pending == 4
+    assert [message for _, message in outbox.take()] == messages[:2]
+    assert [message for _, message in outbox.take()] == [messages[2], SimpleMessage('info')]
+    assert outbox.take() == []
+
+
+def test_outbox_caps_age_and_size(tmp_path):
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'), max_entries=3, max_bytes=500, max_age=60)
+    outbox.spool(ErrorMessage('Old Error', 'Test Message'), spooled_at=time.time() - 120)
+    for i in range(10):
+        outbox.spool(ErrorMessage('Test Error', f'Test Message {i}'))
+    assert os.path.getsize(outbox.path) <= 500 + 100
+    assert [message.text for _, message in outbox.take(10)] == [f'Test Message {i}' for i in range(7, 10)]
+
+
+def test_outbox_drops_oldest_entries_beyond_max_bytes(tmp_path):
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'), max_bytes=2000)
+    for i in range(20):
+        outbox.spool(ErrorMessage('Test Error', f'{i} ' + 'x' * 300))
+    assert os.path.getsize(outbox.path) <= 2000
+    texts = [message.text for _, message in outbox.take(20)]
+    assert texts and texts[-1].startswith('19 ')
+    assert [int(text.split()[0]) for text in texts] == list(range(20 - len(texts), 20))
+
+
+def test_outbox_skips_torn_lines(tmp_path):
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'))
+    outbox.spool(ErrorMessage('Test Error', 'Test Message'))
+    with open(outbox.path, 'a') as file:
+        file.write('{"key": "abc", "spooled')
+    assert [message.name for _, message in outbox.take()] == ['Test Error']
+
+
+def test_deliver_spools_failures(tmp_path):
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'))
+    message = ErrorMessage('Test Error', 'Test Message')
+    assert not deliver(FailingMonitor(), message, outbox)
+    assert not deliver(CompositeMonitor([FailingMonitor()]), message, outbox)
+    assert deliver(SleepingMonitor(0), message, outbox)
+    assert outbox.pending == 1
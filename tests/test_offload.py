@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from conftest import lambda_error
+from conftest import large_lambda_error
+
+from monitor.aws import get_client
+from monitor.messages import ErrorMessage
+from monitor.messages import from_event
+from monitor.messages import LambdaErrorMessage
+from monitor.monitors import SlackChannel
+from monitor.monitors import SlackChannelSet
+from monitor.monitors import SlackMonitor
+from monitor.offload import cause_size
+from monitor.offload import Offloader
+from monitor.offload import shrink
+from monitor.offload import step_functions_budget
+from monitor.wrapper import lambda_monitor
+from monitor.wrapper import LambdaException
+
+
+@pytest.fixture
+def bucket(aws):
+    get_client('s3', region_name='eu-central-1').create_bucket(
+        Bucket='monitor-payloads',
+        CreateBucketConfiguration={'LocationConstraint': 'eu-central-1'}
+    )
+    return 'monitor-payloads'
+
+
+def test_shrink_keeps_head_and_tail():
+    message = large_lambda_error()
+    assert shrink(message, cause_size(message), size=cause_size) is message
+    shortened = shrink(message, step_functions_budget, size=cause_size)
+    assert cause_size(shortened) <= step_functions_budget
+    assert shortened.text.startswith('Event:\n{\n  "rows"')
+    assert shortened.text.endswith('Test Error')
+    assert shortened.traceback.startswith('Traceback (most recent call last):\n')
+    assert shortened.traceback.endswith('RuntimeError: Test Error\n')
+    assert shortened.request_id == message.request_id
+    assert shortened.payload_ref is None
+    assert 'payload_ref' not in shortened.as_dict
+
+
+def test_shrink_small_budget_leaves_fixed_fields():
+    message = ErrorMessage('Test Error', 'x' * 10_000)
+    assert len(shrink(message, 500).as_json) <= 500
+
+
+def test_shrink_without_shrinkable_text():
+    message = ErrorMessage('x' * 1000, '')
+    assert shrink(message, 500) is message
+    message = lambda_error(function_name='x' * 1000, text='')
+    assert shrink(message, 500, size=cause_size) is message
+
+
+def test_offloader_stores_complete_message(bucket):
+    offloader = Offloader(bucket, region_name='eu-central-1')
+    message = large_lambda_error()
+    shortened = shrink(message, step_functions_budget, offloader, cause_size)
+    assert shortened.payload_ref.startswith('s3://monitor-payloads/monitor/LambdaErrorMessage/')
+    assert f'Full message: {shortened.payload_ref}' in shortened.as_str
+    # the reference survives the round trip through a Step Functions cause
+    event = {'errorType': 'LambdaException', 'errorMessage': shortened.as_json}
+    restored = from_event(event)
+    assert restored == shortened
+    assert offloader.resolve(restored) == message
+
+
+def test_wrapper_fits_error_into_step_functions_cause(monkeypatch):
+    monkeypatch.setenv('FAIL_ON_ERROR', 'true')
+    monkeypatch.setenv('AWS_EXECUTION_ENV', 'python3.12')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'eu-central-1')
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'TestFunction-dev')
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '128')
+    monkeypatch.setenv('AWS_LAMBDA_LOG_GROUP_NAME', '/aws/lambda/TestFunction-dev')
+    monkeypatch.setenv('AWS_LAMBDA_LOG_STREAM_NAME', '2024/10/31/[$LATEST]1ef30f6c48d24e3287ee2b41908216b2')
+
+    class Context:
+        aws_request_id = '24dfa092-ca3b-400c-954d-7ce9cfbf4bc3'
+
+    class QuietMonitor(SlackMonitor):
+        def notify(self, message):
+            pass
+
+    @lambda_monitor(monitor=QuietMonitor(None))
+    def my_lambda_handler(_, __):
+        raise RuntimeError('Test Error')
+
+    with pytest.raises(LambdaException) as wrapper:
+        my_lambda_handler({'rows': [{'id': i} for i in range(10_000)]}, Context())
+    cause = json.dumps({'errorMessage': str(wrapper.value), 'errorType': 'LambdaException'})
+    assert len(cause) <= 32 * 1024
+    message = LambdaErrorMessage.from_dict(json.loads(str(wrapper.value)))
+    assert message.text.endswith('Test Error')
+    assert message.traceback.endswith('RuntimeError: Test Error\n')
+
+
+def test_slack_monitor_budget(webhook_server, webhook_url):
+    channel = SlackChannel('test-budget', 'T000/B000/XXXX', base_url=f'{webhook_url}/services')
+    channels = SlackChannelSet(info=channel, alert=channel)
+    monitor = SlackMonitor(prod_channels=None, dev_channels=channels, text_budget=4000)
+    assert monitor.notify(large_lambda_error())
+    text = webhook_server.requests[0]['text']
+    assert len(text) <= 4000
+    assert text.startswith('<!channel> Error: RuntimeError\n')
+    assert 'RuntimeError: Test Error' in text
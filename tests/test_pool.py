@@ -0,0 +1,31 @@
+import json
+
+from monitor.pool import ConnectionPool
+
+
+def post(pool, url, payload):
+    return pool.request(
+        'POST',
+        f'{url}/services/hook',
+        body=json.dumps(payload).encode('ascii'),
+        headers={'Content-Type': 'application/json'}
+    )
+
+
+def test_connection_is_reused(webhook_server, webhook_url):
+    pool = ConnectionPool()
+    for i in range(3):
+        status, _, body = post(pool, webhook_url, {'text': i})
+        assert (status, body) == (200, b'ok')
+    assert webhook_server.requests == [{'text': 0}, {'text': 1}, {'text': 2}]
+    assert (pool.stats.created, pool.stats.reused, pool.stats.reconnects) == (1, 2, 0)
+
+
+def test_stale_connection_is_replaced(webhook_server, webhook_url):
+    webhook_server.drop_connections = True
+    pool = ConnectionPool()
+    for i in range(3):
+        status, _, _ = post(pool, webhook_url, {'text': i})
+        assert status == 200
+    assert len(webhook_server.requests) == 3
+    assert pool.stats.reconnects == 2
@@ -0,0 +1,123 @@
+import json
+from dataclasses import dataclass
+from dataclasses import field
+
+import pytest
+
+from monitor.aws import get_client
+from monitor.messages import ErrorMessage
+from monitor.messages import SimpleMessage
+from monitor.publish import BatchMonitor
+from monitor.publish import EventBridgeMonitor
+from monitor.publish import Failure
+from monitor.publish import max_batch_bytes
+from monitor.publish import pack
+from monitor.publish import SQSMonitor
+
+
+@dataclass
+class FlakyPublisher(BatchMonitor):
+    """
+    Fails the listed entries of the first batches it sends; codes starting with 'Throttling' are retryable.
+    """
+    failures: list[dict[str, str]] = field(default_factory=list)
+    batches: list[list[str]] = field(default_factory=list)
+
+    def entry(self, message):
+        return {'Body': message.as_json}
+
+    def entry_size(self, entry):
+        return len(entry['Body'].encode())
+
+    def send_batch(self, entries):
+        self.batches.append([json.loads(entry['Body'])['text'] for entry in entries])
+        failing = self.failures.pop(0) if self.failures else {}
+        return [
+            Failure(index, failing[text], failing[text].startswith('Throttling'))
+            for index, text in enumerate(self.batches[-1]) if text in failing
+        ]
+
+
+@pytest.fixture
+def queue_url(aws):
+    return get_client('sqs', region_name='eu-central-1').create_queue(QueueName='monitor-events')['QueueUrl']
+
+
+def test_pack_respects_count_and_size():
+    assert list(pack(range(25), lambda _: 1)) == [list(range(10)), list(range(10, 20)), list(range(20, 25))]
+    sizes = [100, 100, 60, 200, 50]
+    assert list(pack(sizes, lambda size: size, max_bytes=256)) == [[100, 100], [60], [200, 50]]
+    assert list(pack([], lambda _: 1)) == []
+
+
+def test_batch_monitor_retries_failed_entries_only():
+    monitor = FlakyPublisher(
+        failures=[{'b': 'ThrottlingException', 'c': 'ValidationError'}, {'b': 'ThrottlingException'}],
+        sleep=lambda _: None
+    )
+    failed = monitor.publish([SimpleMessage(text) for text in 'abcd'])
+    assert [message.text for message in failed] == ['c']
+    assert monitor.batches == [['a', 'b', 'c', 'd'], ['b'], ['b']]
+
+
+def test_batch_monitor_gives_up_after_attempts():
+    monitor = FlakyPublisher(failures=[{'a': 'ThrottlingException'}] * 10, sleep=lambda _: None)
+    assert [message.text for message in monitor.publish([SimpleMessage('a')])] == ['a']
+    assert len(monitor.batches) == monitor.retry.attempts
+    assert monitor.notify(SimpleMessage('b'))
+
+
+def test_batch_monitor_rejects_oversized_messages():
+    monitor = FlakyPublisher()
+    failed = monitor.publish([SimpleMessage('x' * max_batch_bytes), SimpleMessage('a')])
+    assert len(failed) == 1
+    assert monitor.batches == [['a']]
+
+
+def test_batch_monitor_buffers_until_flush():
+    monitor = FlakyPublisher(buffer_size=3)
+    assert monitor.notify(SimpleMessage('a'))
+    assert monitor.notify(SimpleMessage('b'))
+    assert monitor.batches == []
+    assert monitor.notify(SimpleMessage('c'))
+    assert monitor.notify(SimpleMessage('d'))
+    assert monitor.flush() == []
+    assert monitor.batches == [['a', 'b', 'c'], ['d']]
+    assert monitor.flush() == []
+
+
+def test_sqs_monitor(queue_url):
+    monitor = SQSMonitor(queue_url, region_name='eu-central-1')
+    messages = [ErrorMessage('Test Error', f'error {i}') for i in range(25)]
+    assert monitor.publish(messages) == []
+    assert monitor.notify(SimpleMessage('info'))
+    client = get_client('sqs', region_name='eu-central-1')
+    received = []
+    while response := client.receive_message(
+            QueueUrl=queue_url, MaxNumberOfMessages=10, MessageAttributeNames=['All']
+    ).get('Messages'):
+        received.extend(response)
+    assert len(received) == 26
+    assert {message['MessageAttributes']['type']['StringValue'] for message in received} == {
+        'ErrorMessage', 'SimpleMessage'
+    }
+    assert {json.loads(message['Body'])['text'] for message in received} >= {'error 0', 'error 24', 'info'}
+
+
+def test_event_bridge_monitor(queue_url):
+    client = get_client('events', region_name='eu-central-1')
+    client.create_event_bus(Name='monitor')
+    client.put_rule(Name='errors', EventBusName='monitor', EventPattern=json.dumps({'source': ['monitor']}))
+    queue_arn = get_client('sqs', region_name='eu-central-1').get_queue_attributes(
+        QueueUrl=queue_url, AttributeNames=['QueueArn']
+    )['Attributes']['QueueArn']
+    client.put_targets(Rule='errors', EventBusName='monitor', Targets=[{'Id': 'queue', 'Arn': queue_arn}])
+
+    monitor = EventBridgeMonitor(event_bus_name='monitor', region_name='eu-central-1')
+    assert monitor.publish([ErrorMessage('Test Error', f'error {i}') for i in range(12)]) == []
+    response = get_client('sqs', region_name='eu-central-1').receive_message(
+        QueueUrl=queue_url, MaxNumberOfMessages=10
+    )
+    event = json.loads(response['Messages'][0]['Body'])
+    assert event['detail-type'] == 'ErrorMessage'
+    assert event['detail']['name'] == 'Test Error'
@@ -0,0 +1,134 @@
+import pytest
+
+from monitor.monitors import SlackChannel
+from monitor.resilience import CircuitBreaker
+from monitor.resilience import CircuitOpenError
+from monitor.resilience import current_deadline
+from monitor.resilience import Deadline
+from monitor.resilience import DeadlineExceeded
+from monitor.resilience import fit_timeout
+from monitor.resilience import Resilience
+from monitor.resilience import RetryableError
+from monitor.resilience import RetryPolicy
+from monitor.resilience import TokenBucket
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def flaky(failures: int, retry_after: float | None = None):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise RetryableError('unavailable', retry_after=retry_after)
+        return len(calls)
+
+    return func
+
+
+def test_retry_honors_retry_after():
+    clock = Clock()
+    resilience = Resilience(retry=RetryPolicy(attempts=3), sleep=clock.sleep)
+    assert resilience.call(flaky(failures=2, retry_after=1.5)) == 3
+    assert clock.now == 3.0
+
+
+def test_retry_raises_original_cause():
+    def func():
+        try:
+            raise TimeoutError('timed out')
+        except TimeoutError as e:
+            raise RetryableError('retry') from e
+
+    resilience = Resilience(retry=RetryPolicy(attempts=2, base_delay=0), sleep=lambda _: None)
+    with pytest.raises(TimeoutError):
+        resilience.call(func)
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(base_delay=1, max_delay=4)
+    assert all(0 <= policy.delay(attempt) <= 4 for attempt in range(10))
+    policy = RetryPolicy(base_delay=1, max_delay=15, min_delay=1)
+    assert all(1 <= policy.delay(attempt) <= 15 for attempt in range(10) for _ in range(20))
+
+
+def test_token_bucket():
+    clock = Clock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+    clock.now = 10
+    assert bucket.reserve() == 0
+
+
+def test_circuit_breaker_fails_fast():
+    clock = Clock()
+    resilience = Resilience(
+        retry=RetryPolicy(attempts=1),
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    )
+    for _ in range(2):
+        with pytest.raises(RetryableError):
+            resilience.call(flaky(failures=1))
+    with pytest.raises(CircuitOpenError):
+        resilience.call(flaky(failures=0))
+    clock.now = 30
+    assert resilience.call(flaky(failures=0)) == 1
+    assert not resilience.breaker.is_open
+
+
+def test_slack_channel_retries_rate_limited(webhook_server, webhook_url):
+    webhook_server.statuses = [429, 503]
+    channel = SlackChannel('test-retry', 'T000/B000/XXXX', base_url=f'{webhook_url}/services')
+    assert channel.send('Test Message')
+    assert len(webhook_server.requests) == 3
+
+
+class FakeContext:
+
+    def __init__(self, clock: Clock, timeout: float):
+        self.clock = clock
+        self.timeout_at = clock() + timeout
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int((self.timeout_at - self.clock()) * 1000)
+
+
+def test_deadline_from_context():
+    clock = Clock()
+    deadline = Deadline.from_context(FakeContext(clock, timeout=10), margin=1.5, clock=clock)
+    assert deadline.remaining() == 8.5
+    clock.sleep(8)
+    assert not deadline.expired
+    clock.sleep(0.5)
+    assert deadline.expired
+    assert Deadline.from_context(object(), margin=1) is None
+
+
+def test_retries_stop_at_deadline():
+    clock = Clock()
+    resilience = Resilience(retry=RetryPolicy(attempts=5), sleep=clock.sleep)
+    token = current_deadline.set(Deadline.from_context(FakeContext(clock, timeout=4), margin=1, clock=clock))
+    try:
+        assert fit_timeout(5) == 3
+        assert resilience.call(flaky(failures=1, retry_after=1)) == 2
+        with pytest.raises(DeadlineExceeded) as error:
+            resilience.call(flaky(failures=3, retry_after=1))
+        assert isinstance(error.value.__cause__, RetryableError)
+        assert clock.now == 2
+        clock.sleep(1)
+        with pytest.raises(DeadlineExceeded):
+            fit_timeout(5)
+    finally:
+        current_deadline.reset(token)
+    assert fit_timeout(5) == 5
@@ -0,0 +1,85 @@
+import itertools
+
+from conftest import lambda_error
+from monitor.messages import ErrorMessage
+from monitor.messages import SimpleMessage
+from monitor.messages import StepFunctionFailureMessage
+from monitor.monitors import EmailMonitor
+from monitor.monitors import SlackChannel
+from monitor.monitors import SlackChannelSet
+from monitor.monitors import SlackMonitor
+from monitor.routing import Route
+from monitor.routing import Router
+from monitor.routing import Rule
+
+
+def step_function_failure(state_machine: str) -> StepFunctionFailureMessage:
+    return StepFunctionFailureMessage(
+        name='States.TaskFailed',
+        text='{}',
+        input='{}',
+        execution_arn='',
+        state_machine_arn=f'arn:aws:states:eu-central-1:123456789012:stateMachine:{state_machine}',
+        start_date=0,
+        stop_date=0
+    )
+
+
+router = Router.from_table([
+    {'sink': 'drop', 'error_name': 'DbtTestError', 'env': 'dev'},
+    {'sink': 'info', 'severity': 'warning', 'error_name': 'DbtTestError'},
+    {'sink': 'alert', 'severity': 'critical', 'function_name': 'ExtractLoad*'},
+    {'sink': 'alert', 'severity': 'error', 'state_machine': '*:stateMachine:ExtractLoad-*'},
+    {'sink': 'alert', 'severity': 'error', 'kind': 'error'},
+    {'sink': 'info', 'sample_rate': 0.25},
+])
+
+
+def test_first_matching_rule_wins():
+    assert router.route(lambda_error('DbtTestError', 'TransformFunction-dev'), 'dev') is None
+    assert router.route(lambda_error('DbtTestError', 'TransformFunction-prod'), 'prod') == Route('info', 'warning')
+    assert router.route(lambda_error('KeyError', 'ExtractLoadFunction-prod'), 'prod') == Route('alert', 'critical')
+    assert router.route(step_function_failure('ExtractLoad-prod'), 'prod') == Route('alert', 'error')
+    assert router.route(ErrorMessage('KeyError', 'Test Message'), 'prod') == Route('alert', 'error')
+    assert Router([Rule(sink='alert', kind='error')]).route(SimpleMessage('info'), 'prod') is None
+
+
+def test_sampling():
+    samples = itertools.cycle([0.1, 0.4, 0.6, 0.9])
+    sampled = Router(router.rules, sample=lambda: next(samples))
+    routes = [sampled.route(SimpleMessage('info'), 'prod') for _ in range(8)]
+    assert routes == [Route('info', 'info'), None, None, None] * 2
+
+
+def test_slack_monitor_routes_at_call_time(webhook_server, webhook_url, monkeypatch):
+    def channel_set(env: str) -> SlackChannelSet:
+        return SlackChannelSet(
+            info=SlackChannel(f'{env}-info', 'info', base_url=f'{webhook_url}/{env}'),
+            alert=SlackChannel(f'{env}-alert', 'alert', base_url=f'{webhook_url}/{env}')
+        )
+
+    monitor = SlackMonitor(channel_set('prod'), channel_set('dev'), router=router)
+    monkeypatch.setenv('APP_ENV', 'dev')
+    assert monitor.notify(lambda_error('DbtTestError', 'TransformFunction-dev')) is None
+    assert monitor.notify(ErrorMessage('KeyError', 'Test Message'))
+    monkeypatch.setenv('APP_ENV', 'prod')
+    assert monitor.notify(lambda_error('DbtTestError', 'TransformFunction-prod'))
+    assert [
+        (path, request['text'].split('\n')[0]) for path, request in zip(webhook_server.paths, webhook_server.requests)
+    ] == [
+        ('/dev/alert', '<!channel> Error: KeyError'),
+        ('/prod/info', 'Error: DbtTestError'),
+    ]
+
+
+def test_monitors_share_a_router(webhook_server, webhook_url, monkeypatch):
+    monkeypatch.setenv('APP_ENV', 'dev')
+    shared = Router([Rule(sink='email', error_name='Dbt*'), Rule(sink='alert', severity='error', kind='error')])
+    channel = SlackChannel('dev-alert', 'alert', base_url=webhook_url)
+    slack = SlackMonitor(None, SlackChannelSet(info=channel, alert=channel), router=shared)
+    email = EmailMonitor('monitor@example.com', [], router=shared)
+    # routed to the other monitor's sink: neither raises nor sends
+    assert slack.notify(lambda_error('DbtTestError', 'TransformFunction-dev')) is None
+    assert email.notify(ErrorMessage('KeyError', 'Test Message')) is None
+    assert slack.notify(ErrorMessage('KeyError', 'Test Message'))
+    assert [request['text'].split('\n')[0] for request in webhook_server.requests] == ['<!channel> Error: KeyError']
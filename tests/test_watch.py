@@ -0,0 +1,104 @@
+import datetime
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import RecordingMonitor
+from monitor.messages import StepFunctionFailureMessage
+from monitor.monitors import BaseMonitor
+from monitor.watch import bounded_map
+from monitor.watch import load_monitor
+from monitor.watch import watch
+
+state_machine_arn = 'arn:aws:states:eu-central-1:123456789012:stateMachine:Transform-dev'
+
+
+class FakeStepFunctions:
+    """
+    list_executions pages (newest first, two per page) and describe_execution for failed executions.
+    """
+
+    def __init__(self):
+        self.executions: list[dict] = []
+        self.described: list[str] = []
+
+    def fail(self, minutes_ago: float, cause: str) -> str:
+        stop_date = datetime.datetime.now(datetime.UTC) - datetime.timedelta(minutes=minutes_ago)
+        arn = f'{state_machine_arn.replace("stateMachine", "execution")}:{len(self.executions)}'
+        self.executions.insert(0, {
+            'executionArn': arn,
+            'stateMachineArn': state_machine_arn,
+            'status': 'FAILED',
+            'startDate': stop_date - datetime.timedelta(seconds=30),
+            'stopDate': stop_date,
+            'error': 'States.TaskFailed',
+            'cause': cause,
+            'input': '{"args": ["x-error"]}',
+        })
+        self.executions.sort(key=lambda execution: execution['startDate'], reverse=True)
+        return arn
+
+    def get_paginator(self, name):
+        assert name == 'list_executions'
+        return self
+
+    def paginate(self, stateMachineArn, statusFilter):
+        assert (stateMachineArn, statusFilter) == (state_machine_arn, 'FAILED')
+        summaries = [
+            {key: execution[key] for key in ('executionArn', 'stateMachineArn', 'status', 'startDate', 'stopDate')}
+            for execution in self.executions
+        ]
+        for i in range(0, len(summaries), 2):
+            yield {'executions': summaries[i:i + 2]}
+
+    def describe_execution(self, executionArn):
+        self.described.append(executionArn)
+        return next(execution for execution in self.executions if execution['executionArn'] == executionArn)
+
+
+def test_watch_is_incremental(tmp_path):
+    client = FakeStepFunctions()
+    client.fail(60 * 48, 'too old')
+    first = client.fail(30, 'first')
+    second = client.fail(10, 'second')
+    monitor = RecordingMonitor()
+    checkpoint = str(tmp_path / 'checkpoint.json')
+
+    assert watch([state_machine_arn], monitor, checkpoint, client=client) == 2
+    assert all(isinstance(message, StepFunctionFailureMessage) for message in monitor.messages)
+    assert [message.text for message in monitor.messages] == ['second', 'first']
+    assert sorted(client.described) == sorted([first, second])
+
+    client.described.clear()
+    assert watch([state_machine_arn], monitor, checkpoint, client=client) == 0
+    third = client.fail(1, 'third')
+    assert watch([state_machine_arn], monitor, checkpoint, client=client) == 1
+    assert client.described == [third]
+    with open(checkpoint) as file:
+        assert json.load(file)[state_machine_arn]['execution_arns'] == [third]
+
+
+def test_bounded_map_limits_in_flight_calls():
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def work(item):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+        return item * 2
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(bounded_map(executor, work, iter(range(20)), limit=3)) == [i * 2 for i in range(20)]
+    assert peak <= 3
+
+
+def test_load_monitor():
+    assert type(load_monitor('monitor.monitors:BaseMonitor')) is BaseMonitor
+    assert load_monitor('monitor.monitors:dev_channel_set') is not None
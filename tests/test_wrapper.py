@@ -1,9 +1,21 @@
+import asyncio
 import json
+import logging
 import os
+import socket
+import time
+import tracemalloc
+from dataclasses import replace
 
 import pytest
 
+from monitor.dispatch import dispatcher
+from monitor.messages import SimpleMessage
 from monitor.monitors import BaseMonitor
+from monitor.monitors import Outbox
+from monitor.monitors import SlackChannel
+from monitor.monitors import SlackChannelSet
+from monitor.monitors import SlackMonitor
 from monitor.wrapper import lambda_monitor
 from monitor.wrapper import LambdaErrorMessage
 from monitor.wrapper import LambdaException
@@ -19,32 +31,6 @@ def test_get_cloudwatch_link():
     assert link == 'https://eu-central-1.console.aws.amazon.com/cloudwatch/home?region=eu-central-1#logsV2:log-groups/log-group/%2Faws%2Flambda%2FExtractLoadFunction-dev/log-events/2024%2F10%2F31%2F%5B%24LATEST%5D1ef30f6c48d24e3287ee2b41908216b2?filterPattern=%2224dfa092-ca3b-400c-954d-7ce9cfbf4bc3%22'
 
 
-@pytest.fixture
-def aws_lambda_vars():
-    vars_map = {
-        'AWS_EXECUTION_ENV': 'python3.12',
-        'AWS_DEFAULT_REGION': 'eu-central-1',
-        'AWS_LAMBDA_FUNCTION_NAME': 'TestFunction-dev',
-        'AWS_LAMBDA_FUNCTION_VERSION': '$LATEST',
-        'AWS_LAMBDA_FUNCTION_MEMORY_SIZE': '128',
-        'AWS_LAMBDA_LOG_GROUP_NAME': '/aws/lambda/TestFunction-dev',
-        'AWS_LAMBDA_LOG_STREAM_NAME': '2024/10/31/[$LATEST]1ef30f6c48d24e3287ee2b41908216b2',
-    }
-    for key, value in vars_map.items():
-        os.environ[key] = value
-    yield
-    for key in vars_map:
-        del os.environ[key]
-
-
-@pytest.fixture
-def context():
-    class Context:
-        aws_request_id = '24dfa092-ca3b-400c-954d-7ce9cfbf4bc3'
-
-    return Context()
-
-
 def test_lambda_error_handler(aws_lambda_vars, context):
     os.environ['FAIL_ON_ERROR'] = 'true'
 
@@ -60,7 +46,7 @@ def test_lambda_error_handler(aws_lambda_vars, context):
 
     error_dict = json.loads(error.__str__())
     error_message = LambdaErrorMessage.from_dict(error_dict)
-    error_message.traceback = error_message.traceback.split('\n')[0]
+    error_message = replace(error_message, traceback=error_message.traceback.split('\n')[0])
     expected = LambdaErrorMessage(
         name='RuntimeError',
         text='Event:\n{\n  "args": "test"\n}\nTest Error',
@@ -93,3 +79,295 @@ def test_notify_hook(capsys, context):
     my_lambda_handler({}, context)
     captured = capsys.readouterr()
     assert captured.out == '1\n'
+
+
+class SlowMonitor(BaseMonitor):
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.messages = []
+
+    def notify(self, message):
+        time.sleep(self.delay)
+        self.messages.append(message)
+
+
+def test_background_notify_is_flushed_before_return(context):
+    monitor = SlowMonitor(delay=0.05)
+
+    @lambda_monitor(
+        monitor=monitor,
+        notify_hook=lambda result: str(result['counter']),
+        background=True
+    )
+    def my_lambda_handler(_, __):
+        return {'counter': 1}
+
+    my_lambda_handler({}, context)
+    assert [message.text for message in monitor.messages] == ['1']
+
+
+def test_background_flush_is_bounded(aws_lambda_vars, context, monkeypatch):
+    monkeypatch.setenv('FAIL_ON_ERROR', 'false')
+    monitor = SlowMonitor(delay=0.5)
+
+    @lambda_monitor(
+        monitor=monitor,
+        background=True,
+        flush_timeout=0.05
+    )
+    def my_lambda_handler(_, __):
+        raise RuntimeError('Test Error')
+
+    start = time.perf_counter()
+    response = my_lambda_handler({}, context)
+    assert time.perf_counter() - start < 0.4
+    assert response['statusCode'] == 500
+    assert dispatcher.flush(timeout=2)
+    assert monitor.messages[0].name == 'RuntimeError'
+
+
+def test_profile_is_attached(aws_lambda_vars, context, monkeypatch):
+    monkeypatch.setenv('FAIL_ON_ERROR', 'false')
+
+    @lambda_monitor(
+        monitor=SlowMonitor(delay=0),
+        profile=True,
+        trace_allocations=True
+    )
+    def my_lambda_handler(_, __):
+        data = [bytearray(1024) for _ in range(1000)]
+        raise MemoryError(f'{len(data)} buffers allocated')
+
+    response = my_lambda_handler({}, context)
+    profile = response['message']['profile']
+    assert set(profile) >= {'wall_time_ms', 'cpu_time_ms', 'gc_collections', 'cold_start', 'peak_rss_mb'}
+    assert profile['tracemalloc_peak_mb'] >= 1
+    assert len(profile['top_allocations']) == 5
+    assert not tracemalloc.is_tracing()
+    message = LambdaErrorMessage.from_dict(response['message'])
+    assert 'Profile:\n{\n  "wall_time_ms"' in message.as_str
+
+
+def test_async_handler(aws_lambda_vars, context, monkeypatch):
+    monkeypatch.setenv('FAIL_ON_ERROR', 'false')
+    monitor = SlowMonitor(delay=0)
+
+    @lambda_monitor(
+        monitor=monitor,
+        notify_hook=lambda result: str(result['counter'])
+    )
+    async def my_lambda_handler(event, _):
+        await asyncio.sleep(0)
+        if event.get('fail'):
+            raise RuntimeError('Test Error')
+        return {'counter': 1}
+
+    assert asyncio.run(my_lambda_handler({}, context)) == {'counter': 1}
+    response = asyncio.run(my_lambda_handler({'fail': True}, context))
+    assert response['statusCode'] == 500
+    assert [message.as_str.split('\n')[0] for message in monitor.messages] == ['1', 'Error: RuntimeError']
+
+
+def test_async_background_notify_overlaps(context):
+    class AsyncMonitor(BaseMonitor):
+        messages: list = []
+
+        async def anotify(self, message):
+            await asyncio.sleep(0.1)
+            self.messages.append(message)
+
+    @lambda_monitor(
+        monitor=AsyncMonitor(),
+        notify_hook=lambda result: result['text'],
+        background=True
+    )
+    async def my_lambda_handler(event, _):
+        return {'text': event['table']}
+
+    async def main():
+        return await asyncio.gather(*(my_lambda_handler({'table': f'table_{i}'}, context) for i in range(5)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    assert time.perf_counter() - start < 0.3
+    assert sorted(message.text for message in AsyncMonitor.messages) == [f'table_{i}' for i in range(5)]
+
+
+class FlakyMonitor(SlowMonitor):
+
+    def __init__(self, delay: float = 0):
+        super().__init__(delay)
+        self.down = True
+
+    def notify(self, message):
+        if self.down:
+            raise RuntimeError('sink down')
+        super().notify(message)
+
+
+def test_failed_notification_is_replayed(aws_lambda_vars, context, monkeypatch, tmp_path):
+    monkeypatch.setenv('FAIL_ON_ERROR', 'false')
+    monitor = FlakyMonitor()
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'))
+
+    @lambda_monitor(
+        monitor=monitor,
+        notify_hook=lambda result: str(result['counter']),
+        outbox=outbox
+    )
+    def my_lambda_handler(event, _):
+        if event.get('fail'):
+            raise RuntimeError('Test Error')
+        # spooled messages are not replayed before the handler
+        assert monitor.messages == []
+        return {'counter': event['counter']}
+
+    assert my_lambda_handler({'fail': True}, context)['statusCode'] == 500
+    assert outbox.pending == 1
+    monitor.down = False
+    my_lambda_handler({'counter': 2}, context)
+    assert [message.as_str.split('\n')[0] for message in monitor.messages] == ['2', 'Error: RuntimeError']
+    assert outbox.pending == 0
+
+
+def test_replay_is_bounded_by_flush_timeout(context, tmp_path):
+    monitor = SlowMonitor(delay=0.1)
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'))
+    for i in range(5):
+        outbox.spool(SimpleMessage(f'spooled {i}'))
+
+    @lambda_monitor(monitor=monitor, flush_timeout=0.15, outbox=outbox)
+    def my_lambda_handler(_, __):
+        return {}
+
+    start = time.perf_counter()
+    my_lambda_handler({}, context)
+    assert time.perf_counter() - start < 0.4
+    assert [message.text for message in monitor.messages] == ['spooled 0', 'spooled 1']
+    assert [message.text for _, message in outbox.take()] == [f'spooled {i}' for i in range(2, 5)]
+
+
+def test_pending_background_notification_is_spooled(context, tmp_path):
+    monitor = SlowMonitor(delay=0.3)
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'))
+
+    @lambda_monitor(
+        monitor=monitor,
+        notify_hook=lambda result: result['text'],
+        background=True,
+        flush_timeout=0.05,
+        outbox=outbox
+    )
+    def my_lambda_handler(event, _):
+        return {'text': event['text']}
+
+    my_lambda_handler({'text': 'first'}, context)
+    my_lambda_handler({'text': 'second'}, context)
+    assert dispatcher.flush(timeout=2)
+    assert [message.text for message in monitor.messages] == ['first']
+    assert outbox.pending == 1
+
+    monitor.delay = 0
+    my_lambda_handler({'text': 'third'}, context)
+    assert sorted(message.text for message in monitor.messages) == ['first', 'second', 'third']
+    assert outbox.pending == 0
+
+
+class DeadlineContext:
+    """
+    Lambda context whose invocation times out timeout seconds after it was created.
+    """
+    aws_request_id = '24dfa092-ca3b-400c-954d-7ce9cfbf4bc3'
+
+    def __init__(self, timeout: float):
+        self.timeout_at = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int((self.timeout_at - time.monotonic()) * 1000)
+
+
+@pytest.fixture
+def unresponsive_url():
+    """
+    Endpoint that accepts connections but never answers.
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)
+    host, port = server.getsockname()
+    yield f'http://{host}:{port}'
+    server.close()
+
+
+def test_notification_budget_is_exhausted(tmp_path):
+    monitor = SlowMonitor(delay=0)
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'))
+
+    @lambda_monitor(
+        monitor=monitor,
+        notify_hook=lambda result: result['text'],
+        outbox=outbox,
+        deadline_margin=1.0
+    )
+    def my_lambda_handler(event, _):
+        return {'text': event['text']}
+
+    my_lambda_handler({'text': 'late'}, DeadlineContext(timeout=0.5))
+    assert monitor.messages == []
+    assert [message.text for _, message in outbox.take()] == ['late']
+    my_lambda_handler({'text': 'in time'}, DeadlineContext(timeout=5))
+    assert [message.text for message in monitor.messages] == ['in time']
+
+
+def test_slack_timeout_fits_deadline(unresponsive_url, tmp_path):
+    channel = SlackChannel('test-deadline', 'T000/B000/XXXX', base_url=f'{unresponsive_url}/services')
+    outbox = Outbox(path=str(tmp_path / 'outbox.jsonl'))
+
+    @lambda_monitor(
+        monitor=SlackMonitor(prod_channels=None, dev_channels=SlackChannelSet(info=channel, alert=channel)),
+        notify_hook=lambda result: result['text'],
+        outbox=outbox,
+        deadline_margin=1.0
+    )
+    def my_lambda_handler(event, _):
+        return {'text': event['text']}
+
+    start = time.perf_counter()
+    my_lambda_handler({'text': 'Test Message'}, DeadlineContext(timeout=1.3))
+    assert time.perf_counter() - start < 1.0
+    assert [message.text for _, message in outbox.take()] == ['Test Message']
+
+
+def test_undelivered_message_is_logged_without_outbox(unresponsive_url, caplog):
+    channel = SlackChannel('test-deadline-log', 'T000/B000/XXXX', base_url=f'{unresponsive_url}/services')
+
+    @lambda_monitor(
+        monitor=SlackMonitor(prod_channels=None, dev_channels=SlackChannelSet(info=channel, alert=channel)),
+        notify_hook=lambda result: result['text'],
+        deadline_margin=1.0
+    )
+    def my_lambda_handler(event, _):
+        return {'text': event['text']}
+
+    with caplog.at_level(logging.INFO):
+        my_lambda_handler({'text': 'Test Message'}, DeadlineContext(timeout=1.3))
+    errors = [record.getMessage() for record in caplog.records if record.levelno >= logging.ERROR]
+    assert len(errors) == 1
+    assert errors[0].endswith('SimpleMessage only logged:\nTest Message')
+
+
+def test_undelivered_background_message_is_logged_without_outbox(context, caplog):
+    class RejectingMonitor(BaseMonitor):
+
+        def notify(self, message):
+            return False
+
+    @lambda_monitor(monitor=RejectingMonitor(), notify_hook=lambda result: result['text'], background=True)
+    def my_lambda_handler(event, _):
+        return {'text': event['text']}
+
+    with caplog.at_level(logging.INFO):
+        my_lambda_handler({'text': 'Test Message'}, context)
+    errors = [record.getMessage() for record in caplog.records if record.levelno >= logging.ERROR]
+    assert errors == ['Notification failed, SimpleMessage only logged:\nTest Message']